@@ -0,0 +1,63 @@
+"""
+Microbenchmark jalur cache hit handler chip.
+
+Membandingkan:
+- lama: json.loads(str dari Redis) -> pasang session -> jsonable_encoder -> json.dumps
+        (setara dengan yang dilakukan FastAPI untuk return dict)
+- baru: bytes dari Redis -> replace placeholder session -> Response
+
+Jalankan dari folder backend-android:
+    python benchmarks/bench_cache_hit.py
+"""
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder
+from chatbot.utils.response_cache import attach_session, strip_session, dump_cacheable, render_cached
+
+SESSION = "projects/learnable-abc/agent/sessions/3f0c2d9e-8d7b-4a61-9a2e-5b1c7e4f9a10"
+N = 20000
+
+def build_payload(n_chips: int) -> dict:
+    chips = [{"text": f"Sub-bab {i}: Operasi Hitung Pecahan Campuran"} for i in range(n_chips)]
+    return {
+        "fulfillmentMessages": [
+            {"text": {"text": ["Berikut sub-bab dari Pecahan:"]}},
+            {"payload": {"richContent": [[{"type": "chips", "options": chips}]]}}
+        ],
+        "outputContexts": [{
+            "name": f"{SESSION}/contexts/pilihsubbab-followup",
+            "lifespanCount": 5,
+            "parameters": {
+                "school_level": "sd",
+                "subject_name": "Matematika",
+                "lesson_name": "Pecahan"
+            }
+        }]
+    }
+
+def old_hit(cached: str) -> bytes:
+    payload = attach_session(json.loads(cached), SESSION)
+    content = jsonable_encoder(payload)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def new_hit(cached: bytes) -> bytes:
+    return render_cached(cached, SESSION).body
+
+def main():
+    for n_chips in (5, 20, 60):
+        response = build_payload(n_chips)
+        old_cached = json.dumps(strip_session(response))
+        new_cached = dump_cacheable(response)
+        assert json.loads(old_hit(old_cached)) == json.loads(new_hit(new_cached))
+
+        old_t = timeit.timeit(lambda: old_hit(old_cached), number=N)
+        new_t = timeit.timeit(lambda: new_hit(new_cached), number=N)
+        print(f"{n_chips:>3} chips | lama {old_t / N * 1e6:8.2f} µs/hit | baru {new_t / N * 1e6:8.2f} µs/hit | {old_t / new_t:5.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Microbenchmark pembuatan email (compose + serialisasi) per email.
+
+Membandingkan:
+- lama: Environment Jinja baru per email (template dibaca & di-compile ulang),
+        logo dibaca dari disk dan di-encode base64 ke MIMEImage baru
+- baru: template hasil compile saat import + part MIME logo yang dibuat sekali
+
+Jalankan dari folder backend-android:
+    python benchmarks/bench_email_compose.py
+"""
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from email import message_from_string
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from send_email.send_email import LOGO_PATH, TEMPLATES_DIR, _compose_message_with_logo
+
+N = 500
+CTX = {
+    "user_name": "Budi Santoso",
+    "user_email": "budi@example.com",
+    "user_role": "Orang Tua",
+}
+
+def old_compose(template: str) -> str:
+    # Sama seperti kode lama sebelum precompile
+    msg_root = MIMEMultipart("related")
+    msg_root["From"] = "LearnAble <noreply@learnable.com>"
+    msg_root["To"] = CTX["user_email"]
+    msg_root["Subject"] = "Selamat Datang di LearnAble"
+    msg_root["Date"] = formatdate(localtime=True)
+    msg_root["Message-ID"] = make_msgid(domain="learnable.com")
+    alt = MIMEMultipart("alternative")
+    alt.attach(MIMEText("Halo!", "plain", "utf-8"))
+    env = Environment(loader=FileSystemLoader(TEMPLATES_DIR), autoescape=select_autoescape(["html", "xml"]))
+    html_body = env.get_template(template).render(**CTX, logo_cid="cid:logo")
+    alt.attach(MIMEText(html_body, "html", "utf-8"))
+    msg_root.attach(alt)
+    img = MIMEImage(LOGO_PATH.read_bytes(), _subtype="png")
+    img.add_header("Content-ID", "<logo>")
+    img.add_header("Content-Disposition", "inline", filename="logo-learnable.png")
+    msg_root.attach(img)
+    return msg_root.as_string()
+
+def new_compose(template: str) -> str:
+    msg = _compose_message_with_logo(
+        from_name="LearnAble",
+        from_email="noreply@learnable.com",
+        to_email=CTX["user_email"],
+        subject="Selamat Datang di LearnAble",
+        html_template=template,
+        html_ctx=CTX,
+        plain_fallback="Halo!",
+    )
+    return msg.as_string()
+
+def _parts(raw: str) -> list:
+    return [part.get_payload() for part in message_from_string(raw).walk() if not part.is_multipart()]
+
+def main():
+    print(f"Logo: {LOGO_PATH.stat().st_size / 1024:.1f} KiB, {N} email per template\n")
+    for template in ("registration_notification.html", "approve_notification.html", "unapprove_notification.html"):
+        # Isi setiap part harus sama; hanya header per email (Date, Message-ID, boundary) yang berbeda
+        assert _parts(old_compose(template)) == _parts(new_compose(template))
+        old = min(timeit.repeat(lambda: old_compose(template), number=N, repeat=3)) / N
+        new = min(timeit.repeat(lambda: new_compose(template), number=N, repeat=3)) / N
+        print(f"{template:<34} lama {old * 1000:7.3f} ms | baru {new * 1000:7.3f} ms | {old / new:5.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark client HTTP Gemini: client baru per panggilan vs client bersama.
+
+Menjalankan server stub HTTPS lokal (sertifikat self-signed dibuat dengan
+`openssl`) yang membalas seperti endpoint generateContent, lalu mengukur:
+- lama: `async with httpx.AsyncClient()` per panggilan (TCP + TLS handshake tiap kali)
+- baru: satu AsyncClient bersama dengan pool keep-alive (seperti gemini_service_async)
+
+Jalankan dari folder backend-android:
+    python benchmarks/bench_gemini_client.py
+"""
+import asyncio
+import json
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+N_CALLS = 200
+CONCURRENCY = 10
+STUB_RESPONSE = json.dumps({
+    "candidates": [{"content": {"parts": [{"text": "Pecahan adalah bagian dari keseluruhan."}]}}]
+}).encode()
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(STUB_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(STUB_RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+def _make_cert(tmpdir: Path):
+    cert, key = tmpdir / "cert.pem", tmpdir / "key.pem"
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+         "-keyout", str(key), "-out", str(cert)],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+def _start_server(cert: Path, key: Path) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(cert, key)
+    server.socket = ctx.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+PAYLOAD = {"contents": [{"parts": [{"text": "Jelaskan pecahan untuk siswa SD"}]}]}
+
+async def _old_call(url: str, cafile: str):
+    # Sama seperti kode lama: tiap AsyncClient membangun SSLContext sendiri lalu handshake baru
+    async with httpx.AsyncClient(verify=ssl.create_default_context(cafile=cafile)) as client:
+        response = await client.post(url, json=PAYLOAD, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+async def _new_call(client: httpx.AsyncClient, url: str):
+    response = await client.post(url, json=PAYLOAD)
+    response.raise_for_status()
+    return response.json()
+
+async def _run(label: str, make_call):
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def one():
+        async with sem:
+            started = time.perf_counter()
+            await make_call()
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = sorted(await asyncio.gather(*[one() for _ in range(N_CALLS)]))
+    total = time.perf_counter() - started
+    p50 = latencies[len(latencies) // 2] * 1000
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000
+    print(f"{label:<28} total {total:6.2f}s | p50 {p50:7.2f} ms | p95 {p95:7.2f} ms")
+    return total
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key = _make_cert(Path(tmp))
+        server = _start_server(cert, key)
+        url = f"https://localhost:{server.server_address[1]}/v1beta/models/stub:generateContent"
+        verify = ssl.create_default_context(cafile=str(cert))
+        try:
+            old_total = await _run("client baru per panggilan", lambda: _old_call(url, str(cert)))
+            shared = httpx.AsyncClient(
+                verify=verify,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+                timeout=httpx.Timeout(connect=5, read=30, write=10, pool=5),
+            )
+            async with shared:
+                new_total = await _run("client bersama (keep-alive)", lambda: _new_call(shared, url))
+            print(f"Speedup: {old_total / new_total:.1f}x untuk {N_CALLS} panggilan, konkurensi {CONCURRENCY}")
+        finally:
+            server.shutdown()
+
+if __name__ == "__main__":
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
@@ -0,0 +1,200 @@
+"""
+Benchmark sync training phrase Dialogflow pada koleksi sub_bab sintetis 50k dokumen.
+
+Firestore dan Dialogflow diganti fixture in-memory (tanpa jaringan), jadi yang
+diukur adalah kerja di sisi aplikasi dan jumlah panggilan/byte yang dikirim:
+- lama: `.limit(1000).stream()`, `doc.to_dict()` dua kali per dokumen, satu
+        update_intent berisi seluruh intent
+- baru: `iter_collection_values` (halaman cursor + select + dedup) lalu
+        `sync_sharded_training_phrases` (shard ≤ 2000 phrase berdasarkan hash
+        teks phrase, diff per shard)
+
+Waktu diukur dengan tracemalloc aktif, jadi angka absolutnya lebih besar dari
+run sebenarnya; yang relevan adalah perbandingan antar baris.
+
+Jalankan dari folder backend-android:
+    python benchmarks/bench_sync_dialogflow.py
+"""
+import bisect
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from google.cloud import dialogflow, firestore
+from google.oauth2 import service_account
+
+N_DOCS = 50_000
+DUPLICATE_EVERY = 10  # setiap dokumen ke-10 memakai judul yang sudah ada
+INTENT = "Pilih Teori Subbab"
+
+def build_docs(n: int) -> dict:
+    docs = {}
+    for i in range(n):
+        title = f"Sub-bab {i - 1 if i % DUPLICATE_EVERY == 0 and i else i}: Operasi Hitung Pecahan"
+        docs[f"doc{i:06d}"] = {
+            "title": title,
+            "content": "Lorem ipsum dolor sit amet " * 20,
+            "idLesson": f"lesson{i // 25}",
+            "order": i % 25,
+        }
+    return docs
+
+class FakeSnapshot:
+    def __init__(self, doc_id: str, data: dict, fields):
+        self.id = doc_id
+        self._data = {k: data[k] for k in fields if k in data} if fields else data
+        self.stats = None
+
+    def to_dict(self):
+        # Firestore membuat dict baru di setiap panggilan to_dict()
+        self.stats["to_dict"] += 1
+        return dict(self._data)
+
+class FakeQuery:
+    def __init__(self, docs: dict, stats: dict, fields=None, limit=None, after=None, ids=None):
+        self._docs, self._stats = docs, stats
+        self._ids = ids if ids is not None else sorted(docs)
+        self._fields, self._limit, self._after = fields, limit, after
+
+    def _copy(self, **changes):
+        params = dict(fields=self._fields, limit=self._limit, after=self._after, ids=self._ids)
+        params.update(changes)
+        return FakeQuery(self._docs, self._stats, **params)
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def order_by(self, field):
+        return self
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, snapshot):
+        return self._copy(after=snapshot.id)
+
+    def stream(self):
+        self._stats["queries"] += 1
+        start = bisect.bisect_right(self._ids, self._after) if self._after else 0
+        end = start + self._limit if self._limit else len(self._ids)
+        for doc_id in self._ids[start:end]:
+            snapshot = FakeSnapshot(doc_id, self._docs[doc_id], self._fields)
+            snapshot.stats = self._stats
+            self._stats["docs"] += 1
+            self._stats["bytes"] += len(json.dumps(snapshot._data))
+            yield snapshot
+
+class FakeIntentsClient:
+    def __init__(self, stats: dict):
+        self.stats = stats
+        self.intents = {INTENT: dialogflow.Intent(name="intents/0", display_name=INTENT,
+                                                  webhook_state=dialogflow.Intent.WebhookState.WEBHOOK_STATE_ENABLED)}
+
+    def list_intents(self, request=None):
+        self.stats["df_calls"] += 1
+        return list(self.intents.values())
+
+    def update_intent(self, intent, language_code=None, update_mask=None):
+        self.stats["df_calls"] += 1
+        self.stats["phrases_sent"] += len(intent.training_phrases)
+        stored = next(i for i in self.intents.values() if i.name == intent.name)
+        stored.training_phrases = intent.training_phrases
+        return stored
+
+    def create_intent(self, parent=None, intent=None, language_code=None):
+        self.stats["df_calls"] += 1
+        self.stats["phrases_sent"] += len(intent.training_phrases)
+        intent.name = f"intents/{len(self.intents)}"
+        self.intents[intent.display_name] = intent
+        return intent
+
+    def delete_intent(self, name=None):
+        self.stats["df_calls"] += 1
+
+def new_stats() -> dict:
+    return {"queries": 0, "docs": 0, "bytes": 0, "to_dict": 0, "df_calls": 0, "phrases_sent": 0}
+
+def old_sync(sd, df_client, docs, stats):
+    # Sama seperti kode lama sebelum pagination
+    subbab_docs = FakeQuery(docs, stats).limit(1000).stream()
+    subbab_phrases = [
+        doc.to_dict().get("title") for doc in subbab_docs
+        if doc.to_dict().get("title")
+    ]
+    intent = next(i for i in df_client.list_intents() if i.display_name == INTENT)
+    training_phrases = [sd._new_phrase(p) for p in subbab_phrases]
+    df_client.update_intent(intent=dialogflow.Intent(name=intent.name, training_phrases=training_phrases))
+    return len(subbab_phrases)
+
+def new_sync(sd, docs, stats, force=False):
+    sd.firestore_client.collection.side_effect = lambda name: FakeQuery(docs, stats)
+    results = sd.sync_sharded_training_phrases(INTENT, sd.iter_collection_values("sub_bab", "title"), force)
+    return results
+
+def measure(label: str, fn, stats: dict):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<27} {elapsed * 1000:8.1f} ms | peak {peak / 1024 / 1024:6.1f} MiB | "
+          f"{stats['docs']:>6} dok / {stats['queries']:>3} query | {stats['bytes'] / 1024 / 1024:6.1f} MiB dibaca | "
+          f"to_dict {stats['to_dict']:>6} | {stats['df_calls']:>2} panggilan DF | {stats['phrases_sent']:>6} phrase dikirim")
+    return result
+
+def main():
+    with mock.patch.object(service_account.Credentials, "from_service_account_file", return_value=mock.Mock()), \
+         mock.patch.object(firestore, "Client"), \
+         mock.patch.object(dialogflow, "EntityTypesClient"), \
+         mock.patch.object(dialogflow, "IntentsClient"):
+        from chatbot.utils import sync_dialogflow as sd
+
+    # Fingerprint disimpan di dict agar benchmark tidak butuh Redis
+    fingerprints = {}
+    sd.fingerprint_redis = mock.Mock(
+        hget=lambda key, field: fingerprints.get(field),
+        hset=lambda key, field, value: fingerprints.__setitem__(field, value),
+        hdel=lambda key, field: fingerprints.pop(field, None),
+    )
+
+    docs = build_docs(N_DOCS)
+    unique = len({d["title"] for d in docs.values()})
+    print(f"Fixture: {N_DOCS} dokumen sub_bab, {unique} judul unik, "
+          f"batas {sd.MAX_PHRASES_PER_INTENT} phrase/intent, halaman {sd.SYNC_PAGE_SIZE} dokumen\n")
+
+    stats = new_stats()
+    df_client = FakeIntentsClient(stats)
+    sent = measure("lama (limit 1000)", lambda: old_sync(sd, df_client, docs, stats), stats)
+    print(f"{'':<27} judul yang masuk intent: {sent} dari {unique}\n")
+
+    stats = new_stats()
+    sd.df_intent_client = FakeIntentsClient(stats)
+    results = measure("baru (run pertama)", lambda: new_sync(sd, docs, stats), stats)
+    phrases = sum(len(i.training_phrases) for i in sd.df_intent_client.intents.values())
+    print(f"{'':<27} judul yang masuk intent: {phrases} dari {unique}, {len(results)} intent shard\n")
+
+    stats = new_stats()
+    sd.df_intent_client.stats = stats
+    measure("baru (tanpa perubahan)", lambda: new_sync(sd, docs, stats), stats)
+
+    docs[f"doc{N_DOCS:06d}"] = {"title": "Sub-bab baru: Pecahan Campuran"}
+    stats = new_stats()
+    sd.df_intent_client.stats = stats
+    measure("baru (+1 dokumen di akhir)", lambda: new_sync(sd, docs, stats), stats)
+
+    # Doc id yang terurut paling depan: dengan potongan berurutan semua shard ikut bergeser
+    docs["doc-000000"] = {"title": "Sub-bab baru: Bilangan Bulat"}
+    stats = new_stats()
+    sd.df_intent_client.stats = stats
+    results = measure("baru (+1 dokumen di awal)", lambda: new_sync(sd, docs, stats), stats)
+    changed = sum(1 for result in results.values() if result != sd.SYNC_UNCHANGED)
+    print(f"{'':<27} shard yang berubah: {changed} dari {len(results)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,39 @@
-from chatbot.services.gemini_service_async import chat_with_gemini_api
+from chatbot.services.gemini_service_async import chat_with_gemini_api, GeminiError
 import hashlib
 from chatbot.services.redis_client import redis_client
-from fastapi import BackgroundTasks
+from chatbot.services.question_index import question_index
+from chatbot.utils.question_normalizer import normalize_question, NORMALIZATION_VERSION
+from chatbot.services.gemini_progress import append_partial, clear_partial, finish_progress, reset_progress
+from chatbot.services.inflight_registry import claim_generation, refresh_generation, release_generation
+from chatbot.services.gemini_queue import enqueue_generation, JOB_CUSTOM
+from chatbot.services.inline_answer import wait_inline, record_outcome, OUTCOME_CACHE_HIT, OUTCOME_INLINE, OUTCOME_DEFERRED
+from chatbot.utils.webhook_context import WebhookContext
+from os import getenv
 import logging
+import time
 
-def generate_cache_key(session: str, message: str) -> str:
-    key_string = f"{session}:{message}"
-    return hashlib.sha256(key_string.encode()).hexdigest()
+# Jawaban custom dipakai bersama lintas sesi, jadi boleh disimpan lebih lama
+CUSTOM_ANSWER_TTL = int(getenv("CUSTOM_ANSWER_TTL", str(60 * 60 * 6)))
+NEAR_DUP_MAX_CANDIDATES = 5
+
+def generate_cache_key(normalized_question: str) -> str:
+    # Tanpa session: siswa berbeda dengan pertanyaan yang sama berbagi jawaban.
+    # Versi normalisasi ikut di key, jadi jawaban dari aturan lama tidak terpakai lagi
+    return f"custom:v{NORMALIZATION_VERSION}:{hashlib.sha256(normalized_question.encode()).hexdigest()}"
+
+async def find_near_duplicate(normalized_question: str, cache_key: str):
+    """Cari jawaban untuk pertanyaan yang mirip di indeks near-duplicate lokal."""
+    candidates = question_index.query(normalized_question, exclude=cache_key)[:NEAR_DUP_MAX_CANDIDATES]
+    if not candidates:
+        return None
+    answers = await redis_client.mget([key for key, _ in candidates])
+    for (key, score), answer in zip(candidates, answers):
+        if answer:
+            logging.info(f"🧩 Pertanyaan mirip ditemukan (kemiripan {score:.2f}), key: {key}")
+            return answer
+        # Jawaban sudah expire, entri indeks tidak berguna lagi
+        question_index.remove(key)
+    return None
 
 def make_response(jawaban: str, session: str):
     logging.info("📤 Membuat respons untuk Dialogflow")
@@ -32,43 +59,52 @@ def make_response(jawaban: str, session: str):
     logging.info("📤 Mengirim respons teori subbab + chips ke user dengan context yang diperpanjang.")
     return response
 
-async def generate_and_cache_gemini_answer(prompt: str, cache_key: str):
+async def generate_and_cache_gemini_answer(prompt: str, cache_key: str, final: bool = True) -> bool:
+    """
+    Generate jawaban lalu simpan ke Redis. True jika jawaban tersimpan.
+    `final=False` berarti job masih akan dicoba ulang oleh antrian jika percobaan ini gagal:
+    klaim tetap dipegang dan penunggu tidak diberi kabar gagal.
+    """
+    saved = False
     try:
         logging.info(f"🔄 Generating Gemini answer for prompt: {prompt[:100]}...")
         logging.info(f"🔑 Using cache_key: {cache_key}")
-        jawaban = await chat_with_gemini_api(prompt)
-        if jawaban:  # hanya simpan jika jawaban valid
-            await redis_client.set(cache_key, jawaban, ex=60) # Simpan ke Redis dengan expire 1 menit
-            logging.info(f"✅ Jawaban Gemini disimpan ke Redis untuk key: {cache_key}")
-            logging.info(f"📝 Jawaban length: {len(jawaban)} characters")
-            logging.info("✅ Respons dari Gemini berhasil didapat.")
-        else:
-            logging.warning("❌ Jawaban dari Gemini gagal. Tidak disimpan ke Redis.")
-            return {
-                "fulfillmentText": "🤖 Maaf, saya belum bisa memberikan jawaban saat ini. Silakan coba lagi nanti."
-            }
+        await clear_partial(cache_key)
+        jawaban = await chat_with_gemini_api(prompt, on_chunk=lambda text: append_partial(cache_key, text))
+        await redis_client.set(cache_key, jawaban, ex=CUSTOM_ANSWER_TTL)
+        logging.info(f"✅ Jawaban Gemini disimpan ke Redis untuk key: {cache_key}")
+        logging.info(f"📝 Jawaban length: {len(jawaban)} characters")
+        logging.info("✅ Respons dari Gemini berhasil didapat.")
+        saved = True
+        return True
+    except GeminiError as e:
+        # Pesan error tidak boleh dibagikan ke sesi lain lewat cache
+        logging.warning(f"❌ Jawaban dari Gemini gagal ({str(e)}). Tidak disimpan ke Redis.")
+        return False
     except Exception as e:
         logging.error(f"❌ Gagal generate jawaban Gemini: {str(e)}")
         import traceback
         logging.error(f"❌ Traceback: {traceback.format_exc()}")
+        return False
+    finally:
+        if saved or final:
+            await finish_progress(cache_key, saved)
+            await release_generation(cache_key)
+        else:
+            await reset_progress(cache_key)
+            await refresh_generation(cache_key)
 
-async def handle_custom_question(req, background_task: BackgroundTasks):
-    user_question = req.queryResult.get("queryText", "").strip()
-    session = req.session
-    intent = req.queryResult.get("intent", {}).get("displayName", "")
-    output_contexts = req.queryResult.get("outputContexts", [])
-    input_contexts = req.queryResult.get("inputContexts", [])
+async def handle_custom_question(ctx: WebhookContext):
+    started = time.monotonic()
+    user_question = ctx.query_text
+    session = ctx.session
+    intent = ctx.intent
     
     logging.info(f"🎯 Intent: {intent}, User Question: '{user_question}'")
     logging.info(f"📝 Session: {session}")
     
-    # Cek context di inputContexts ATAU outputContexts
-    # Context yang dibuat di response sebelumnya akan muncul sebagai inputContexts di request berikutnya
-    all_contexts = input_contexts + output_contexts
-    has_waiting_context = any(
-        "waiting_custom_answer" in context.get("name", "")
-        for context in all_contexts
-    )
+    # Context di inputContexts maupun outputContexts sudah digabung di WebhookContext
+    has_waiting_context = ctx.has_context("waiting_custom_answer")
 
     if intent == "Tanya Lagi ke AI":
         logging.info("💬 User klik chip 'Tanya Lagi ke AI' - Langsung masuk ke custom question")
@@ -83,7 +119,7 @@ async def handle_custom_question(req, background_task: BackgroundTasks):
             ],
             "outputContexts": [
                 {
-                    "name": f"{req.session}/contexts/waiting_custom_answer",
+                    "name": f"{ctx.session}/contexts/waiting_custom_answer",
                     "lifespanCount": 20  # Tingkatkan lifespan agar bisa bertanya beberapa kali
                 }
             ]
@@ -99,27 +135,51 @@ async def handle_custom_question(req, background_task: BackgroundTasks):
             }
         
         try:
-            cache_key = generate_cache_key(session, user_question)
-            logging.info(f"🔑 Cache key: {cache_key}")
+            normalized = normalize_question(user_question)
+            cache_key = generate_cache_key(normalized)
+            logging.info(f"🔑 Cache key: {cache_key} (pertanyaan normal: '{normalized}')")
 
             if redis_client:
                 cached = await redis_client.get(cache_key)
                 if cached:
                     logging.info("📦 Jawaban diambil dari Redis cache.")
+                    if question_index is not None:
+                        question_index.add(cache_key, normalized)
+                    await record_outcome("custom", OUTCOME_CACHE_HIT)
                     return make_response(cached, session)
-                else:
-                    logging.info("🔄 Cache tidak ditemukan, akan generate jawaban baru")
+                if question_index is not None:
+                    similar = await find_near_duplicate(normalized, cache_key)
+                    if similar:
+                        await record_outcome("custom", OUTCOME_CACHE_HIT)
+                        return make_response(similar, session)
+                logging.info("🔄 Cache tidak ditemukan, akan generate jawaban baru")
             else:
                 logging.warning("⚠️ Redis client tidak tersedia")
             
+            queued = True
+            if await claim_generation(cache_key):
+                if not await enqueue_generation(JOB_CUSTOM, user_question, cache_key):
+                    logging.warning("⚠️ Antrian Gemini tidak tersedia, fallback ke background task")
+                    ctx.background_task.add_task(generate_and_cache_gemini_answer, user_question, cache_key)
+                    queued = False  # background task baru jalan setelah respons dikirim
+            else:
+                logging.info("🔁 Jawaban untuk pertanyaan ini sedang diproses, menunggu hasil yang sama")
+            if question_index is not None:
+                question_index.add(cache_key, normalized)
+
+            jawaban = await wait_inline(cache_key, started) if queued and redis_client else None
+            if jawaban:
+                logging.info("⚡ Jawaban selesai dalam anggaran inline, dikirim langsung.")
+                await record_outcome("custom", OUTCOME_INLINE)
+                return make_response(jawaban, session)
+
             logging.info("🕐 Jawaban belum tersedia. Kirim respon awal ke Dialogflow.")
-            background_task.add_task(generate_and_cache_gemini_answer, user_question, cache_key)
-            
+            await record_outcome("custom", OUTCOME_DEFERRED)
             return {
                 "fulfillmentText": "🤖 Jawaban sedang diproses… Mohon tunggu sebentar.",
                 "outputContexts": [
                     {
-                        "name": f"{req.session}/contexts/waiting_custom_answer",
+                        "name": f"{ctx.session}/contexts/waiting_custom_answer",
                         "lifespanCount": 20,  # Tingkatkan lifespan agar bisa bertanya beberapa kali
                         "parameters": {
                             "cache_key": cache_key
@@ -1,9 +1,12 @@
-async def handle_welcome(session: str = None):
+from chatbot.utils.webhook_context import WebhookContext
+import logging
+
+async def handle_welcome(ctx: WebhookContext):
     """
     Handler untuk Welcome/Menu Utama.
     Reset semua context dan kembali ke awal (pilih jenjang).
     """
-    import logging
+    session = ctx.session
     logging.info("🏠 Reset semua context dan kembali ke menu utama")
     
     chips = [
@@ -1,12 +1,52 @@
-from chatbot.utils.context_helper import get_context_param, get_previous_chips
-from chatbot.services.firestore_service import db
-from chatbot.services.redis_client import redis_client
-import json
+from chatbot.utils.context_helper import get_previous_chips
+from chatbot.services.curriculum_repository import find_subject, get_lessons, get_subjects
+from chatbot.services.two_tier_cache import chip_cache
+from chatbot.utils.response_cache import SESSION_PLACEHOLDER, dump_cacheable, render_cached
+from chatbot.utils.webhook_context import WebhookContext
 import logging
 
-async def handle_lessons_by_subject_name_level(req):
-    subject_name = req.queryResult.get("queryText", "").strip()
-    level = get_context_param(req.dict(), "pilihjenjang-followup", "school_level")
+async def _build_lessons_payload(level: str, subject_name: str):
+    subject = await find_subject(subject_name, level)
+    if not subject:
+        return None
+    subject_id = subject.id_subject
+    logging.debug(f"subject_id = {subject_id}")
+    lessons = await get_lessons(subject_id)
+    chips = []
+    for lesson in lessons:
+        logging.debug(f"Ditemukan materi: {lesson.title}")
+        chips.append({"text": lesson.title})
+    if not chips:
+        return None
+    response = {
+        "fulfillmentMessages": [{
+            "text": {
+                "text":
+                [f"Materi untuk {subject_name} jenjang {level.upper()}:"]
+            }
+        }, {
+            "payload": {
+                "richContent": [[{
+                    "type": "chips",
+                    "options": chips
+                }]]
+            }
+        }],
+        "outputContexts": [{
+            "name": f"{SESSION_PLACEHOLDER}/contexts/pilihpelajaran-followup",
+            "lifespanCount": 5,
+            "parameters": {
+                "subject_name": subject_name,
+                "school_level": level
+            }
+        }]
+    }
+    logging.info("🧠 Data materi disimpan ke cache.")
+    return dump_cacheable(response)
+
+async def handle_lessons_by_subject_name_level(ctx: WebhookContext):
+    subject_name = ctx.query_text
+    level = ctx.param("pilihjenjang-followup", "school_level")
     logging.info(f"Mencari materi untuk subject: {subject_name}, level: {level}")
     if not subject_name or not level:
         chips = [
@@ -30,7 +70,7 @@ async def handle_lessons_by_subject_name_level(req):
                 }
             }],
             "outputContexts": [{
-                "name": f"{req.session}/contexts/pilihjenjang-followup",
+                "name": f"{ctx.session}/contexts/pilihjenjang-followup",
                 "lifespanCount": 5
             }]
         }
@@ -38,23 +78,19 @@ async def handle_lessons_by_subject_name_level(req):
     cache_key = f"lessons:{level}:{subject_name}"
 
     try:
-        cached = await redis_client.get(cache_key)
-        if cached:
-            logging.info("✅ Materi ditemukan di Redis")
-            return json.loads(cached)
-        
-        subject_query = db.collection("subjects") \
-                        .where("name", "==", subject_name) \
-                        .where("schoolLevel", "==", level) \
-                        .limit(1).stream()
-        subject_doc = next(subject_query, None)
-        if not subject_doc:
+        payload = await chip_cache.get_or_load(
+            cache_key, lambda: _build_lessons_payload(level, subject_name), ttl=3600)
+        if payload:
+            logging.info("✅ Materi ditemukan di cache")
+            return render_cached(payload, ctx.session)
+
+        subject = await find_subject(subject_name, level)
+        if not subject:
             logging.warning(f"Pelajaran {subject_name} tidak ditemukan untuk level {level}")
-            fallback_subjects = db.collection("subjects").where(
-                "schoolLevel", "==", level).stream()
+            fallback_subjects = await get_subjects(level)
             fallback_chips = [{
-                "text": doc.to_dict().get("name")
-            } for doc in fallback_subjects]
+                "text": fallback.name
+            } for fallback in fallback_subjects]
             return {
                 "fulfillmentMessages": [{
                     "text": {
@@ -71,84 +107,47 @@ async def handle_lessons_by_subject_name_level(req):
                     }
                 }],
                 "outputContexts": [{
-                    "name": f"{req.session}/contexts/pilihjenjang-followup",
+                    "name": f"{ctx.session}/contexts/pilihjenjang-followup",
                     "lifespanCount": 5,
                     "parameters": {
                         "school_level": level
                     }
                 }]
             }
-        subject_data = subject_doc.to_dict()
-        subject_id = subject_data.get("idSubject")
-        logging.debug(f"subject_id = {subject_id}")
-        lesson_query = db.collection("lessons").where("idSubject", "==", subject_id).stream()
-        chips = []
-        for doc in lesson_query:
-            title = doc.to_dict().get("title")
-            if title:
-                logging.debug(f"Ditemukan materi: {title}")
-                chips.append({"text": title})
-        if not chips:
-            logging.info("⚠️ Tidak ada materi, kembali ke chip subject sebelumnya")
-            previous = await get_previous_chips(req, db)
-            if previous:
-                response = {
-                    "fulfillmentMessages": [{
-                        "text": {
-                            "text": [
-                                f"❗ Belum ada materi untuk {subject_name} jenjang {level.upper()}.\n{previous['message']}"
-                            ]
-                        }
-                    }, {
-                        "payload": {
-                            "richContent": [[{
-                                "type": "chips",
-                                "options": previous["chips"]
-                            }]]
-                        }
-                    }]
-                }
-                if previous["context_name"]:
-                    response["outputContexts"] = [{
-                        "name": previous["context_name"],
-                        "lifespanCount": 5,
-                        "parameters": previous["context_params"]
-                    }]
-                return response
-            return {
-                "fulfillmentText":
-                f"Belum ada materi untuk {subject_name} jenjang {level.upper()}."
+        logging.info("⚠️ Tidak ada materi, kembali ke chip subject sebelumnya")
+        previous = await get_previous_chips(ctx)
+        if previous:
+            response = {
+                "fulfillmentMessages": [{
+                    "text": {
+                        "text": [
+                            f"❗ Belum ada materi untuk {subject_name} jenjang {level.upper()}.\n{previous['message']}"
+                        ]
+                    }
+                }, {
+                    "payload": {
+                        "richContent": [[{
+                            "type": "chips",
+                            "options": previous["chips"]
+                        }]]
+                    }
+                }]
             }
-        response = {
-            "fulfillmentMessages": [{
-                "text": {
-                    "text":
-                    [f"Materi untuk {subject_name} jenjang {level.upper()}:"]
-                }
-            }, {
-                "payload": {
-                    "richContent": [[{
-                        "type": "chips",
-                        "options": chips
-                    }]]
-                }
-            }],
-            "outputContexts": [{
-                "name": f"{req.session}/contexts/pilihpelajaran-followup",
-                "lifespanCount": 5,
-                "parameters": {
-                    "subject_name": subject_name,
-                    "school_level": level
-                }
-            }]
+            if previous["context_name"]:
+                response["outputContexts"] = [{
+                    "name": previous["context_name"],
+                    "lifespanCount": 5,
+                    "parameters": previous["context_params"]
+                }]
+            return response
+        return {
+            "fulfillmentText":
+            f"Belum ada materi untuk {subject_name} jenjang {level.upper()}."
         }
-        await redis_client.set(cache_key, json.dumps(response), ex=3600)
-        logging.info("🧠 Data materi disimpan ke Redis.")
-        return response
     except Exception as e:
         logging.error(f"Firestore Error: {e}")
         logging.info("⚠️ Error terjadi, kembali ke chip subject sebelumnya")
-        previous = await get_previous_chips(req, db)
+        previous = await get_previous_chips(ctx)
         if previous:
             response = {
                 "fulfillmentMessages": [{
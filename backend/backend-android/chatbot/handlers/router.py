@@ -0,0 +1,69 @@
+"""
+Registry intent Dialogflow → handler.
+
+Setiap handler menerima `WebhookContext` yang sudah di-parse sekali di
+`main.webhook`. Menambah intent baru cukup dengan satu entri di INTENT_HANDLERS.
+"""
+
+from chatbot.handlers.theory_with_gemini import get_theory_from_subbab
+from chatbot.handlers.subject import handle_subjects_by_level
+from chatbot.handlers.lessons import handle_lessons_by_subject_name_level
+from chatbot.handlers.subbab import handle_subbab_by_lessonid
+from chatbot.handlers.general import handle_welcome
+from chatbot.handlers.custom_question import handle_custom_question
+from chatbot.utils.webhook_context import WebhookContext
+from chatbot.utils.intent_shards import base_intent_name
+from functools import partial
+from typing import Awaitable, Callable, Dict, NamedTuple
+import logging
+
+class Route(NamedTuple):
+    handler: Callable[[WebhookContext], Awaitable[dict]]
+    log_message: str
+
+# Intent yang tetap diproses normal walaupun context waiting_custom_answer aktif
+RESET_INTENTS = {"Welcome", "Mulai", "Menu Utama"}
+
+_welcome = Route(handle_welcome, "🏠 Menangani intent Welcome/Mulai/Menu Utama - Reset semua context")
+
+INTENT_HANDLERS: Dict[str, Route] = {
+    "Welcome": _welcome,
+    "Mulai": _welcome,
+    "Menu Utama": _welcome,
+    "Pilih Jenjang SD": Route(partial(handle_subjects_by_level, "sd"), "📚 Menangani intent Pilih Jenjang SD"),
+    "Pilih Jenjang SMP": Route(partial(handle_subjects_by_level, "smp"), "📚 Menangani intent Pilih Jenjang SMP"),
+    "Pilih Jenjang SMA": Route(partial(handle_subjects_by_level, "sma"), "📚 Menangani intent Pilih Jenjang SMA"),
+    "Pilih Topik Pelajaran": Route(handle_lessons_by_subject_name_level, "📖 Menangani intent Pilih Topik Pelajaran"),
+    "Pilih Subbab": Route(handle_subbab_by_lessonid, "📝 Menangani intent Pilih Subbab"),
+    "Pilih Teori Subbab": Route(get_theory_from_subbab, "🧠 Menangani intent Pilih Teori Subbab"),
+    "Tanya Lagi ke AI": Route(handle_custom_question, "🤖 Menangani intent Tanya Lagi ke AI"),
+    "Custom Pertanyaan": Route(handle_custom_question, "💬 Menangani intent Custom Pertanyaan"),
+}
+
+async def dispatch(ctx: WebhookContext) -> dict:
+    has_waiting_context = ctx.has_context("waiting_custom_answer")
+    if has_waiting_context:
+        logging.info(f"✅ Context waiting_custom_answer ditemukan ({len(ctx.contexts)} context aktif)")
+
+    # PRIORITAS: Jika ada context waiting_custom_answer aktif, semua input diarahkan ke custom question
+    # (termasuk Default Fallback Intent), kecuali intent reset (Welcome, Mulai, Menu Utama).
+    # Catatan: "Tanya Lagi ke AI" tetap diizinkan untuk memperpanjang context
+    if has_waiting_context and ctx.query_text and ctx.intent not in RESET_INTENTS:
+        if ctx.intent == "Default Fallback Intent":
+            logging.info("💭 Fallback intent dengan context waiting_custom_answer - treat as Custom Pertanyaan")
+        else:
+            logging.info(f"💬 Context waiting_custom_answer aktif - mengarahkan intent '{ctx.intent}' ke Custom Pertanyaan")
+        return await handle_custom_question(ctx)
+
+    if not ctx.intent:
+        logging.warning("⚠️ Intent kosong")
+        return {"fulfillmentText": "Maaf, intent tidak dikenali."}
+
+    # Intent shard hasil sync training phrase ("Pilih Teori Subbab #2") memakai handler intent asalnya
+    route = INTENT_HANDLERS.get(base_intent_name(ctx.intent))
+    if route is None:
+        logging.warning(f"⚠️ Intent tidak dikenali: '{ctx.intent}'")
+        return {"fulfillmentText": "Maaf, intent tidak dikenali."}
+
+    logging.info(route.log_message)
+    return await route.handler(ctx)
@@ -1,13 +1,56 @@
-from chatbot.services.firestore_service import db
-from chatbot.utils.context_helper import get_context_param, get_previous_chips
-from chatbot.services.redis_client import redis_client
-import json
+from chatbot.services.curriculum_repository import find_subject, find_lesson, get_lessons, get_subbabs
+from chatbot.utils.context_helper import get_previous_chips
+from chatbot.services.two_tier_cache import chip_cache
+from chatbot.utils.response_cache import SESSION_PLACEHOLDER, dump_cacheable, render_cached
+from chatbot.utils.webhook_context import WebhookContext
 import logging
 
-async def handle_subbab_by_lessonid(req):
-    lesson_name = req.queryResult.get("queryText", "").strip()
-    level = get_context_param(req.dict(), "pilihpelajaran-followup", "school_level")
-    subject_name = get_context_param(req.dict(), "pilihpelajaran-followup", "subject_name")
+async def _build_subbab_payload(level: str, subject_name: str, lesson_name: str):
+    subject = await find_subject(subject_name, level)
+    if not subject:
+        return None
+    lesson = await find_lesson(lesson_name, subject.id_subject)
+    if not lesson:
+        return None
+    lesson_id = lesson.id
+    logging.debug(f"lesson_id = {lesson_id}")
+    subbabs = await get_subbabs(lesson_id)
+    chips = []
+    for subbab in subbabs:
+        logging.debug(f"Ditemukan sub-bab: {subbab.title}")
+        chips.append({"text": subbab.title})
+    if not chips:
+        return None
+    response = {
+        "fulfillmentMessages": [{
+            "text": {
+                "text": [f"Berikut sub-bab dari {lesson_name}:"]
+            }
+        }, {
+            "payload": {
+                "richContent": [[{
+                    "type": "chips",
+                    "options": chips
+                }]]
+            }
+        }],
+        "outputContexts": [{
+            "name": f"{SESSION_PLACEHOLDER}/contexts/pilihsubbab-followup",
+            "lifespanCount": 5,
+            "parameters": {
+                "school_level": level,
+                "subject_name": subject_name,
+                "lesson_name": lesson_name
+            }
+        }]
+    }
+    logging.info("🧠 Data subbab disimpan ke cache.")
+    return dump_cacheable(response)
+
+async def handle_subbab_by_lessonid(ctx: WebhookContext):
+    lesson_name = ctx.query_text
+    level = ctx.param("pilihpelajaran-followup", "school_level")
+    subject_name = ctx.param("pilihpelajaran-followup", "subject_name")
     logging.info(f"Mencari sub-bab untuk lesson: {lesson_name}")
     logging.info(f"Level: {level} | Subject: {subject_name}")
 
@@ -38,19 +81,16 @@ async def handle_subbab_by_lessonid(req):
     cache_key = f"subbab:{level}:{subject_name}:{lesson_name}"
 
     try:
-        cached = await redis_client.get(cache_key)
-        if cached:
-            logging.info("📦 Mengambil data dari Redis cache.")
-            return json.loads(cached)
-        
-        subject_query = db.collection("subjects") \
-            .where("name", "==", subject_name) \
-            .where("schoolLevel", "==", level) \
-            .limit(1).stream()
-        subject_doc = next(subject_query, None)
-        if not subject_doc:
+        payload = await chip_cache.get_or_load(
+            cache_key, lambda: _build_subbab_payload(level, subject_name, lesson_name), ttl=3600)
+        if payload:
+            logging.info("📦 Mengambil data dari cache.")
+            return render_cached(payload, ctx.session)
+
+        subject = await find_subject(subject_name, level)
+        if not subject:
             logging.info("⚠️ Pelajaran tidak ditemukan, kembali ke chip subject sebelumnya")
-            previous = await get_previous_chips(req, db)
+            previous = await get_previous_chips(ctx)
             if previous:
                 response = {
                     "fulfillmentMessages": [{
@@ -76,19 +116,14 @@ async def handle_subbab_by_lessonid(req):
                     }]
                 return response
             return {"fulfillmentText": "Pelajaran tidak ditemukan."}
-        subject_id = subject_doc.to_dict().get("idSubject")
-        lesson_query = db.collection("lessons") \
-            .where("title", "==", lesson_name) \
-            .where("idSubject", "==", subject_id) \
-            .limit(1).stream()
-        lesson_doc = next(lesson_query, None)
-        if not lesson_doc:
+        subject_id = subject.id_subject
+        lesson = await find_lesson(lesson_name, subject_id)
+        if not lesson:
             logging.warning(f"Materi '{lesson_name}' tidak ditemukan")
-            fallback_lessons = db.collection("lessons").where(
-                "idSubject", "==", subject_id).stream()
+            fallback_lessons = await get_lessons(subject_id)
             chips = [{
-                "text": doc.to_dict().get("title")
-            } for doc in fallback_lessons]
+                "text": fallback.title
+            } for fallback in fallback_lessons]
             return {
                 "fulfillmentMessages": [{
                     "text": {
@@ -106,7 +141,7 @@ async def handle_subbab_by_lessonid(req):
                 }],
                 "outputContexts": [{
                     "name":
-                    f"{req.session}/contexts/pilihpelajaran-followup",
+                    f"{ctx.session}/contexts/pilihpelajaran-followup",
                     "lifespanCount": 5,
                     "parameters": {
                         "school_level": level,
@@ -114,78 +149,40 @@ async def handle_subbab_by_lessonid(req):
                     }
                 }]
             }
-        lesson_id = lesson_doc.id
-        logging.debug(f"lesson_id = {lesson_id}")
-        subbab_query = db.collection("sub_bab").where("lessonId", "==", lesson_id).stream()
-        chips = []
-        for doc in subbab_query:
-            data = doc.to_dict()
-            title = data.get("title")
-            if title:
-                logging.debug(f"Ditemukan sub-bab: {title}")
-                chips.append({"text": title})
-        if not chips:
-            logging.info("⚠️ Tidak ada sub-bab, kembali ke chip lesson sebelumnya")
-            previous = await get_previous_chips(req, db)
-            if previous:
-                response = {
-                    "fulfillmentMessages": [{
-                        "text": {
-                            "text": [
-                                f"❗ Belum ada sub-bab untuk materi {lesson_name}.\n{previous['message']}"
-                            ]
-                        }
-                    }, {
-                        "payload": {
-                            "richContent": [[{
-                                "type": "chips",
-                                "options": previous["chips"]
-                            }]]
-                        }
-                    }]
-                }
-                if previous["context_name"]:
-                    response["outputContexts"] = [{
-                        "name": previous["context_name"],
-                        "lifespanCount": 5,
-                        "parameters": previous["context_params"]
-                    }]
-                return response
-            return {
-                "fulfillmentText":
-                f"Belum ada sub-bab untuk materi {lesson_name}."
+        logging.info("⚠️ Tidak ada sub-bab, kembali ke chip lesson sebelumnya")
+        previous = await get_previous_chips(ctx)
+        if previous:
+            response = {
+                "fulfillmentMessages": [{
+                    "text": {
+                        "text": [
+                            f"❗ Belum ada sub-bab untuk materi {lesson_name}.\n{previous['message']}"
+                        ]
+                    }
+                }, {
+                    "payload": {
+                        "richContent": [[{
+                            "type": "chips",
+                            "options": previous["chips"]
+                        }]]
+                    }
+                }]
             }
-        response = {
-            "fulfillmentMessages": [{
-                "text": {
-                    "text": [f"Berikut sub-bab dari {lesson_name}:"]
-                }
-            }, {
-                "payload": {
-                    "richContent": [[{
-                        "type": "chips",
-                        "options": chips
-                    }]]
-                }
-            }],
-            "outputContexts": [{
-                "name": f"{req.session}/contexts/pilihsubbab-followup",
-                "lifespanCount": 5,
-                "parameters": {
-                    "school_level": level,
-                    "subject_name": subject_name,
-                    "lesson_name": lesson_name
-                }
-            }]
+            if previous["context_name"]:
+                response["outputContexts"] = [{
+                    "name": previous["context_name"],
+                    "lifespanCount": 5,
+                    "parameters": previous["context_params"]
+                }]
+            return response
+        return {
+            "fulfillmentText":
+            f"Belum ada sub-bab untuk materi {lesson_name}."
         }
-        
-        await redis_client.set(cache_key, json.dumps(response), ex=3600)
-        logging.info("🧠 Data subbab disimpan ke Redis.")
-        return response
     except Exception as e:
         logging.error(f"Firestore Error: {e}")
         logging.info("⚠️ Error terjadi, kembali ke chip lesson sebelumnya")
-        previous = await get_previous_chips(req, db)
+        previous = await get_previous_chips(ctx)
         if previous:
             response = {
                 "fulfillmentMessages": [{
@@ -1,55 +1,52 @@
-from chatbot.services.firestore_service import db
-from chatbot.services.redis_client import redis_client
-import json
+from chatbot.services.firestore_service import async_db
+from chatbot.services.curriculum_repository import get_subjects
+from chatbot.services.two_tier_cache import chip_cache
+from chatbot.utils.response_cache import SESSION_PLACEHOLDER, dump_cacheable, render_cached
+from chatbot.utils.webhook_context import WebhookContext
 import logging
 
-async def handle_subjects_by_level(level: str, req):
+async def _build_subjects_payload(level: str):
+    subjects = await get_subjects(level)
+    chips = []
+    for subject in subjects:
+        logging.debug(f"Ditemukan pelajaran: {subject.name}")
+        chips.append({"text": subject.name})
+
+    if not chips:
+        return None
+    response = {
+        "fulfillmentMessages": [
+            {"text": {"text": [f"Berikut pelajaran untuk jenjang {level.upper()} yang tersedia:"]}},
+            {"payload": {"richContent": [[{"type": "chips", "options": chips}]]}}
+        ],
+        "outputContexts": [
+            {
+                "name": f"{SESSION_PLACEHOLDER}/contexts/pilihjenjang-followup",
+                "lifespanCount": 5,
+                "parameters": {
+                    "school_level": level
+                }
+            }
+        ]
+    }
+    logging.info("🧠 Data pelajaran disimpan ke cache.")
+    return dump_cacheable(response)
+
+async def handle_subjects_by_level(level: str, ctx: WebhookContext):
     logging.info(f"Mengambil pelajaran untuk jenjang {level}")
     cache_key = f"subjects:{level}"
     
     if not level or level not in ["sd", "smp", "sma"]:
         return {"fulfillmentText": "Jenjang pendidikan tidak valid."}
     
-    if not db:
+    if not async_db:
         return {"fulfillmentText": "Terjadi kesalahan koneksi database."}
     
     try:
-        if redis_client:
-            cached = await redis_client.get(cache_key)
-            if cached:
-                logging.info("📦 Mengambil data dari Redis cache.")
-                return json.loads(cached)
-    
-        docs = db.collection("subjects").where("schoolLevel", "==", level).stream()
-        chips = []
-        for doc in docs:
-            data = doc.to_dict()
-            nama_materi = data.get("name")
-            if nama_materi:
-                logging.debug(f"Ditemukan pelajaran: {nama_materi}")
-                chips.append({"text": nama_materi})
-
-        if not chips:
+        payload = await chip_cache.get_or_load(cache_key, lambda: _build_subjects_payload(level), ttl=3600)
+        if not payload:
             return {"fulfillmentText": f"Belum ada pelajaran untuk jenjang {level.upper()}."}
-        response = {
-            "fulfillmentMessages": [
-                {"text": {"text": [f"Berikut pelajaran untuk jenjang {level.upper()} yang tersedia:"]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": chips}]]}}
-            ],
-            "outputContexts": [
-                {
-                    "name": f"{req.session}/contexts/pilihjenjang-followup",
-                    "lifespanCount": 5,
-                    "parameters": {
-                        "school_level": level
-                    }
-                }
-            ]
-        }
-        if redis_client:
-            await redis_client.set(cache_key, json.dumps(response), ex=3600) 
-            logging.info("🧠 Data pelajaran disimpan ke Redis.")
-        return response
+        return render_cached(payload, ctx.session)
     except Exception as e:
         logging.error(f"Firestore Error: {e}")
-        return {"fulfillmentText": "Terjadi kesalahan saat mengambil data pelajaran."}
\ No newline at end of file
+        return {"fulfillmentText": "Terjadi kesalahan saat mengambil data pelajaran."}
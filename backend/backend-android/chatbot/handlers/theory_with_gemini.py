@@ -1,14 +1,33 @@
-from chatbot.services.firestore_service import db
-from chatbot.services.gemini_service_async import chat_with_gemini_api
-from chatbot.utils.context_helper import get_context_param, get_previous_chips
-from chatbot.services.redis_client import redis_client
-from fastapi import BackgroundTasks
+from chatbot.services.curriculum_repository import find_subbab
+from chatbot.services.gemini_service_async import chat_with_gemini_api, GeminiError
+from chatbot.services.gemini_scheduler import PRIORITY_HIGH
+from chatbot.utils.context_helper import get_previous_chips
+from chatbot.utils.webhook_context import WebhookContext
+from chatbot.services import theory_store
+from chatbot.services.gemini_progress import append_partial, clear_partial, finish_progress, reset_progress
+from chatbot.services.inflight_registry import claim_generation, refresh_generation, release_generation
+from chatbot.services.gemini_queue import enqueue_generation, JOB_THEORY
+from chatbot.services.inline_answer import wait_inline, record_outcome, OUTCOME_CACHE_HIT, OUTCOME_INLINE, OUTCOME_DEFERRED
 import hashlib
 import logging
+import time
+
+SCHOOL_LEVELS = ["sd", "smp", "sma"]
+
+THEORY_PROMPT_TEMPLATE = (
+    "Jelaskan dengan sederhana kepada siswa disablitas tunarungu {level} tentang '{materi}'. "
+    "Berikan penjelasan yang mudah dipahami dan berikan 1 contoh soal sederhana juga."
+)
+# Versi prompt ikut menjadi bagian key, sehingga jawaban lama otomatis tidak
+# terpakai lagi ketika template di atas diubah.
+PROMPT_VERSION = hashlib.sha256(THEORY_PROMPT_TEMPLATE.encode()).hexdigest()[:12]
+
+def build_theory_prompt(level: str, materi: str) -> str:
+    return THEORY_PROMPT_TEMPLATE.format(level=level, materi=materi)
 
 def generate_cache_key(level: str, materi: str) -> str:
     key_string = f"{level}:{materi}"
-    return hashlib.sha256(key_string.encode()).hexdigest()
+    return f"theory:{PROMPT_VERSION}:{hashlib.sha256(key_string.encode()).hexdigest()}"
 
 def make_response(jawaban: str):
     logging.info("📤 Membuat respons untuk Dialogflow")
@@ -26,36 +45,54 @@ def make_response(jawaban: str):
     logging.info("📤 Mengirim respons teori subbab + chips ke user.")
     return response
 
-async def generate_and_cache_gemini_answer(prompt: str, cache_key: str):
+async def generate_and_cache_gemini_answer(prompt: str, cache_key: str, final: bool = True) -> bool:
+    """
+    Generate teori lalu simpan ke Redis. True jika jawaban tersimpan.
+    `final=False` berarti job masih akan dicoba ulang oleh antrian jika percobaan ini gagal:
+    klaim tetap dipegang dan penunggu tidak diberi kabar gagal.
+    """
+    saved = False
     try:
-        jawaban = await chat_with_gemini_api(prompt)
-        if jawaban and not jawaban.startswith("❌") and not jawaban.startswith("⏰") and not jawaban.startswith("🌐") and not jawaban.startswith("📄"):
-            await redis_client.set(cache_key, jawaban, ex=60 * 60 * 6) # Simpan ke Redis dengan expire 6 jam
-            logging.info(f"✅ Jawaban Gemini disimpan ke Redis untuk key: {cache_key}")
-        else:
-            logging.warning("❌ Jawaban dari Gemini gagal atau error. Tidak disimpan ke Redis.")
-        logging.info("✅ Respons dari Gemini berhasil diproses.")
+        # Sisa potongan dari percobaan sebelumnya yang terputus tidak boleh ikut tersambung
+        await clear_partial(cache_key)
+        jawaban = await chat_with_gemini_api(
+            prompt, on_chunk=lambda text: append_partial(cache_key, text), priority=PRIORITY_HIGH)
+        # Tanpa TTL: key sudah memuat versi prompt, jadi jawaban tidak pernah basi
+        await theory_store.save_answer(cache_key, jawaban)
+        saved = True
+        return True
+    except GeminiError as e:
+        logging.warning(f"❌ Jawaban dari Gemini gagal ({str(e)}). Tidak disimpan ke Redis.")
+        return False
     except Exception as e:
         logging.error(f"❌ Gagal generate jawaban Gemini: {str(e)}")
+        return False
+    finally:
+        if saved or final:
+            await finish_progress(cache_key, saved)
+            await release_generation(cache_key)
+        else:
+            await reset_progress(cache_key)
+            await refresh_generation(cache_key)
 
-async def get_theory_from_subbab(req, background_task: BackgroundTasks):
+async def get_theory_from_subbab(ctx: WebhookContext):
     logging.info("➡️ Memulai proses get_theory_from_subbab")
+    started = time.monotonic()
 
-    subbab_name = req.queryResult.get("queryText", "").strip()
+    subbab_name = ctx.query_text
     logging.info("📥 Nama subbab dari user: '%s'", subbab_name)
 
-    level = get_context_param(req.dict(), "pilihpelajaran-followup", "school_level")
+    level = ctx.param("pilihpelajaran-followup", "school_level")
     logging.info("🏫 Jenjang pendidikan dari context: '%s'", level)
 
     try:
-        subbab_docs = db.collection("sub_bab").where("title", "==", subbab_name).stream()
-        subbab_data = next((doc.to_dict() for doc in subbab_docs), None)
-        logging.info("🟾 Data subbab ditemukan: %s", subbab_data is not None)
+        subbab = await find_subbab(subbab_name)
+        logging.info("🟾 Data subbab ditemukan: %s", subbab is not None)
 
-        if not subbab_data:
+        if not subbab:
             logging.warning("❌ Subbab '%s' tidak ditemukan di Firestore", subbab_name)
             logging.info("⚠️ Subbab tidak ditemukan, kembali ke chip subbab sebelumnya")
-            previous = await get_previous_chips(req, db)
+            previous = await get_previous_chips(ctx)
             if previous:
                 response = {
                     "fulfillmentMessages": [{
@@ -84,24 +121,39 @@ async def get_theory_from_subbab(req, background_task: BackgroundTasks):
 
         materi = subbab_name 
         
-        prompt = f"Jelaskan dengan sederhana kepada siswa disablitas tunarungu {level} tentang '{materi}'. Berikan penjelasan yang mudah dipahami dan berikan 1 contoh soal sederhana juga."
+        prompt = build_theory_prompt(level, materi)
         logging.debug("🧠 Prompt ke Gemini: %s", prompt)
         cache_key = generate_cache_key(level, materi)
 
-        cached = await redis_client.get(cache_key)
+        cached = await theory_store.get_answer(cache_key)
         if cached:
-            logging.info("📦 Jawaban diambil dari Redis cache.")
+            logging.info("📦 Jawaban diambil dari theory store.")
+            await record_outcome("theory", OUTCOME_CACHE_HIT)
             jawaban = cached
             return make_response(jawaban)
         
+        queued = True
+        if await claim_generation(cache_key):
+            if not await enqueue_generation(JOB_THEORY, prompt, cache_key):
+                logging.warning("⚠️ Antrian Gemini tidak tersedia, fallback ke background task")
+                ctx.background_task.add_task(generate_and_cache_gemini_answer, prompt, cache_key)
+                queued = False  # background task baru jalan setelah respons dikirim
+        else:
+            logging.info("🔁 Teori untuk subbab ini sedang diproses, menunggu hasil yang sama")
+
+        jawaban = await wait_inline(cache_key, started) if queued else None
+        if jawaban:
+            logging.info("⚡ Jawaban selesai dalam anggaran inline, dikirim langsung.")
+            await record_outcome("theory", OUTCOME_INLINE)
+            return make_response(jawaban)
+
         logging.info("🕐 Jawaban belum tersedia. Kirim respon awal ke Dialogflow.")
-        background_task.add_task(generate_and_cache_gemini_answer, prompt, cache_key)
-        
+        await record_outcome("theory", OUTCOME_DEFERRED)
         return {
             "fulfillmentText": "🤖 Jawaban sedang diproses… Mohon tunggu sebentar.",
             "outputContexts": [
                 {
-                    "name": f"{req.session}/contexts/waiting_theory_answer",
+                    "name": f"{ctx.session}/contexts/waiting_theory_answer",
                     "lifespanCount": 3,
                     "parameters": {
                         "cache_key": cache_key,
@@ -115,7 +167,7 @@ async def get_theory_from_subbab(req, background_task: BackgroundTasks):
     except Exception as e:
         logging.exception("🔥 Terjadi exception saat ambil teori dari subbab")
         logging.info("⚠️ Error terjadi, kembali ke chip subbab sebelumnya")
-        previous = await get_previous_chips(req, db)
+        previous = await get_previous_chips(ctx)
         if previous:
             response = {
                 "fulfillmentMessages": [{
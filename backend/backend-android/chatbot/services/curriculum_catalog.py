@@ -0,0 +1,227 @@
+"""
+Katalog kurikulum in-memory (subjects, lessons, sub_bab).
+
+Koleksi-koleksi ini kecil dan jarang berubah, jadi disalin utuh ke memori
+dan dijaga tetap terbaru oleh listener `on_snapshot` Firestore. Callback
+snapshot berjalan di thread milik Firestore; setiap perubahan membangun ulang
+index koleksi terkait lalu menukar referensinya sekaligus, sehingga pembaca
+di event loop cukup melakukan lookup dict tanpa lock.
+
+Jika callback snapshot gagal atau stream watch ditutup Firestore, koleksi
+tersebut dikeluarkan dari `_loaded` sehingga `curriculum_repository` kembali
+membaca Firestore langsung. Thread pengawas memeriksa listener setiap
+CATALOG_WATCH_CHECK_INTERVAL detik dan memasang ulang yang mati; snapshot
+pertama listener baru memuat ulang koleksi secara utuh.
+"""
+
+from chatbot.services.firestore_service import db
+from chatbot.services.curriculum_models import Subject, Lesson, SubBab
+from os import getenv
+import logging
+import threading
+
+COLLECTIONS = ("subjects", "lessons", "sub_bab")
+CATALOG_WATCH_CHECK_INTERVAL = float(getenv("CATALOG_WATCH_CHECK_INTERVAL", "10"))
+
+_lock = threading.Lock()
+_docs = {name: {} for name in COLLECTIONS}
+_loaded = set()
+# Koleksi yang listener-nya perlu dipasang ulang
+_broken = set()
+_watches = {}
+_stop = threading.Event()
+_supervisor = None
+
+_subjects_by_level = {}
+_subject_by_name_level = {}
+_subjects_by_name = {}
+_lessons_by_subject = {}
+_lesson_by_title_subject = {}
+_lessons_by_title = {}
+_subbabs_by_lesson = {}
+_subbab_by_title = {}
+
+def _rebuild_subjects():
+    global _subjects_by_level, _subject_by_name_level, _subjects_by_name
+    by_level, by_name_level, by_name = {}, {}, {}
+    for doc_id in sorted(_docs["subjects"]):
+        data = _docs["subjects"][doc_id]
+        name = data.get("name")
+        if not name:
+            continue
+        subject = Subject(id_subject=data.get("idSubject"), name=name, school_level=data.get("schoolLevel"))
+        by_level.setdefault(subject.school_level, []).append(subject)
+        by_name_level.setdefault((subject.name, subject.school_level), subject)
+        by_name.setdefault(subject.name, []).append(subject)
+    _subjects_by_level, _subject_by_name_level, _subjects_by_name = by_level, by_name_level, by_name
+
+def _rebuild_lessons():
+    global _lessons_by_subject, _lesson_by_title_subject, _lessons_by_title
+    by_subject, by_title_subject, by_title = {}, {}, {}
+    for doc_id in sorted(_docs["lessons"]):
+        data = _docs["lessons"][doc_id]
+        title = data.get("title")
+        if not title:
+            continue
+        lesson = Lesson(id=doc_id, title=title, id_subject=data.get("idSubject"))
+        by_subject.setdefault(lesson.id_subject, []).append(lesson)
+        by_title_subject.setdefault((lesson.title, lesson.id_subject), lesson)
+        by_title.setdefault(lesson.title, []).append(lesson)
+    _lessons_by_subject, _lesson_by_title_subject, _lessons_by_title = by_subject, by_title_subject, by_title
+
+def _rebuild_subbabs():
+    global _subbabs_by_lesson, _subbab_by_title
+    by_lesson, by_title = {}, {}
+    for doc_id in sorted(_docs["sub_bab"]):
+        data = _docs["sub_bab"][doc_id]
+        title = data.get("title")
+        if not title:
+            continue
+        subbab = SubBab(id=doc_id, title=title, lesson_id=data.get("lessonId"))
+        by_lesson.setdefault(subbab.lesson_id, []).append(subbab)
+        by_title.setdefault(subbab.title, subbab)
+    _subbabs_by_lesson, _subbab_by_title = by_lesson, by_title
+
+_REBUILDERS = {
+    "subjects": _rebuild_subjects,
+    "lessons": _rebuild_lessons,
+    "sub_bab": _rebuild_subbabs,
+}
+
+def _mark_stale(collection: str, reason: str):
+    """Koleksi tidak lagi dilayani dari memori sampai listener baru memuatnya ulang."""
+    with _lock:
+        _loaded.discard(collection)
+        _broken.add(collection)
+    logging.warning(f"⚠️ Listener katalog '{collection}' {reason}, pembacaan kembali ke Firestore")
+
+def _make_listener(collection: str):
+    initial = True
+
+    def on_snapshot(col_snapshot, changes, read_time):
+        nonlocal initial
+        try:
+            with _lock:
+                if initial:
+                    # Listener baru (juga setelah dipasang ulang): isi lama bisa sudah basi
+                    _docs[collection] = {doc.id: doc.to_dict() or {} for doc in col_snapshot}
+                    initial = False
+                else:
+                    docs = _docs[collection]
+                    for change in changes:
+                        if change.type.name == "REMOVED":
+                            docs.pop(change.document.id, None)
+                        else:
+                            docs[change.document.id] = change.document.to_dict() or {}
+                _REBUILDERS[collection]()
+                if collection not in _loaded:
+                    _loaded.add(collection)
+                    logging.info(f"📚 Katalog '{collection}' dimuat: {len(_docs[collection])} dokumen")
+                else:
+                    logging.info(f"🔄 Katalog '{collection}' diperbarui: {len(changes)} perubahan")
+        except Exception as e:
+            logging.error(f"❌ Gagal memproses snapshot '{collection}': {str(e)}")
+            _mark_stale(collection, "gagal memproses snapshot")
+    return on_snapshot
+
+def _subscribe(collection: str):
+    _watches[collection] = db.collection(collection).on_snapshot(_make_listener(collection))
+
+def check_watches():
+    """Pasang ulang listener yang ditutup Firestore atau yang callback-nya gagal."""
+    for collection in COLLECTIONS:
+        watch = _watches.get(collection)
+        with _lock:
+            broken = collection in _broken
+        if watch is not None and watch.is_active and not broken:
+            continue
+        if not broken:
+            _mark_stale(collection, "terputus")
+        if watch is not None:
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                logging.error(f"❌ Gagal menghentikan listener katalog '{collection}': {str(e)}")
+        try:
+            _subscribe(collection)
+        except Exception as e:
+            # Tetap ditandai rusak, dicoba lagi di pemeriksaan berikutnya
+            _watches.pop(collection, None)
+            logging.error(f"❌ Gagal memasang ulang listener katalog '{collection}': {str(e)}")
+            continue
+        with _lock:
+            _broken.discard(collection)
+        logging.info(f"🔁 Listener katalog '{collection}' dipasang ulang")
+
+def _supervise():
+    while not _stop.wait(CATALOG_WATCH_CHECK_INTERVAL):
+        try:
+            check_watches()
+        except Exception as e:
+            logging.error(f"❌ Gagal memeriksa listener katalog: {str(e)}")
+
+def start_catalog() -> bool:
+    """Pasang listener on_snapshot untuk semua koleksi kurikulum beserta thread pengawasnya."""
+    global _supervisor
+    if not db:
+        logging.warning("⚠️ Firestore client tidak tersedia, katalog kurikulum tidak dijalankan")
+        return False
+    if _watches:
+        return True
+    for collection in COLLECTIONS:
+        _subscribe(collection)
+    _stop.clear()
+    _supervisor = threading.Thread(target=_supervise, name="catalog-watch-supervisor", daemon=True)
+    _supervisor.start()
+    logging.info("👂 Listener katalog kurikulum aktif")
+    return True
+
+def stop_catalog():
+    _stop.set()
+    if _supervisor:
+        _supervisor.join(timeout=5)
+    while _watches:
+        _, watch = _watches.popitem()
+        try:
+            watch.unsubscribe()
+        except Exception as e:
+            logging.error(f"❌ Gagal menghentikan listener katalog: {str(e)}")
+    with _lock:
+        _loaded.clear()
+        _broken.clear()
+
+def is_ready() -> bool:
+    """True setelah snapshot pertama semua koleksi sudah dimuat."""
+    return len(_loaded) == len(COLLECTIONS)
+
+def status() -> dict:
+    return {
+        "ready": is_ready(),
+        "loaded": sorted(_loaded),
+        "reconnecting": sorted(_broken),
+        "counts": {name: len(_docs[name]) for name in COLLECTIONS},
+    }
+
+def get_subjects(level: str) -> list:
+    return list(_subjects_by_level.get(level, ()))
+
+def find_subject(name: str, level: str):
+    return _subject_by_name_level.get((name, level))
+
+def find_subjects_by_name(name: str) -> list:
+    return list(_subjects_by_name.get(name, ()))
+
+def get_lessons(subject_id: str) -> list:
+    return list(_lessons_by_subject.get(subject_id, ()))
+
+def find_lesson(title: str, subject_id: str):
+    return _lesson_by_title_subject.get((title, subject_id))
+
+def find_lessons_by_title(title: str) -> list:
+    return list(_lessons_by_title.get(title, ()))
+
+def get_subbabs(lesson_id: str) -> list:
+    return list(_subbabs_by_lesson.get(lesson_id, ()))
+
+def find_subbab(title: str):
+    return _subbab_by_title.get(title)
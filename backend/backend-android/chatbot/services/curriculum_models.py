@@ -0,0 +1,19 @@
+from dataclasses import dataclass
+
+@dataclass(frozen=True)
+class Subject:
+    id_subject: str
+    name: str
+    school_level: str
+
+@dataclass(frozen=True)
+class Lesson:
+    id: str
+    title: str
+    id_subject: str
+
+@dataclass(frozen=True)
+class SubBab:
+    id: str
+    title: str
+    lesson_id: str
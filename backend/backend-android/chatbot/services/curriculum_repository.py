@@ -0,0 +1,89 @@
+from typing import List, Optional
+from chatbot.services.firestore_service import async_db
+from chatbot.services.curriculum_models import Subject, Lesson, SubBab
+from chatbot.services import curriculum_catalog
+import logging
+
+def _client():
+    if not async_db:
+        raise RuntimeError("Firestore client belum diinisialisasi")
+    return async_db
+
+def _to_subject(doc) -> Optional[Subject]:
+    data = doc.to_dict() or {}
+    name = data.get("name")
+    if not name:
+        return None
+    return Subject(id_subject=data.get("idSubject"), name=name, school_level=data.get("schoolLevel"))
+
+def _to_lesson(doc) -> Optional[Lesson]:
+    data = doc.to_dict() or {}
+    title = data.get("title")
+    if not title:
+        return None
+    return Lesson(id=doc.id, title=title, id_subject=data.get("idSubject"))
+
+def _to_subbab(doc) -> Optional[SubBab]:
+    data = doc.to_dict() or {}
+    title = data.get("title")
+    if not title:
+        return None
+    return SubBab(id=doc.id, title=title, lesson_id=data.get("lessonId"))
+
+async def _collect(query, convert) -> list:
+    items = []
+    async for doc in query.stream():
+        item = convert(doc)
+        if item:
+            items.append(item)
+    return items
+
+async def get_subjects(level: str) -> List[Subject]:
+    """Semua pelajaran untuk satu jenjang (sd/smp/sma)."""
+    if curriculum_catalog.is_ready():
+        return curriculum_catalog.get_subjects(level)
+    query = _client().collection("subjects").where("schoolLevel", "==", level)
+    subjects = await _collect(query, _to_subject)
+    logging.debug(f"📚 {len(subjects)} pelajaran ditemukan untuk jenjang {level}")
+    return subjects
+
+async def find_subject(name: str, level: str) -> Optional[Subject]:
+    if curriculum_catalog.is_ready():
+        return curriculum_catalog.find_subject(name, level)
+    query = _client().collection("subjects") \
+        .where("name", "==", name) \
+        .where("schoolLevel", "==", level) \
+        .limit(1)
+    subjects = await _collect(query, _to_subject)
+    return subjects[0] if subjects else None
+
+async def get_lessons(subject_id: str) -> List[Lesson]:
+    """Semua materi milik satu pelajaran."""
+    if curriculum_catalog.is_ready():
+        return curriculum_catalog.get_lessons(subject_id)
+    query = _client().collection("lessons").where("idSubject", "==", subject_id)
+    return await _collect(query, _to_lesson)
+
+async def find_lesson(title: str, subject_id: str) -> Optional[Lesson]:
+    if curriculum_catalog.is_ready():
+        return curriculum_catalog.find_lesson(title, subject_id)
+    query = _client().collection("lessons") \
+        .where("title", "==", title) \
+        .where("idSubject", "==", subject_id) \
+        .limit(1)
+    lessons = await _collect(query, _to_lesson)
+    return lessons[0] if lessons else None
+
+async def get_subbabs(lesson_id: str) -> List[SubBab]:
+    """Semua sub-bab milik satu materi."""
+    if curriculum_catalog.is_ready():
+        return curriculum_catalog.get_subbabs(lesson_id)
+    query = _client().collection("sub_bab").where("lessonId", "==", lesson_id)
+    return await _collect(query, _to_subbab)
+
+async def find_subbab(title: str) -> Optional[SubBab]:
+    if curriculum_catalog.is_ready():
+        return curriculum_catalog.find_subbab(title)
+    query = _client().collection("sub_bab").where("title", "==", title).limit(1)
+    subbabs = await _collect(query, _to_subbab)
+    return subbabs[0] if subbabs else None
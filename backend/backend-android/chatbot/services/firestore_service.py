@@ -9,9 +9,12 @@ try:
     credentials_path = getenv("GOOGLE_APPLICATION_CREDENTIALS")
     if credentials_path:
         db = firestore.Client.from_service_account_json(credentials_path)
+        async_db = firestore.AsyncClient.from_service_account_json(credentials_path)
     else:
         db = firestore.Client()
+        async_db = firestore.AsyncClient()
     logging.info("✅ Firestore client berhasil diinisialisasi")
 except Exception as e:
     logging.error(f"❌ Gagal menginisialisasi Firestore client: {str(e)}")
-    db = None
\ No newline at end of file
+    db = None
+    async_db = None
\ No newline at end of file
@@ -0,0 +1,147 @@
+"""
+Circuit breaker dan timeout adaptif untuk Gemini API (per proses).
+
+Setiap panggilan dicatat di jendela bergulir GEMINI_BREAKER_WINDOW detik:
+- sukses beserta latensinya (total untuk generateContent, waktu sampai potongan
+  pertama untuk streaming)
+- gagal: timeout, error koneksi, HTTP 5xx/429
+
+State:
+    closed     normal
+    open       error rate atau rasio panggilan lambat melewati batas; semua
+               panggilan langsung ditolak selama GEMINI_BREAKER_COOLDOWN detik
+    half_open  setelah cooldown, satu panggilan percobaan diizinkan; sukses
+               menutup circuit, gagal membukanya lagi
+
+Read timeout diambil dari p95 latensi yang teramati × GEMINI_TIMEOUT_MULTIPLIER,
+dibatasi antara GEMINI_MIN_READ_TIMEOUT dan GEMINI_READ_TIMEOUT.
+"""
+
+from collections import deque
+from os import getenv
+from typing import Deque, Dict, Tuple
+import logging
+import threading
+import time
+
+GEMINI_BREAKER_WINDOW = float(getenv("GEMINI_BREAKER_WINDOW", "60"))
+GEMINI_BREAKER_MIN_CALLS = int(getenv("GEMINI_BREAKER_MIN_CALLS", "10"))
+GEMINI_BREAKER_ERROR_RATE = float(getenv("GEMINI_BREAKER_ERROR_RATE", "0.5"))
+GEMINI_BREAKER_SLOW_RATE = float(getenv("GEMINI_BREAKER_SLOW_RATE", "0.8"))
+GEMINI_BREAKER_SLOW_MS = float(getenv("GEMINI_BREAKER_SLOW_MS", "20000"))
+GEMINI_BREAKER_COOLDOWN = float(getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+GEMINI_TIMEOUT_MULTIPLIER = float(getenv("GEMINI_TIMEOUT_MULTIPLIER", "2.0"))
+GEMINI_MIN_READ_TIMEOUT = float(getenv("GEMINI_MIN_READ_TIMEOUT", "5"))
+GEMINI_READ_TIMEOUT = float(getenv("GEMINI_READ_TIMEOUT", "30"))
+LATENCY_MIN_SAMPLES = 20
+LATENCY_MAX_SAMPLES = 200
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+        # (waktu, sukses, lambat)
+        self._outcomes: Deque[Tuple[float, bool, bool]] = deque()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._rejected = 0
+
+    def _prune(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > GEMINI_BREAKER_WINDOW:
+            self._outcomes.popleft()
+
+    def allow(self) -> bool:
+        """False jika circuit terbuka; pemanggil harus langsung gagal."""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_OPEN and now - self._opened_at >= GEMINI_BREAKER_COOLDOWN:
+                self._state = STATE_HALF_OPEN
+                self._probe_started = 0.0
+            if self._state == STATE_HALF_OPEN:
+                # Satu percobaan sekaligus; percobaan yang hasilnya tidak tercatat
+                # (mis. error 400) dianggap selesai setelah satu cooldown
+                if not self._probe_started or now - self._probe_started >= GEMINI_BREAKER_COOLDOWN:
+                    self._probe_started = now
+                    return True
+            self._rejected += 1
+            return False
+
+    def record_success(self, mode: str, latency: float):
+        now = time.monotonic()
+        slow = latency * 1000 >= GEMINI_BREAKER_SLOW_MS
+        with self._lock:
+            samples = self._latencies.setdefault(mode, deque(maxlen=LATENCY_MAX_SAMPLES))
+            samples.append(latency)
+            if self._state == STATE_HALF_OPEN:
+                logging.info("✅ Circuit breaker Gemini tertutup kembali")
+                self._state = STATE_CLOSED
+                self._outcomes.clear()
+            self._outcomes.append((now, True, slow))
+            self._evaluate(now)
+
+    def record_failure(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._open(now, "percobaan half-open gagal")
+                return
+            self._outcomes.append((now, False, False))
+            self._evaluate(now)
+
+    def _evaluate(self, now: float):
+        self._prune(now)
+        total = len(self._outcomes)
+        if self._state != STATE_CLOSED or total < GEMINI_BREAKER_MIN_CALLS:
+            return
+        errors = sum(1 for _, ok, _ in self._outcomes if not ok)
+        slow = sum(1 for _, ok, is_slow in self._outcomes if ok and is_slow)
+        if errors / total >= GEMINI_BREAKER_ERROR_RATE:
+            self._open(now, f"error rate {errors}/{total}")
+        elif slow / total >= GEMINI_BREAKER_SLOW_RATE:
+            self._open(now, f"panggilan lambat {slow}/{total}")
+
+    def _open(self, now: float, reason: str):
+        self._state = STATE_OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        logging.error(f"🔌 Circuit breaker Gemini terbuka selama {GEMINI_BREAKER_COOLDOWN:.0f} detik: {reason}")
+
+    def p95(self, mode: str) -> float:
+        with self._lock:
+            samples = sorted(self._latencies.get(mode, ()))
+        if len(samples) < LATENCY_MIN_SAMPLES:
+            return 0.0
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def read_timeout(self, mode: str) -> float:
+        p95 = self.p95(mode)
+        if not p95:
+            return GEMINI_READ_TIMEOUT
+        return min(GEMINI_READ_TIMEOUT, max(GEMINI_MIN_READ_TIMEOUT, p95 * GEMINI_TIMEOUT_MULTIPLIER))
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            total = len(self._outcomes)
+            errors = sum(1 for _, ok, _ in self._outcomes if not ok)
+            state = self._state
+            rejected = self._rejected
+            modes = list(self._latencies)
+        return {
+            "state": state,
+            "window_calls": total,
+            "window_errors": errors,
+            "rejected": rejected,
+            "read_timeout": {mode: round(self.read_timeout(mode), 2) for mode in modes},
+            "p95_ms": {mode: round(self.p95(mode) * 1000, 1) for mode in modes},
+        }
+
+gemini_breaker = CircuitBreaker()
@@ -0,0 +1,99 @@
+"""
+Progres generasi Gemini yang sedang di-stream.
+
+Selama streaming, potongan teks ditambahkan (APPEND) ke `{cache_key}:partial`
+sehingga `/check-gemini-result` bisa mengembalikan teks yang sudah jadi.
+Setelah jawaban lengkap disimpan di `cache_key`, key partial dihapus.
+
+Setiap potongan teks dan akhir generasi juga dipublikasikan ke channel Redis
+pub/sub `gemini:progress:{cache_key}` agar endpoint push (SSE) dan long-poll di
+semua worker gunicorn langsung mendapat kabar tanpa polling. Jika satu percobaan
+gagal tetapi job masih akan dicoba ulang, event `retry` dikirim dan teks parsial
+dibuang; event `failed` hanya dikirim saat kegagalan sudah final.
+
+Status:
+    complete  jawaban lengkap ada di cache_key
+    partial   baru sebagian teks yang tersedia
+    pending   belum ada teks sama sekali
+"""
+
+from chatbot.services.redis_client import redis_client
+from os import getenv
+from typing import Optional, Tuple
+import json
+import logging
+
+PARTIAL_TTL = int(getenv("GEMINI_PARTIAL_TTL", "300"))
+
+STATUS_COMPLETE = "complete"
+STATUS_PARTIAL = "partial"
+STATUS_PENDING = "pending"
+
+EVENT_CHUNK = "chunk"
+EVENT_COMPLETE = "complete"
+EVENT_FAILED = "failed"
+EVENT_RETRY = "retry"
+
+def _partial_key(cache_key: str) -> str:
+    return f"{cache_key}:partial"
+
+def progress_channel(cache_key: str) -> str:
+    return f"gemini:progress:{cache_key}"
+
+def _event(event_type: str, text: Optional[str] = None, end: Optional[int] = None) -> str:
+    return json.dumps({"type": event_type, "text": text, "end": end})
+
+async def append_partial(cache_key: str, text: str):
+    if not redis_client:
+        return
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.append(_partial_key(cache_key), text)
+            pipe.expire(_partial_key(cache_key), PARTIAL_TTL)
+            length, _ = await pipe.execute()
+        # `end` = panjang teks parsial (byte) setelah potongan ini, dipakai subscriber
+        # untuk melewati potongan yang sudah termasuk dalam snapshot awal
+        await redis_client.publish(progress_channel(cache_key), _event(EVENT_CHUNK, text, length))
+    except Exception as e:
+        logging.error(f"❌ Gagal menyimpan potongan jawaban untuk key {cache_key}: {str(e)}")
+
+async def clear_partial(cache_key: str):
+    if not redis_client:
+        return
+    try:
+        await redis_client.delete(_partial_key(cache_key))
+    except Exception as e:
+        logging.error(f"❌ Gagal menghapus potongan jawaban untuk key {cache_key}: {str(e)}")
+
+async def finish_progress(cache_key: str, saved: bool):
+    """Hapus teks parsial dan kabari subscriber bahwa generasi selesai atau gagal."""
+    if not redis_client:
+        return
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.delete(_partial_key(cache_key))
+            pipe.publish(progress_channel(cache_key), _event(EVENT_COMPLETE if saved else EVENT_FAILED))
+            await pipe.execute()
+    except Exception as e:
+        logging.error(f"❌ Gagal menutup progres generasi untuk key {cache_key}: {str(e)}")
+
+async def reset_progress(cache_key: str):
+    """Buang teks parsial percobaan yang gagal dan kabari subscriber bahwa generasi diulang."""
+    if not redis_client:
+        return
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.delete(_partial_key(cache_key))
+            pipe.publish(progress_channel(cache_key), _event(EVENT_RETRY))
+            await pipe.execute()
+    except Exception as e:
+        logging.error(f"❌ Gagal mereset progres generasi untuk key {cache_key}: {str(e)}")
+
+async def get_progress(cache_key: str) -> Tuple[str, Optional[str]]:
+    """Kembalikan (status, teks) untuk cache_key dalam satu round trip Redis."""
+    final, partial = await redis_client.mget(cache_key, _partial_key(cache_key))
+    if final:
+        return STATUS_COMPLETE, final
+    if partial:
+        return STATUS_PARTIAL, partial
+    return STATUS_PENDING, None
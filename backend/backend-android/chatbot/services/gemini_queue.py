@@ -0,0 +1,71 @@
+"""
+Antrian job generasi Gemini berbasis Redis Streams.
+
+Web worker hanya menambahkan job ke stream (XADD). Proses `gemini_worker.py`
+membaca stream lewat consumer group, menjalankan generasi, lalu XACK.
+Job yang tidak di-ACK (worker mati/gagal) diklaim ulang setelah idle
+GEMINI_JOB_CLAIM_IDLE_MS, dan dipindah ke dead-letter stream setelah
+GEMINI_JOB_MAX_DELIVERIES kali percobaan.
+
+Sebelum XADD, antrian memastikan ada `gemini_worker.py` yang hidup (consumer
+dengan idle < GEMINI_WORKER_MAX_IDLE_MS di XINFO CONSUMERS). Tanpa worker,
+`enqueue_generation` mengembalikan False sehingga handler langsung memakai
+background task, bukan menunggu GEMINI_INLINE_BUDGET_MS untuk job yang tidak
+akan diproses. Hasil pengecekan disimpan GEMINI_WORKER_CHECK_TTL detik.
+"""
+
+from chatbot.services.redis_client import redis_client
+from chatbot.services.stream_worker import StreamQueue
+from os import getenv
+import logging
+import time
+
+JOB_STREAM = getenv("GEMINI_JOB_STREAM", "gemini:jobs")
+DEAD_LETTER_STREAM = getenv("GEMINI_JOB_DEAD_LETTER_STREAM", "gemini:jobs:dead")
+CONSUMER_GROUP = getenv("GEMINI_JOB_GROUP", "gemini-workers")
+STREAM_MAXLEN = int(getenv("GEMINI_JOB_STREAM_MAXLEN", "10000"))
+MAX_DELIVERIES = int(getenv("GEMINI_JOB_MAX_DELIVERIES", "3"))
+CLAIM_IDLE_MS = int(getenv("GEMINI_JOB_CLAIM_IDLE_MS", "60000"))
+# Harus lebih besar dari blok XREADGROUP (5 detik) dan interval perpanjangan klaim (CLAIM_IDLE_MS/3)
+WORKER_MAX_IDLE_MS = int(getenv("GEMINI_WORKER_MAX_IDLE_MS", "30000"))
+WORKER_CHECK_TTL = float(getenv("GEMINI_WORKER_CHECK_TTL", "5"))
+
+job_queue = StreamQueue(JOB_STREAM, CONSUMER_GROUP, DEAD_LETTER_STREAM, maxlen=STREAM_MAXLEN,
+                        max_deliveries=MAX_DELIVERIES, claim_idle_ms=CLAIM_IDLE_MS)
+
+JOB_THEORY = "theory"
+JOB_CUSTOM = "custom"
+
+_worker_check = {"alive": False, "checked_at": float("-inf")}
+
+async def has_live_worker() -> bool:
+    """True jika ada gemini_worker yang masih membaca stream (hasil di-cache sebentar)."""
+    now = time.monotonic()
+    if now - _worker_check["checked_at"] < WORKER_CHECK_TTL:
+        return _worker_check["alive"]
+    try:
+        alive = await job_queue.live_consumers(WORKER_MAX_IDLE_MS, client=redis_client) > 0
+    except Exception as e:
+        logging.error(f"❌ Gagal mengecek worker Gemini: {str(e)}")
+        alive = False
+    if not alive and _worker_check["alive"]:
+        logging.warning("⚠️ Tidak ada gemini_worker yang aktif, job Gemini dikerjakan di proses web")
+    _worker_check.update(alive=alive, checked_at=now)
+    return alive
+
+async def enqueue_generation(kind: str, prompt: str, cache_key: str) -> bool:
+    """Tambahkan job generasi ke stream. False jika Redis atau gemini_worker tidak tersedia."""
+    if not redis_client or not await has_live_worker():
+        return False
+    try:
+        job_id = await redis_client.xadd(
+            JOB_STREAM,
+            {"kind": kind, "prompt": prompt, "cache_key": cache_key, "enqueued_at": str(time.time())},
+            maxlen=STREAM_MAXLEN,
+            approximate=True,
+        )
+        logging.info(f"📨 Job Gemini '{kind}' masuk antrian: {job_id} (key: {cache_key})")
+        return True
+    except Exception as e:
+        logging.error(f"❌ Gagal memasukkan job Gemini ke antrian: {str(e)}")
+        return False
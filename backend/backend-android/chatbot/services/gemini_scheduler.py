@@ -0,0 +1,226 @@
+"""
+Penjadwal panggilan Gemini: rate limit + batas konkurensi global dengan prioritas.
+
+Semua proses (worker gunicorn, `gemini_worker.py`, script pre-generation)
+berbagi state di Redis:
+- `gemini:sched:slots`   sorted set lease slot yang sedang dipakai (score = waktu kedaluwarsa)
+- `gemini:sched:bucket`  token bucket (GEMINI_RPS token/detik, maksimal GEMINI_BURST)
+Slot dan token diambil atomik lewat satu script Lua. Lease kedaluwarsa
+sendiri jika proses mati sebelum melepas slot; selama slot dipegang, lease
+diperpanjang setiap GEMINI_SLOT_LEASE_MS/3 sehingga panggilan yang lama tidak
+kehilangan slotnya (dan batas konkurensi tetap benar).
+
+Prioritas:
+    PRIORITY_HIGH    teori sub_bab dan refill cache yang deterministik
+    PRIORITY_NORMAL  pertanyaan custom dari siswa
+    PRIORITY_LOW     generasi massal (pre-generation)
+Prioritas lebih rendah hanya boleh memakai sebagian slot (GEMINI_RESERVED_SLOTS
+selalu disisakan untuk PRIORITY_HIGH), dan di dalam satu proses antrean
+dilayani berurutan menurut prioritas. Jika antrean penuh atau waktu tunggu
+habis, `GeminiBusy` dilempar agar pemanggil langsung menjawab "server sibuk".
+
+Tanpa Redis, penjadwal jatuh ke batas lokal per proses.
+"""
+
+from chatbot.services.redis_client import redis_client
+from contextlib import asynccontextmanager
+from os import getenv
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+import uuid
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_NAMES = {PRIORITY_HIGH: "high", PRIORITY_NORMAL: "normal", PRIORITY_LOW: "low"}
+
+GEMINI_MAX_CONCURRENCY = int(getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_RESERVED_SLOTS = int(getenv("GEMINI_RESERVED_SLOTS", "2"))
+GEMINI_RPS = float(getenv("GEMINI_RPS", "5"))
+GEMINI_BURST = float(getenv("GEMINI_BURST", "10"))
+GEMINI_MAX_QUEUE = int(getenv("GEMINI_MAX_QUEUE", "50"))
+GEMINI_QUEUE_TIMEOUT = float(getenv("GEMINI_QUEUE_TIMEOUT", "10"))
+GEMINI_SLOT_LEASE_MS = int(getenv("GEMINI_SLOT_LEASE_MS", "60000"))
+
+SLOTS_KEY = "gemini:sched:slots"
+BUCKET_KEY = "gemini:sched:bucket"
+POLL_INTERVAL = 0.05
+
+# Return: 0 = slot didapat, -1 = slot penuh, >0 = tunggu sekian ms untuk token
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local limit = tonumber(ARGV[1])
+local lease = tonumber(ARGV[2])
+local rate = tonumber(ARGV[3])
+local burst = tonumber(ARGV[4])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= limit then
+    return -1
+end
+if rate > 0 then
+    local bucket = redis.call('HMGET', KEYS[2], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + (now - ts) * rate)
+    if tokens < 1 then
+        redis.call('HSET', KEYS[2], 'tokens', tostring(tokens), 'ts', now)
+        return math.ceil((1 - tokens) / rate)
+    end
+    redis.call('HSET', KEYS[2], 'tokens', tostring(tokens - 1), 'ts', now)
+    redis.call('PEXPIRE', KEYS[2], 60000)
+end
+redis.call('ZADD', KEYS[1], now + lease, ARGV[5])
+return 0
+"""
+
+_RENEW_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+return redis.call('ZADD', KEYS[1], 'XX', 'CH', now + tonumber(ARGV[1]), ARGV[2])
+"""
+
+class GeminiBusy(Exception):
+    """Kapasitas Gemini sedang penuh; pemanggil sebaiknya langsung menolak."""
+
+def priority_limit(priority: int) -> int:
+    """Jumlah slot global yang boleh dipakai oleh prioritas ini."""
+    if priority <= PRIORITY_HIGH:
+        return GEMINI_MAX_CONCURRENCY
+    limit = GEMINI_MAX_CONCURRENCY - GEMINI_RESERVED_SLOTS
+    if priority >= PRIORITY_LOW:
+        limit = min(limit, GEMINI_MAX_CONCURRENCY // 2)
+    return max(1, limit)
+
+class GeminiScheduler:
+    def __init__(self, client):
+        self._client = client
+        self._script = client.register_script(_ACQUIRE_SCRIPT) if client else None
+        self._renew_script = client.register_script(_RENEW_SCRIPT) if client else None
+        self._queue: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._waiting: Dict[int, int] = {p: 0 for p in PRIORITY_NAMES}
+        self._local_active = 0
+        self._local_tokens = GEMINI_BURST
+        self._local_ts = time.monotonic()
+        self._stats = {
+            name: {"granted": 0, "rejected": 0, "wait_ms_total": 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+
+    async def _try_acquire(self, priority: int, lease_id: str) -> Tuple[int, bool]:
+        """(hasil script, apakah slot lokal). Hasil: 0 didapat, -1 penuh, >0 ms tunggu token."""
+        limit = priority_limit(priority)
+        if self._script is not None:
+            try:
+                result = await self._script(
+                    keys=[SLOTS_KEY, BUCKET_KEY],
+                    args=[limit, GEMINI_SLOT_LEASE_MS, GEMINI_RPS / 1000.0, GEMINI_BURST, lease_id],
+                )
+                return int(result), False
+            except Exception as e:
+                logging.error(f"❌ Penjadwal Gemini gagal mengakses Redis, memakai batas lokal: {str(e)}")
+        # Fallback lokal (tanpa Redis atau Redis error)
+        if self._local_active >= limit:
+            return -1, True
+        if GEMINI_RPS > 0:
+            now = time.monotonic()
+            self._local_tokens = min(GEMINI_BURST, self._local_tokens + (now - self._local_ts) * GEMINI_RPS)
+            self._local_ts = now
+            if self._local_tokens < 1:
+                return int((1 - self._local_tokens) / GEMINI_RPS * 1000) + 1, True
+            self._local_tokens -= 1
+        self._local_active += 1
+        return 0, True
+
+    async def _release(self, lease_id: str, local: bool):
+        if local:
+            self._local_active -= 1
+        else:
+            try:
+                await self._client.zrem(SLOTS_KEY, lease_id)
+            except Exception as e:
+                logging.error(f"❌ Gagal melepas slot Gemini {lease_id}: {str(e)}")
+        self._wakeup.set()
+
+    async def acquire(self, priority: int, timeout: float = GEMINI_QUEUE_TIMEOUT) -> Tuple[str, bool]:
+        name = PRIORITY_NAMES[priority]
+        if self._waiting[priority] >= GEMINI_MAX_QUEUE:
+            self._stats[name]["rejected"] += 1
+            raise GeminiBusy(f"antrean Gemini prioritas {name} penuh")
+
+        ticket = (priority, next(self._seq))
+        heapq.heappush(self._queue, ticket)
+        self._waiting[priority] += 1
+        lease_id = uuid.uuid4().hex
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + timeout
+        try:
+            while True:
+                delay = POLL_INTERVAL
+                if self._queue[0] == ticket:
+                    result, local = await self._try_acquire(priority, lease_id)
+                    if result == 0:
+                        self._stats[name]["granted"] += 1
+                        self._stats[name]["wait_ms_total"] += (loop.time() - started) * 1000
+                        return lease_id, local
+                    if result > 0:
+                        delay = result / 1000.0
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    self._stats[name]["rejected"] += 1
+                    raise GeminiBusy(f"menunggu slot Gemini lebih dari {timeout:.0f} detik")
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, remaining))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._waiting[priority] -= 1
+            self._wakeup.set()
+
+    async def _keep_lease(self, lease_id: str):
+        while True:
+            await asyncio.sleep(GEMINI_SLOT_LEASE_MS / 3000)
+            try:
+                await self._renew_script(keys=[SLOTS_KEY], args=[GEMINI_SLOT_LEASE_MS, lease_id])
+            except Exception as e:
+                logging.error(f"❌ Gagal memperpanjang slot Gemini {lease_id}: {str(e)}")
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_NORMAL):
+        lease_id, local = await self.acquire(priority)
+        keeper = None if local else asyncio.create_task(self._keep_lease(lease_id))
+        try:
+            yield
+        finally:
+            if keeper is not None:
+                keeper.cancel()
+            await self._release(lease_id, local)
+
+    async def stats(self) -> dict:
+        active: Optional[int] = None
+        if self._client is not None:
+            try:
+                active = await self._client.zcount(SLOTS_KEY, time.time() * 1000, "+inf")
+            except Exception as e:
+                logging.error(f"❌ Gagal membaca slot Gemini: {str(e)}")
+        return {
+            "max_concurrency": GEMINI_MAX_CONCURRENCY,
+            "reserved_high": GEMINI_RESERVED_SLOTS,
+            "rps": GEMINI_RPS,
+            "burst": GEMINI_BURST,
+            "active_global": active,
+            "waiting_local": {PRIORITY_NAMES[p]: n for p, n in self._waiting.items()},
+            "priorities": self._stats,
+        }
+
+gemini_scheduler = GeminiScheduler(redis_client)
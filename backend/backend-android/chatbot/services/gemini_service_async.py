@@ -1,7 +1,14 @@
 import httpx
 from os import getenv
+from typing import Awaitable, Callable, Optional, Tuple
 from dotenv import load_dotenv
+from chatbot.services.gemini_scheduler import gemini_scheduler, GeminiBusy, PRIORITY_NORMAL
+from chatbot.services.gemini_breaker import gemini_breaker, GEMINI_READ_TIMEOUT
+import asyncio
+import json
 import logging
+import random
+import time
 
 load_dotenv()
 
@@ -9,34 +16,210 @@ GEMINI_API_KEY = getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     logging.error("❌ GEMINI_API_KEY tidak ditemukan di environment variables")
     GEMINI_ENDPOINT = None
+    GEMINI_STREAM_ENDPOINT = None
 else:
     GEMINI_ENDPOINT = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={GEMINI_API_KEY}"
+    GEMINI_STREAM_ENDPOINT = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:streamGenerateContent?alt=sse&key={GEMINI_API_KEY}"
 
-async def chat_with_gemini_api(user_message: str) -> str:
+GEMINI_STREAMING = getenv("GEMINI_STREAMING", "true").lower() == "true"
+
+GEMINI_HTTP2 = getenv("GEMINI_HTTP2", "true").lower() == "true"
+GEMINI_MAX_CONNECTIONS = int(getenv("GEMINI_MAX_CONNECTIONS", "20"))
+GEMINI_MAX_KEEPALIVE = int(getenv("GEMINI_MAX_KEEPALIVE", "10"))
+GEMINI_KEEPALIVE_EXPIRY = float(getenv("GEMINI_KEEPALIVE_EXPIRY", "60"))
+GEMINI_CONNECT_TIMEOUT = float(getenv("GEMINI_CONNECT_TIMEOUT", "5"))
+GEMINI_WRITE_TIMEOUT = float(getenv("GEMINI_WRITE_TIMEOUT", "10"))
+GEMINI_POOL_TIMEOUT = float(getenv("GEMINI_POOL_TIMEOUT", "5"))
+GEMINI_MAX_RETRIES = int(getenv("GEMINI_MAX_RETRIES", "2"))
+GEMINI_RETRY_BASE = float(getenv("GEMINI_RETRY_BASE", "0.5"))
+GEMINI_RETRY_MAX = float(getenv("GEMINI_RETRY_MAX", "4"))
+
+class GeminiError(Exception):
+    """Panggilan Gemini gagal; str(e) berisi pesan yang aman ditampilkan ke user."""
+
+_client: Optional[httpx.AsyncClient] = None
+
+def _build_client() -> httpx.AsyncClient:
+    http2 = GEMINI_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logging.warning("⚠️ Paket h2 tidak terpasang, client Gemini memakai HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=GEMINI_MAX_CONNECTIONS,
+            max_keepalive_connections=GEMINI_MAX_KEEPALIVE,
+            keepalive_expiry=GEMINI_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=GEMINI_CONNECT_TIMEOUT,
+            read=GEMINI_READ_TIMEOUT,
+            write=GEMINI_WRITE_TIMEOUT,
+            pool=GEMINI_POOL_TIMEOUT,
+        ),
+        headers={"Content-Type": "application/json"},
+    )
+
+async def startup_gemini_client():
+    """Buat client HTTP Gemini bersama (dipanggil saat startup aplikasi)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+        logging.info("✅ Client HTTP Gemini siap (pooled, keep-alive)")
+
+async def shutdown_gemini_client():
+    """Tutup client HTTP Gemini bersama (dipanggil saat shutdown aplikasi)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logging.info("🔌 Client HTTP Gemini ditutup")
+
+def get_gemini_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        # Proses tanpa lifecycle FastAPI (mis. script CLI) tetap mendapat client bersama
+        _client = _build_client()
+    return _client
+
+def _extract_text(data: dict) -> str:
+    parts = data["candidates"][0].get("content", {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts)
+
+async def _stream_generate(client: httpx.AsyncClient, payload: dict, timeout: httpx.Timeout,
+                           on_chunk: Callable[[str], Awaitable[None]]) -> Tuple[str, float]:
+    """
+    Panggil streamGenerateContent (SSE) dan teruskan setiap potongan teks ke on_chunk.
+    Kembalikan (jawaban, detik sampai potongan pertama).
+    """
+    chunks = []
+    started = time.monotonic()
+    first_chunk_at = 0.0
+    async with client.stream("POST", GEMINI_STREAM_ENDPOINT, json=payload, timeout=timeout) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            text = _extract_text(json.loads(line[5:]))
+            if text:
+                if not chunks:
+                    first_chunk_at = time.monotonic() - started
+                chunks.append(text)
+                await on_chunk(text)
+    if not chunks:
+        raise KeyError("stream Gemini tidak berisi teks")
+    return "".join(chunks), first_chunk_at
+
+async def _generate(client: httpx.AsyncClient, payload: dict, timeout: httpx.Timeout) -> Tuple[str, float]:
+    started = time.monotonic()
+    response = await client.post(GEMINI_ENDPOINT, json=payload, timeout=timeout)
+    response.raise_for_status()
+    data = response.json()
+    text = data["candidates"][0]["content"]["parts"][0]["text"]
+    if not text:
+        raise KeyError("jawaban Gemini kosong")
+    return text, time.monotonic() - started
+
+def _is_transient(response: httpx.Response) -> bool:
+    return response.status_code == 429 or response.status_code >= 500
+
+def _retry_delay(attempt: int, response: httpx.Response) -> float:
+    """Backoff eksponensial dengan full jitter; Retry-After dihormati jika ada."""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), GEMINI_RETRY_MAX)
+    return random.uniform(0, min(GEMINI_RETRY_MAX, GEMINI_RETRY_BASE * (2 ** attempt)))
+
+async def _call_with_retry(client: httpx.AsyncClient, payload: dict,
+                           on_chunk: Optional[Callable[[str], Awaitable[None]]], priority: int) -> str:
+    """
+    Setiap percobaan mengambil slot `gemini_scheduler` sendiri; slot dilepas
+    sebelum sleep backoff agar tidak menahan kapasitas global selama menunggu.
+    """
+    mode = "stream" if on_chunk else "generate"
+    timeout = httpx.Timeout(
+        connect=GEMINI_CONNECT_TIMEOUT,
+        read=gemini_breaker.read_timeout(mode),
+        write=GEMINI_WRITE_TIMEOUT,
+        pool=GEMINI_POOL_TIMEOUT,
+    )
+    streamed = False
+
+    async def forward(text: str):
+        nonlocal streamed
+        streamed = True
+        await on_chunk(text)
+
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        try:
+            async with gemini_scheduler.slot(priority):
+                if on_chunk:
+                    jawaban, latency = await _stream_generate(client, payload, timeout, forward)
+                else:
+                    jawaban, latency = await _generate(client, payload, timeout)
+        except httpx.HTTPStatusError as e:
+            if not _is_transient(e.response):
+                raise
+            gemini_breaker.record_failure()
+            if attempt >= GEMINI_MAX_RETRIES or streamed or not gemini_breaker.allow():
+                raise
+            delay = _retry_delay(attempt, e.response)
+            logging.warning(f"🔁 Gemini membalas {e.response.status_code}, coba lagi dalam {delay:.2f} detik "
+                            f"(percobaan {attempt + 2}/{GEMINI_MAX_RETRIES + 1})")
+            await asyncio.sleep(delay)
+            continue
+        except httpx.TransportError:
+            # Timeout dan error koneksi: dicatat untuk circuit breaker, tidak diulang
+            gemini_breaker.record_failure()
+            raise
+        gemini_breaker.record_success(mode, latency)
+        return jawaban
+
+async def chat_with_gemini_api(user_message: str,
+                               on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+                               priority: int = PRIORITY_NORMAL) -> str:
+    """
+    Kirim prompt ke Gemini dan kembalikan jawaban lengkap (tidak pernah kosong).
+    Jika on_chunk diberikan (dan GEMINI_STREAMING aktif), jawaban diambil lewat
+    streaming dan on_chunk dipanggil untuk setiap potongan teks yang masuk.
+    Panggilan menunggu slot dari `gemini_scheduler` sesuai prioritas. Kegagalan
+    apa pun (kapasitas penuh, circuit breaker terbuka, timeout, HTTP error,
+    respons tidak valid) dilempar sebagai `GeminiError`, bukan dikembalikan
+    sebagai teks, jadi jawaban asli tidak pernah tertukar dengan pesan error.
+    """
     if not user_message:
-        return "❗ Pertanyaan tidak boleh kosong."
+        raise GeminiError("❗ Pertanyaan tidak boleh kosong.")
     
     if not GEMINI_ENDPOINT:
-        return "❌ Konfigurasi Gemini API tidak valid."
+        raise GeminiError("❌ Konfigurasi Gemini API tidak valid.")
+
+    if not gemini_breaker.allow():
+        logging.warning("🔌 Circuit breaker Gemini terbuka, permintaan langsung ditolak")
+        raise GeminiError("🌐 Maaf, layanan AI sedang gangguan. Silakan coba lagi beberapa saat lagi.")
 
     payload = {"contents": [{"parts": [{"text": user_message}]}]}
-    headers = {"Content-Type": "application/json"}
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(GEMINI_ENDPOINT, json=payload, headers=headers, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            return data["candidates"][0]["content"]["parts"][0]["text"]
-        except httpx.TimeoutException:
-            logging.error("⏰ Timeout saat memanggil Gemini API")
-            return "⏰ Maaf, server sedang sibuk. Silakan coba lagi dalam beberapa saat."
-        except httpx.RequestError as e:
-            logging.error(f"🌐 Error koneksi ke Gemini API: {str(e)}")
-            return "🌐 Maaf, terjadi masalah koneksi. Silakan coba lagi."
-        except (KeyError, IndexError) as e:
-            logging.error(f"📄 Error parsing response Gemini: {str(e)}")
-            return "📄 Maaf, terjadi kesalahan dalam memproses jawaban."
-        except Exception as e:
-            logging.error(f"❌ Error tidak terduga di Gemini API: {str(e)}")
-            return "❌ Maaf, terjadi kesalahan. Silakan coba lagi."
\ No newline at end of file
+    client = get_gemini_client()
+    try:
+        return await _call_with_retry(client, payload, on_chunk if GEMINI_STREAMING else None, priority)
+    except GeminiBusy as e:
+        logging.warning(f"⏰ Gemini sedang penuh, permintaan ditolak: {str(e)}")
+        raise GeminiError("⏰ Maaf, server sedang sibuk. Silakan coba lagi dalam beberapa saat.") from e
+    except httpx.TimeoutException as e:
+        logging.error("⏰ Timeout saat memanggil Gemini API")
+        raise GeminiError("⏰ Maaf, server sedang sibuk. Silakan coba lagi dalam beberapa saat.") from e
+    except httpx.HTTPStatusError as e:
+        logging.error(f"🌐 Gemini API membalas HTTP {e.response.status_code}")
+        raise GeminiError("🌐 Maaf, layanan AI sedang bermasalah. Silakan coba lagi.") from e
+    except httpx.RequestError as e:
+        logging.error(f"🌐 Error koneksi ke Gemini API: {str(e)}")
+        raise GeminiError("🌐 Maaf, terjadi masalah koneksi. Silakan coba lagi.") from e
+    except (KeyError, IndexError, ValueError) as e:
+        logging.error(f"📄 Error parsing response Gemini: {str(e)}")
+        raise GeminiError("📄 Maaf, terjadi kesalahan dalam memproses jawaban.") from e
+    except Exception as e:
+        logging.error(f"❌ Error tidak terduga di Gemini API: {str(e)}")
+        raise GeminiError("❌ Maaf, terjadi kesalahan. Silakan coba lagi.") from e
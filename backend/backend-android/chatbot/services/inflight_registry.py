@@ -0,0 +1,56 @@
+"""
+Registry generasi Gemini yang sedang berjalan, disimpan di Redis agar
+berlaku lintas worker gunicorn.
+
+Sebelum menjadwalkan generasi untuk sebuah cache_key, handler mengklaim key
+tersebut dengan SET NX. Request lain dengan cache_key yang sama tidak
+memulai panggilan Gemini baru; mereka cukup mem-polling hasil yang sama.
+TTL menjaga klaim tidak tertinggal selamanya jika worker mati di tengah jalan;
+selama job masih antre, diproses, atau menunggu dicoba ulang, `gemini_worker.py`
+memperbarui klaimnya secara berkala.
+"""
+
+from chatbot.services.redis_client import redis_client
+from os import getenv
+import logging
+
+INFLIGHT_TTL = int(getenv("GEMINI_INFLIGHT_TTL", "120"))
+
+def _inflight_key(cache_key: str) -> str:
+    return f"inflight:{cache_key}"
+
+async def claim_generation(cache_key: str) -> bool:
+    """True jika pemanggil berhak menjalankan generasi untuk cache_key ini."""
+    if not redis_client:
+        return True
+    try:
+        return bool(await redis_client.set(_inflight_key(cache_key), "1", nx=True, ex=INFLIGHT_TTL))
+    except Exception as e:
+        logging.error(f"❌ Gagal klaim generasi untuk key {cache_key}: {str(e)}")
+        return True
+
+async def refresh_generation(cache_key: str):
+    """Perpanjang klaim (atau pasang lagi jika sudah expire) selama job masih berjalan."""
+    if not redis_client:
+        return
+    try:
+        await redis_client.set(_inflight_key(cache_key), "1", ex=INFLIGHT_TTL)
+    except Exception as e:
+        logging.error(f"❌ Gagal memperpanjang klaim generasi untuk key {cache_key}: {str(e)}")
+
+async def release_generation(cache_key: str):
+    if not redis_client:
+        return
+    try:
+        await redis_client.delete(_inflight_key(cache_key))
+    except Exception as e:
+        logging.error(f"❌ Gagal melepas klaim generasi untuk key {cache_key}: {str(e)}")
+
+async def is_generating(cache_key: str) -> bool:
+    if not redis_client:
+        return False
+    try:
+        return bool(await redis_client.exists(_inflight_key(cache_key)))
+    except Exception as e:
+        logging.error(f"❌ Gagal cek status generasi untuk key {cache_key}: {str(e)}")
+        return False
@@ -0,0 +1,64 @@
+"""
+Anggaran waktu jawaban inline untuk webhook Dialogflow.
+
+Dialogflow menunggu webhook sekitar 5 detik. Setelah generasi dijadwalkan,
+handler menunggu hasilnya lewat pub/sub sampai GEMINI_INLINE_BUDGET_MS
+(dihitung sejak handler mulai). Jika jawaban selesai dalam anggaran itu,
+jawaban langsung dikirim; jika tidak, handler kembali ke alur
+"Jawaban sedang diproses…" + polling, dan job tetap berjalan sampai masuk cache.
+
+Hasil tiap permintaan dicatat di hash Redis `gemini:answer_stats` agar rasio
+cache hit / inline / deferred terlihat lintas worker.
+"""
+
+from chatbot.services.redis_client import redis_client
+from chatbot.services.gemini_progress import STATUS_COMPLETE
+from chatbot.services.progress_hub import wait_for_result
+from os import getenv
+from typing import Optional
+import logging
+import time
+
+GEMINI_INLINE_BUDGET_MS = int(getenv("GEMINI_INLINE_BUDGET_MS", "3500"))
+STATS_KEY = "gemini:answer_stats"
+
+OUTCOME_CACHE_HIT = "cache_hit"
+OUTCOME_INLINE = "inline"
+OUTCOME_DEFERRED = "deferred"
+OUTCOMES = (OUTCOME_CACHE_HIT, OUTCOME_INLINE, OUTCOME_DEFERRED)
+
+async def wait_inline(cache_key: str, started: float) -> Optional[str]:
+    """Tunggu jawaban sampai sisa anggaran inline habis; None jika belum selesai."""
+    remaining = GEMINI_INLINE_BUDGET_MS / 1000 - (time.monotonic() - started)
+    if remaining <= 0:
+        return None
+    try:
+        status, text = await wait_for_result(cache_key, remaining)
+    except Exception as e:
+        logging.error(f"❌ Gagal menunggu jawaban inline untuk key {cache_key}: {str(e)}")
+        return None
+    return text if status == STATUS_COMPLETE else None
+
+async def record_outcome(kind: str, outcome: str):
+    if not redis_client:
+        return
+    try:
+        await redis_client.hincrby(STATS_KEY, f"{kind}:{outcome}", 1)
+    except Exception as e:
+        logging.error(f"❌ Gagal mencatat statistik jawaban: {str(e)}")
+
+async def get_outcome_stats() -> dict:
+    """Jumlah dan rasio cache_hit / inline / deferred per jenis (theory, custom)."""
+    if not redis_client:
+        return {}
+    raw = await redis_client.hgetall(STATS_KEY)
+    stats = {}
+    for field, value in raw.items():
+        kind, _, outcome = field.partition(":")
+        stats.setdefault(kind, {name: 0 for name in OUTCOMES})[outcome] = int(value)
+    for counts in stats.values():
+        total = sum(counts[name] for name in OUTCOMES)
+        counts["total"] = total
+        for name in OUTCOMES:
+            counts[f"{name}_ratio"] = round(counts[name] / total, 3) if total else 0.0
+    return stats
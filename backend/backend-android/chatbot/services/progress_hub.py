@@ -0,0 +1,177 @@
+"""
+Fan-out event progres Gemini ke client SSE / long-poll dalam satu proses.
+
+Satu koneksi Redis pub/sub per proses dipakai bersama oleh semua client yang
+menunggu. Channel `gemini:progress:{cache_key}` di-subscribe saat client pertama
+untuk key itu datang dan di-unsubscribe saat client terakhir pergi. Generator
+(web worker maupun `gemini_worker.py`) mempublikasikan event lewat
+`gemini_progress`, jadi client di worker gunicorn mana pun ikut menerima.
+"""
+
+from chatbot.services.redis_client import redis_client
+from chatbot.services.gemini_progress import (
+    progress_channel, get_progress,
+    EVENT_CHUNK, EVENT_COMPLETE, EVENT_FAILED, EVENT_RETRY, STATUS_COMPLETE, STATUS_PARTIAL,
+)
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+
+class ProgressHub:
+    def __init__(self, client):
+        self._client = client
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._lock = asyncio.Lock()
+        self._closing = False
+
+    async def subscribe(self, cache_key: str) -> asyncio.Queue:
+        channel = progress_channel(cache_key)
+        queue: asyncio.Queue = asyncio.Queue()
+        async with self._lock:
+            if self._pubsub is None:
+                self._pubsub = self._client.pubsub()
+            queues = self._subscribers.setdefault(channel, set())
+            if not queues:
+                await self._pubsub.subscribe(channel)
+            queues.add(queue)
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read_loop())
+        return queue
+
+    async def unsubscribe(self, cache_key: str, queue: asyncio.Queue):
+        channel = progress_channel(cache_key)
+        async with self._lock:
+            queues = self._subscribers.get(channel)
+            if not queues:
+                return
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[channel]
+                try:
+                    await self._pubsub.unsubscribe(channel)
+                except Exception as e:
+                    logging.error(f"❌ Gagal unsubscribe channel {channel}: {str(e)}")
+
+    @asynccontextmanager
+    async def listen(self, cache_key: str):
+        queue = await self.subscribe(cache_key)
+        try:
+            yield queue
+        finally:
+            await self.unsubscribe(cache_key, queue)
+
+    async def _read_loop(self):
+        while not self._closing:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except Exception as e:
+                logging.error(f"❌ Gagal membaca pub/sub progres Gemini: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            if not message or message.get("type") != "message":
+                continue
+            try:
+                event = json.loads(message["data"])
+            except ValueError:
+                continue
+            for queue in list(self._subscribers.get(message["channel"], ())):
+                queue.put_nowait(event)
+
+    def stats(self) -> dict:
+        return {
+            "channels": len(self._subscribers),
+            "listeners": sum(len(queues) for queues in self._subscribers.values()),
+        }
+
+    async def close(self):
+        # Reader berhenti sendiri dalam satu siklus get_message (timeout 1 detik)
+        self._closing = True
+        if self._reader is not None:
+            try:
+                await asyncio.wait_for(self._reader, timeout=3)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        self._subscribers.clear()
+
+progress_hub: Optional[ProgressHub] = ProgressHub(redis_client) if redis_client else None
+
+async def wait_for_result(cache_key: str, timeout: float) -> Tuple[str, Optional[str]]:
+    """Long-poll: tunggu sampai jawaban lengkap, gagal, atau timeout, lalu kembalikan progres terakhir."""
+    if not progress_hub or timeout <= 0:
+        return await get_progress(cache_key)
+    async with progress_hub.listen(cache_key) as queue:
+        # Subscribe dulu baru cek state, supaya event complete tidak terlewat di antaranya
+        status, text = await get_progress(cache_key)
+        if status == STATUS_COMPLETE:
+            return status, text
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if event.get("type") in (EVENT_COMPLETE, EVENT_FAILED):
+                break
+    return await get_progress(cache_key)
+
+async def iter_progress(cache_key: str, timeout: float, keepalive: float = 15.0):
+    """
+    Yield event (type, text) untuk satu cache_key:
+    - ("partial", teks_sejauh_ini) sekali di awal jika streaming sudah berjalan
+    - ("chunk", potongan_baru) untuk setiap potongan berikutnya
+    - ("retry", None) jika percobaan gagal dan generasi diulang; teks sebelumnya dibuang
+    - ("complete", jawaban_lengkap) atau ("failed", None) lalu berhenti
+    - ("keepalive", None) jika tidak ada event selama `keepalive` detik
+    - ("timeout", None) jika melewati `timeout`
+    """
+    async with progress_hub.listen(cache_key) as queue:
+        status, text = await get_progress(cache_key)
+        if status == STATUS_COMPLETE:
+            yield EVENT_COMPLETE, text
+            return
+        sent = len(text.encode("utf-8")) if status == STATUS_PARTIAL else 0
+        if sent:
+            yield STATUS_PARTIAL, text
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                yield "timeout", None
+                return
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=min(keepalive, remaining))
+            except asyncio.TimeoutError:
+                if loop.time() < deadline:
+                    yield "keepalive", None
+                continue
+            event_type = event.get("type")
+            if event_type == EVENT_CHUNK:
+                # Potongan yang sudah termasuk di snapshot awal tidak dikirim dua kali
+                end = event.get("end") or 0
+                if end > sent and event.get("text"):
+                    sent = end
+                    yield EVENT_CHUNK, event["text"]
+            elif event_type == EVENT_COMPLETE:
+                status, text = await get_progress(cache_key)
+                yield (EVENT_COMPLETE, text) if status == STATUS_COMPLETE else (EVENT_FAILED, None)
+                return
+            elif event_type == EVENT_RETRY:
+                # Percobaan berikutnya menulis teks parsial dari awal
+                sent = 0
+                yield EVENT_RETRY, None
+            elif event_type == EVENT_FAILED:
+                yield EVENT_FAILED, None
+                return
@@ -0,0 +1,109 @@
+"""
+Indeks near-duplicate lokal (per proses) untuk pertanyaan custom.
+
+MinHash atas shingle karakter dari pertanyaan yang sudah dinormalisasi, lalu
+LSH (banding) untuk mencari kandidat mirip tanpa membandingkan semua entri.
+Kandidat diterima jika estimasi Jaccard >= CUSTOM_NEAR_DUP_THRESHOLD dan
+bilangan, operator, serta kata hubung arah/logikanya sama persis
+(`exact_tokens`), jadi "2 + 3" tidak pernah dianggap mirip "2 - 3". Pertanyaan
+parafrase ("apa pecahan" vs "apa pecahan itu sebenarnya") bisa memakai jawaban
+yang sudah ada di Redis tanpa memanggil Gemini lagi.
+
+Indeks hanya berisi cache_key; jawaban tetap dibaca dari Redis, jadi entri
+yang jawabannya sudah expire cukup dilewati oleh pemanggil.
+"""
+
+from collections import OrderedDict
+from os import getenv
+from typing import Dict, List, Optional, Set, Tuple
+import hashlib
+import random
+import threading
+
+from chatbot.utils.question_normalizer import exact_tokens
+
+NEAR_DUP_ENABLED = getenv("CUSTOM_NEAR_DUP", "false").lower() == "true"
+NEAR_DUP_THRESHOLD = float(getenv("CUSTOM_NEAR_DUP_THRESHOLD", "0.8"))
+NEAR_DUP_MAX_ENTRIES = int(getenv("CUSTOM_NEAR_DUP_MAX_ENTRIES", "20000"))
+
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)  # seed tetap: signature stabil antar proses dan restart
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+def _shingles(text: str) -> Set[str]:
+    padded = f" {text} "
+    if len(padded) <= SHINGLE_SIZE:
+        return {padded}
+    return {padded[i:i + SHINGLE_SIZE] for i in range(len(padded) - SHINGLE_SIZE + 1)}
+
+def minhash(text: str) -> Tuple[int, ...]:
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big")
+              for s in _shingles(text)]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS)
+
+def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+def _bands(signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+    return [(band, signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+class NearDuplicateIndex:
+    def __init__(self, threshold: float = NEAR_DUP_THRESHOLD, max_entries: int = NEAR_DUP_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[int, ...]]" = OrderedDict()
+        self._exact: Dict[str, tuple] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, cache_key: str, normalized: str):
+        signature = minhash(normalized)
+        with self._lock:
+            if cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+                return
+            self._entries[cache_key] = signature
+            self._exact[cache_key] = exact_tokens(normalized)
+            for band in _bands(signature):
+                self._buckets.setdefault(band, set()).add(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._remove_locked(next(iter(self._entries)))
+
+    def remove(self, cache_key: str):
+        with self._lock:
+            self._remove_locked(cache_key)
+
+    def _remove_locked(self, cache_key: str):
+        signature = self._entries.pop(cache_key, None)
+        if signature is None:
+            return
+        self._exact.pop(cache_key, None)
+        for band in _bands(signature):
+            keys = self._buckets.get(band)
+            if keys:
+                keys.discard(cache_key)
+                if not keys:
+                    del self._buckets[band]
+
+    def query(self, normalized: str, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Kandidat (cache_key, kemiripan) di atas threshold, paling mirip lebih dulu."""
+        signature = minhash(normalized)
+        exact = exact_tokens(normalized)
+        with self._lock:
+            candidates = set()
+            for band in _bands(signature):
+                candidates |= self._buckets.get(band, set())
+            candidates.discard(exclude)
+            scored = [(key, similarity(signature, self._entries[key])) for key in candidates
+                      if self._exact.get(key) == exact]
+        return sorted([item for item in scored if item[1] >= self.threshold], key=lambda item: -item[1])
+
+    def __len__(self):
+        return len(self._entries)
+
+question_index: Optional[NearDuplicateIndex] = NearDuplicateIndex() if NEAR_DUP_ENABLED else None
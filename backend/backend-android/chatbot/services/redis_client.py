@@ -20,7 +20,19 @@ try:
         retry_on_timeout=True,
         health_check_interval=30
     )
+    # Client tanpa decode untuk payload yang disimpan sebagai JSON bytes siap kirim
+    redis_raw_client = redis.Redis(
+        host=redis_host,
+        port=redis_port,
+        password=redis_password,
+        decode_responses=False,
+        socket_connect_timeout=5,
+        socket_timeout=5,
+        retry_on_timeout=True,
+        health_check_interval=30
+    )
     logging.info("✅ Redis client berhasil diinisialisasi")
 except Exception as e:
     logging.error(f"❌ Gagal menginisialisasi Redis client: {str(e)}")
-    redis_client = None
\ No newline at end of file
+    redis_client = None
+    redis_raw_client = None
@@ -0,0 +1,252 @@
+"""
+Worker generik untuk antrian job berbasis Redis Streams.
+
+Dipakai bersama oleh `gemini_worker.py` (stream `gemini:jobs`) dan
+`email_worker.py` (stream `email:outbox`). Job dibaca lewat consumer group
+dan di-ACK setelah berhasil. Job yang gagal dibiarkan pending: stream yang
+mengatur percobaan ulang, yaitu job diklaim ulang setelah idle
+`claim_idle_ms` dan dipindah ke dead-letter setelah `max_deliveries`
+percobaan. Selama job diproses, worker memperbarui idle time job tersebut
+(XCLAIM JUSTID) agar tidak diklaim worker lain walau prosesnya lama.
+
+Subclass cukup mengisi `handle()` dan, jika perlu, hook `on_dead_letter()`,
+`on_open_job()`, `startup()`, dan `shutdown()`.
+"""
+
+from chatbot.services.redis_client import redis_client
+import asyncio
+import logging
+import signal
+import time
+
+READ_BLOCK_MS = 5000
+RECLAIM_INTERVAL = 30
+OPEN_JOBS_BATCH = 100
+
+class PermanentJobError(Exception):
+    """Job tidak akan berhasil walau dicoba ulang; langsung dipindah ke dead-letter."""
+
+class StreamQueue:
+    def __init__(self, stream: str, group: str, dead_letter_stream: str, maxlen: int = 10000,
+                 max_deliveries: int = 3, claim_idle_ms: int = 60000):
+        self.stream = stream
+        self.group = group
+        self.dead_letter_stream = dead_letter_stream
+        self.maxlen = maxlen
+        self.max_deliveries = max_deliveries
+        self.claim_idle_ms = claim_idle_ms
+
+    async def ensure_group(self, client=None):
+        client = client or redis_client
+        try:
+            await client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+            logging.info(f"✨ Consumer group '{self.group}' dibuat untuk stream '{self.stream}'")
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def live_consumers(self, max_idle_ms: int, client=None) -> int:
+        """
+        Jumlah consumer yang berinteraksi dengan stream dalam max_idle_ms terakhir.
+        Worker aktif me-reset idle lewat XREADGROUP (blok READ_BLOCK_MS) dan XCLAIM
+        perpanjangan job; consumer dari worker yang sudah mati terus bertambah idle-nya.
+        """
+        client = client or redis_client
+        try:
+            consumers = await client.xinfo_consumers(self.stream, self.group)
+        except Exception as e:
+            if "NOGROUP" in str(e) or "no such key" in str(e).lower():
+                return 0
+            raise
+        return sum(1 for consumer in consumers if consumer["idle"] < max_idle_ms)
+
+    async def dead_letter(self, job_id: str, fields: dict, reason: str, client=None):
+        """Pindahkan job ke dead-letter stream lalu ACK dari stream utama."""
+        client = client or redis_client
+        await client.xadd(
+            self.dead_letter_stream,
+            {**fields, "job_id": job_id, "reason": reason, "dead_at": str(time.time())},
+            maxlen=self.maxlen,
+            approximate=True,
+        )
+        await client.xack(self.stream, self.group, job_id)
+        logging.error(f"☠️ Job {job_id} dipindah ke dead-letter '{self.dead_letter_stream}': {reason}")
+
+class StreamWorker:
+    # Nama untuk log, mis. "Gemini" atau "email"
+    label = "stream"
+    # True jika subclass memakai on_open_job() untuk job yang masih antre/pending
+    tracks_open_jobs = False
+
+    def __init__(self, queue: StreamQueue, concurrency: int, consumer_name: str, client=None):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.consumer_name = consumer_name
+        self.client = client or redis_client
+        self.slots = asyncio.Semaphore(concurrency)
+        self.tasks = set()
+        self.stopping = asyncio.Event()
+
+    async def handle(self, job_id: str, fields: dict, attempt: int) -> bool:
+        """Proses satu job. True → ACK; False/exception → dicoba ulang oleh stream."""
+        raise NotImplementedError
+
+    async def on_dead_letter(self, job_id: str, fields: dict, reason: str):
+        pass
+
+    async def on_open_job(self, fields: dict):
+        """Dipanggil berkala untuk setiap job yang belum di-ACK (jika tracks_open_jobs)."""
+
+    async def startup(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def dead_letter(self, job_id: str, fields: dict, reason: str):
+        await self.queue.dead_letter(job_id, fields, reason, client=self.client)
+        await self.on_dead_letter(job_id, fields, reason)
+
+    async def _keep_claimed(self, job_id: str):
+        # Reset idle time tanpa menambah hitungan delivery selama job masih diproses
+        interval = self.queue.claim_idle_ms / 3000
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.client.xclaim(
+                    self.queue.stream, self.queue.group, self.consumer_name, 0, [job_id], justid=True,
+                )
+            except Exception as e:
+                logging.error(f"❌ Gagal memperpanjang klaim job {job_id}: {str(e)}")
+
+    async def process(self, job_id: str, fields: dict, attempt: int = 1):
+        keeper = asyncio.create_task(self._keep_claimed(job_id))
+        try:
+            try:
+                ok = await self.handle(job_id, fields, attempt)
+                error = None
+            except PermanentJobError as e:
+                await self.dead_letter(job_id, fields, str(e))
+                return
+            except Exception as e:
+                ok, error = False, str(e)
+            if ok:
+                await self.client.xack(self.queue.stream, self.queue.group, job_id)
+                logging.info(f"✅ Job {self.label} {job_id} selesai")
+            elif attempt >= self.queue.max_deliveries:
+                await self.dead_letter(job_id, fields, error or f"gagal setelah {attempt} percobaan")
+            else:
+                # Tidak di-ACK: job akan diklaim ulang setelah idle dan dicoba lagi
+                logging.warning(f"⚠️ Job {self.label} {job_id} gagal (percobaan ke-{attempt}), akan dicoba ulang"
+                                + (f": {error}" if error else ""))
+        except Exception as e:
+            logging.error(f"❌ Error memproses job {self.label} {job_id}: {str(e)}")
+        finally:
+            keeper.cancel()
+            self.slots.release()
+
+    def spawn(self, job_id: str, fields: dict, attempt: int = 1):
+        task = asyncio.create_task(self.process(job_id, fields, attempt))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def read_loop(self):
+        while not self.stopping.is_set():
+            await self.slots.acquire()
+            try:
+                response = await self.client.xreadgroup(
+                    self.queue.group, self.consumer_name, {self.queue.stream: ">"},
+                    count=1, block=READ_BLOCK_MS,
+                )
+            except Exception as e:
+                self.slots.release()
+                logging.error(f"❌ Gagal membaca stream {self.queue.stream}: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            if not response:
+                self.slots.release()
+                continue
+            for _, messages in response:
+                for job_id, fields in messages:
+                    self.spawn(job_id, fields)
+
+    async def reclaim_stale(self):
+        """Klaim ulang job yang terlalu lama pending; pindahkan ke dead-letter jika melebihi batas."""
+        pending = await self.client.xpending_range(
+            self.queue.stream, self.queue.group, min="-", max="+", count=100, idle=self.queue.claim_idle_ms,
+        )
+        for entry in pending:
+            job_id = entry["message_id"]
+            if entry["times_delivered"] >= self.queue.max_deliveries:
+                messages = await self.client.xrange(self.queue.stream, min=job_id, max=job_id)
+                fields = messages[0][1] if messages else {}
+                await self.dead_letter(job_id, fields, f"gagal setelah {entry['times_delivered']} percobaan")
+                continue
+            if self.slots.locked():
+                break
+            claimed = await self.client.xclaim(
+                self.queue.stream, self.queue.group, self.consumer_name, self.queue.claim_idle_ms, [job_id],
+            )
+            for claimed_id, fields in claimed:
+                if fields is None:
+                    continue
+                await self.slots.acquire()
+                attempt = entry["times_delivered"] + 1
+                logging.info(f"♻️ Job {self.label} {claimed_id} diklaim ulang (percobaan ke-{attempt})")
+                self.spawn(claimed_id, fields, attempt)
+
+    async def refresh_open_jobs(self):
+        """Panggil on_open_job() untuk job yang masih antre maupun yang pending (belum di-ACK)."""
+        groups = await self.client.xinfo_groups(self.queue.stream)
+        last_id = next((g["last-delivered-id"] for g in groups if g["name"] == self.queue.group), "0-0")
+        waiting = await self.client.xrange(self.queue.stream, min=f"({last_id}", max="+", count=OPEN_JOBS_BATCH)
+        pending = await self.client.xpending_range(
+            self.queue.stream, self.queue.group, min="-", max="+", count=OPEN_JOBS_BATCH,
+        )
+        if pending:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for entry in pending:
+                    pipe.xrange(self.queue.stream, min=entry["message_id"], max=entry["message_id"])
+                waiting += [messages[0] for messages in await pipe.execute() if messages]
+        for _, fields in waiting:
+            await self.on_open_job(fields)
+
+    async def reclaim_loop(self):
+        while not self.stopping.is_set():
+            try:
+                await self.reclaim_stale()
+                if self.tracks_open_jobs:
+                    await self.refresh_open_jobs()
+            except Exception as e:
+                logging.error(f"❌ Gagal klaim ulang job {self.label}: {str(e)}")
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=RECLAIM_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        if not self.client:
+            logging.error(f"❌ Redis client tidak tersedia, worker {self.label} tidak bisa berjalan")
+            return
+        await self.queue.ensure_group(self.client)
+        await self.startup()
+        logging.info(f"👷 Worker {self.label} '{self.consumer_name}' aktif (konkurensi {self.concurrency})")
+        loops = [asyncio.create_task(self.read_loop()), asyncio.create_task(self.reclaim_loop())]
+        await self.stopping.wait()
+        logging.info(f"🛑 Worker {self.label} berhenti, menunggu job yang sedang berjalan...")
+        for loop_task in loops:
+            loop_task.cancel()
+        await asyncio.gather(*loops, return_exceptions=True)
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.shutdown()
+
+async def run_until_signalled(worker: StreamWorker):
+    """Jalankan worker sampai SIGINT/SIGTERM diterima."""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, worker.stopping.set)
+        except NotImplementedError:
+            pass
+    await worker.run()
@@ -0,0 +1,222 @@
+"""
+Sinkronisasi Dialogflow di background dengan satu runner terpilih.
+
+Dengan gunicorn N worker (atau beberapa instance), setiap proses memanggil
+`start_background_sync()` saat startup, tetapi hanya satu yang memegang lock
+Redis `dialogflow:sync:leader` (SET NX PX dengan token unik). Pemegang lock
+memperpanjang TTL-nya lewat heartbeat selama sync berjalan; jika prosesnya
+mati, lock kedaluwarsa sendiri setelah DIALOGFLOW_SYNC_LOCK_TTL detik.
+
+Saat shutdown, thread sync diberi waktu DIALOGFLOW_SYNC_STOP_GRACE detik
+untuk selesai. Thread tidak bisa dihentikan paksa, jadi jika masih berjalan
+status ditandai `interrupted` dan lock tidak dilepas: lock kedaluwarsa lewat
+TTL, sehingga runner lain tidak memulai sync kedua di atas sync yang masih jalan.
+
+Sync dijalankan sebagai task setelah startup selesai, jadi worker sudah
+melayani request tanpa menunggu API Dialogflow. Hasil run terakhir disimpan
+di hash Redis `dialogflow:sync:status` dan bisa dilihat di `GET /sync-status`.
+"""
+
+from chatbot.services.redis_client import redis_client
+from chatbot.utils.sync_dialogflow import sync_all, SYNC_FAILED
+from os import getenv
+from typing import Optional
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+
+DIALOGFLOW_SYNC_ON_STARTUP = getenv("DIALOGFLOW_SYNC_ON_STARTUP", "true").lower() == "true"
+DIALOGFLOW_SYNC_LOCK_TTL = int(getenv("DIALOGFLOW_SYNC_LOCK_TTL", "60"))
+# Run yang sukses dalam selang waktu ini tidak diulang oleh worker yang start belakangan
+DIALOGFLOW_SYNC_MIN_INTERVAL = int(getenv("DIALOGFLOW_SYNC_MIN_INTERVAL", "300"))
+# Waktu tunggu sync yang sedang berjalan saat shutdown sebelum ditandai interrupted
+DIALOGFLOW_SYNC_STOP_GRACE = float(getenv("DIALOGFLOW_SYNC_STOP_GRACE", "10"))
+
+LEADER_KEY = "dialogflow:sync:leader"
+STATUS_KEY = "dialogflow:sync:status"
+
+STATUS_RUNNING = "running"
+STATUS_SUCCESS = "success"
+STATUS_FAILED = "failed"
+# Sebagian target gagal (sync_all tidak melempar exception); dicoba ulang saat start berikutnya
+STATUS_PARTIAL = "partial"
+STATUS_INTERRUPTED = "interrupted"
+
+# Perpanjang / lepas lock hanya jika token masih milik kita
+_EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+RUNNER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_task: Optional[asyncio.Task] = None
+_local_status: dict = {}
+
+async def _acquire(token: str) -> bool:
+    return bool(await redis_client.set(LEADER_KEY, token, nx=True, px=DIALOGFLOW_SYNC_LOCK_TTL * 1000))
+
+async def _release(token: str):
+    try:
+        await redis_client.eval(_RELEASE_SCRIPT, 1, LEADER_KEY, token)
+    except Exception as e:
+        logging.error(f"❌ Gagal melepas lock sync Dialogflow: {str(e)}")
+
+async def _heartbeat(token: str):
+    interval = DIALOGFLOW_SYNC_LOCK_TTL / 3
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            extended = await redis_client.eval(
+                _EXTEND_SCRIPT, 1, LEADER_KEY, token, DIALOGFLOW_SYNC_LOCK_TTL * 1000)
+        except Exception as e:
+            logging.error(f"❌ Heartbeat lock sync Dialogflow gagal: {str(e)}")
+            continue
+        if not extended:
+            logging.warning("⚠️ Lock sync Dialogflow hilang, runner lain mungkin ikut berjalan")
+            return
+
+async def _save_status(**fields):
+    _local_status.update(fields)
+    if not redis_client:
+        return
+    try:
+        await redis_client.hset(STATUS_KEY, mapping={k: str(v) for k, v in fields.items()})
+    except Exception as e:
+        logging.error(f"❌ Gagal menyimpan status sync Dialogflow: {str(e)}")
+
+async def _recently_synced() -> bool:
+    status = await redis_client.hgetall(STATUS_KEY)
+    if status.get("status") != STATUS_SUCCESS:
+        return False
+    return time.time() - float(status.get("finished_at", 0)) < DIALOGFLOW_SYNC_MIN_INTERVAL
+
+def failed_targets(results, prefix: str = "") -> list:
+    """Nama target yang hasilnya SYNC_FAILED, termasuk di dalam hasil bertingkat (training_phrases)."""
+    failed = []
+    for name, result in results.items():
+        if isinstance(result, dict):
+            failed += failed_targets(result, f"{prefix}{name}/")
+        elif result == SYNC_FAILED:
+            failed.append(f"{prefix}{name}")
+    return failed
+
+async def _execute(force: bool = False):
+    started = time.time()
+    await _save_status(status=STATUS_RUNNING, runner=RUNNER_ID, started_at=started)
+    logging.info(f"🔄 Memulai sinkronisasi Dialogflow di background ({RUNNER_ID})")
+    work = asyncio.ensure_future(asyncio.to_thread(sync_all, force))
+    try:
+        # shield: membatalkan task ini tidak menghentikan thread, jadi thread tetap dipantau
+        results = await asyncio.shield(work)
+    except asyncio.CancelledError:
+        logging.warning("⚠️ Sinkronisasi Dialogflow terputus saat shutdown, thread sync masih berjalan")
+        await _save_status(status=STATUS_INTERRUPTED, finished_at=time.time(),
+                           duration_ms=round((time.time() - started) * 1000),
+                           result="dihentikan saat shutdown sebelum sync selesai")
+        raise
+    except Exception as e:
+        logging.error(f"❌ Sinkronisasi Dialogflow gagal: {str(e)}")
+        await _save_status(status=STATUS_FAILED, finished_at=time.time(),
+                           duration_ms=round((time.time() - started) * 1000), result=str(e))
+        return
+    failed = failed_targets(results)
+    await _save_status(status=STATUS_PARTIAL if failed else STATUS_SUCCESS, finished_at=time.time(),
+                       duration_ms=round((time.time() - started) * 1000), result=json.dumps(results))
+    if failed:
+        logging.error(f"❌ Sinkronisasi Dialogflow selesai dengan target gagal: {', '.join(failed)}")
+    else:
+        logging.info(f"✅ Sinkronisasi Dialogflow selesai: {results}")
+
+async def run_sync(force: bool = False) -> bool:
+    """Jalankan sync jika proses ini terpilih sebagai runner; False jika dilewati."""
+    if not redis_client:
+        logging.warning("⚠️ Redis tidak tersedia, sync Dialogflow dijalankan tanpa lock")
+        await _execute(force)
+        return True
+
+    token = f"{RUNNER_ID}:{uuid.uuid4().hex}"
+    try:
+        if not force and await _recently_synced():
+            logging.info("⏭️ Sync Dialogflow baru saja selesai di runner lain, dilewati")
+            return False
+        if not await _acquire(token):
+            holder = await redis_client.get(LEADER_KEY)
+            logging.info(f"⏭️ Sync Dialogflow sedang dijalankan oleh {holder}, dilewati")
+            return False
+    except Exception as e:
+        logging.error(f"❌ Gagal mengambil lock sync Dialogflow: {str(e)}")
+        return False
+
+    heartbeat = asyncio.create_task(_heartbeat(token))
+    finished = False
+    try:
+        await _execute(force)
+        finished = True
+    finally:
+        heartbeat.cancel()
+        if finished:
+            await _release(token)
+        else:
+            # Thread sync masih berjalan: jangan lepas lock, biarkan kedaluwarsa lewat TTL
+            logging.warning(f"⚠️ Lock sync Dialogflow dibiarkan kedaluwarsa ({DIALOGFLOW_SYNC_LOCK_TTL} detik)")
+    return True
+
+def start_background_sync():
+    """Jadwalkan sync sebagai task; startup tidak menunggu Dialogflow."""
+    global _task
+    if not DIALOGFLOW_SYNC_ON_STARTUP:
+        logging.info("⏭️ DIALOGFLOW_SYNC_ON_STARTUP=false, sync Dialogflow tidak dijalankan")
+        return
+    if _task and not _task.done():
+        return
+    _task = asyncio.create_task(run_sync())
+
+async def stop_background_sync():
+    # Beri kesempatan sync selesai (lock tetap diperpanjang heartbeat); setelah itu
+    # task dibatalkan, status ditandai interrupted dan lock dibiarkan kedaluwarsa
+    if not _task or _task.done():
+        return
+    try:
+        await asyncio.wait_for(asyncio.shield(_task), timeout=DIALOGFLOW_SYNC_STOP_GRACE)
+        return
+    except asyncio.TimeoutError:
+        pass
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+
+async def get_sync_status() -> dict:
+    status = dict(_local_status)
+    if redis_client:
+        try:
+            status = await redis_client.hgetall(STATUS_KEY)
+            status["leader"] = await redis_client.get(LEADER_KEY)
+            # Runner mati tanpa sempat menulis status: lock sudah kedaluwarsa tapi status masih running
+            if status.get("status") == STATUS_RUNNING and not status["leader"]:
+                status["status"] = STATUS_INTERRUPTED
+        except Exception as e:
+            logging.error(f"❌ Gagal membaca status sync Dialogflow: {str(e)}")
+    for field in ("started_at", "finished_at"):
+        if field in status:
+            status[field] = float(status[field])
+    if "duration_ms" in status:
+        status["duration_ms"] = int(status["duration_ms"])
+    if status.get("status") in (STATUS_SUCCESS, STATUS_PARTIAL) and "result" in status:
+        status["result"] = json.loads(status["result"])
+    status["this_worker"] = RUNNER_ID
+    return status
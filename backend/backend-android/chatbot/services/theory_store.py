@@ -0,0 +1,231 @@
+"""
+Penyimpanan jawaban teori jangka panjang.
+
+Jawaban teori bersifat deterministik per (jenjang, judul sub_bab, versi prompt),
+jadi disimpan di Redis tanpa TTL dengan key content-addressed dari
+`theory_with_gemini.generate_cache_key`. Karena hash template prompt ikut di
+dalam key, mengubah prompt otomatis membuat jawaban lama tidak terpakai.
+
+Setiap jawaban punya metadata `{key}:meta` (waktu generate, ukuran, sumber).
+Jika THEORY_ARCHIVE_PATH di-set, jawaban juga diarsipkan ke SQLite dan dibaca
+kembali ke Redis saat Redis kehilangan datanya (flush/restart tanpa persistence).
+
+Manifest mencatat key terbaru untuk setiap (id sub_bab, jenjang) sehingga
+pre-generation bisa dilanjutkan dan key lama yang sudah tidak terpakai bisa
+dibersihkan.
+
+Jawaban yang dibuat online (dan yang tidak tercatat di manifest) dibersihkan
+per versi prompt: setiap versi dicatat di `theory:versions` beserta waktu
+pertama kali terlihat, dan saat startup satu worker menghapus semua jawaban
+dari versi yang lebih lama daripada versi saat ini (Redis, manifest, dan arsip).
+Versi yang lebih baru tidak pernah disapu, jadi instance lama yang restart saat
+rolling deploy tidak menghapus jawaban versi baru.
+"""
+
+from chatbot.services.redis_client import redis_client
+from os import getenv
+from typing import Optional
+import asyncio
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+MANIFEST_KEY = "theory:manifest"
+VERSIONS_KEY = "theory:versions"
+SWEEP_LOCK_KEY = "theory:sweep:lock"
+SWEEP_LOCK_TTL = 600
+SWEEP_BATCH = 500
+# theory:{versi prompt}:{sha256}, opsional diikuti :meta / :partial
+_ANSWER_KEY_RE = re.compile(r"^theory:([0-9a-f]{12}):[0-9a-f]{64}(?::meta|:partial)?$")
+ARCHIVE_PATH = getenv("THEORY_ARCHIVE_PATH")
+
+_archive_lock = threading.Lock()
+_archive_conn: Optional[sqlite3.Connection] = None
+
+def _manifest_field(subbab_id: str, level: str) -> str:
+    return f"{subbab_id}:{level}"
+
+def _meta_key(cache_key: str) -> str:
+    return f"{cache_key}:meta"
+
+def _archive() -> Optional[sqlite3.Connection]:
+    global _archive_conn
+    if not ARCHIVE_PATH:
+        return None
+    if _archive_conn is None:
+        conn = sqlite3.connect(ARCHIVE_PATH, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS theory_answers ("
+            " cache_key TEXT PRIMARY KEY,"
+            " answer TEXT NOT NULL,"
+            " generated_at REAL NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " source TEXT)"
+        )
+        conn.commit()
+        _archive_conn = conn
+    return _archive_conn
+
+def _archive_write(cache_key: str, jawaban: str, meta: dict):
+    with _archive_lock:
+        conn = _archive()
+        conn.execute(
+            "INSERT OR REPLACE INTO theory_answers (cache_key, answer, generated_at, size, source) VALUES (?, ?, ?, ?, ?)",
+            (cache_key, jawaban, meta["generated_at"], meta["size"], meta.get("source")),
+        )
+        conn.commit()
+
+def _archive_read(cache_key: str) -> Optional[tuple]:
+    with _archive_lock:
+        return _archive().execute(
+            "SELECT answer, generated_at, size, source FROM theory_answers WHERE cache_key = ?",
+            (cache_key,),
+        ).fetchone()
+
+def _archive_delete(cache_key: str):
+    with _archive_lock:
+        conn = _archive()
+        conn.execute("DELETE FROM theory_answers WHERE cache_key = ?", (cache_key,))
+        conn.commit()
+
+def _archive_delete_versions(versions: list) -> int:
+    with _archive_lock:
+        conn = _archive()
+        deleted = 0
+        for version in versions:
+            deleted += conn.execute(
+                "DELETE FROM theory_answers WHERE cache_key LIKE ?", (f"theory:{version}:%",),
+            ).rowcount
+        conn.commit()
+        return deleted
+
+async def get_answer(cache_key: str) -> Optional[str]:
+    """Ambil jawaban dari Redis, lalu dari arsip SQLite (dan isi ulang Redis)."""
+    jawaban = await redis_client.get(cache_key) if redis_client else None
+    if jawaban or not ARCHIVE_PATH:
+        return jawaban
+    row = await asyncio.to_thread(_archive_read, cache_key)
+    if not row:
+        return None
+    answer, generated_at, size, source = row
+    if redis_client:
+        await redis_client.set(cache_key, answer)
+        await redis_client.hset(_meta_key(cache_key), mapping={
+            "generated_at": str(generated_at), "size": str(size), "source": source or "archive",
+        })
+        logging.info(f"📦 Jawaban teori dipulihkan dari arsip untuk key: {cache_key}")
+    return answer
+
+async def has_answer(cache_key: str) -> bool:
+    if redis_client and await redis_client.exists(cache_key):
+        return True
+    return bool(await get_answer(cache_key)) if ARCHIVE_PATH else False
+
+async def save_answer(cache_key: str, jawaban: str, source: str = "online"):
+    """Simpan jawaban tanpa TTL beserta metadata waktu generate dan ukuran."""
+    meta = {
+        "generated_at": time.time(),
+        "size": len(jawaban.encode("utf-8")),
+        "source": source,
+    }
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.set(cache_key, jawaban)
+        pipe.hset(_meta_key(cache_key), mapping={k: str(v) for k, v in meta.items()})
+        await pipe.execute()
+    if ARCHIVE_PATH:
+        try:
+            await asyncio.to_thread(_archive_write, cache_key, jawaban, meta)
+        except Exception as e:
+            logging.error(f"❌ Gagal mengarsipkan jawaban teori {cache_key}: {str(e)}")
+    logging.info(f"💾 Jawaban teori disimpan permanen untuk key: {cache_key} ({meta['size']} bytes)")
+
+async def get_metadata(cache_key: str) -> dict:
+    meta = await redis_client.hgetall(_meta_key(cache_key))
+    if meta:
+        return {
+            "generated_at": float(meta.get("generated_at", 0)),
+            "size": int(meta.get("size", 0)),
+            "source": meta.get("source"),
+        }
+    return {}
+
+async def get_manifest_key(subbab_id: str, level: str) -> Optional[str]:
+    return await redis_client.hget(MANIFEST_KEY, _manifest_field(subbab_id, level))
+
+async def set_manifest_key(subbab_id: str, level: str, cache_key: str):
+    await redis_client.hset(MANIFEST_KEY, _manifest_field(subbab_id, level), cache_key)
+
+async def delete_answer(cache_key: str):
+    await redis_client.delete(cache_key, _meta_key(cache_key))
+    if ARCHIVE_PATH:
+        await asyncio.to_thread(_archive_delete, cache_key)
+
+def _swept_key(version: str) -> str:
+    return f"theory:swept:{version}"
+
+async def sweep_stale_versions(current_version: str) -> int:
+    """Hapus jawaban teori dari versi prompt yang lebih lama daripada current_version."""
+    if not redis_client:
+        return 0
+    await redis_client.zadd(VERSIONS_KEY, {current_version: time.time()}, nx=True)
+    if await redis_client.exists(_swept_key(current_version)):
+        return 0
+    if not await redis_client.set(SWEEP_LOCK_KEY, current_version, nx=True, ex=SWEEP_LOCK_TTL):
+        return 0
+    try:
+        known = dict(await redis_client.zrange(VERSIONS_KEY, 0, -1, withscores=True))
+        current_seen = known[current_version]
+        deleted = 0
+        stale_versions = set()
+        batch = []
+        async for key in redis_client.scan_iter(match="theory:*", count=SWEEP_BATCH):
+            match = _ANSWER_KEY_RE.match(key)
+            if not match or match.group(1) == current_version:
+                continue
+            version = match.group(1)
+            # Versi yang belum tercatat berasal dari sebelum pencatatan versi ada
+            if version in known and known[version] >= current_seen:
+                continue
+            stale_versions.add(version)
+            batch.append(key)
+            if len(batch) >= SWEEP_BATCH:
+                deleted += await redis_client.unlink(*batch)
+                batch = []
+        if batch:
+            deleted += await redis_client.unlink(*batch)
+
+        stale_versions |= {v for v, seen in known.items() if seen < current_seen}
+        manifest = await redis_client.hgetall(MANIFEST_KEY)
+        stale_fields = [
+            field for field, key in manifest.items()
+            if (match := _ANSWER_KEY_RE.match(key)) and match.group(1) in stale_versions
+        ]
+        if stale_fields:
+            await redis_client.hdel(MANIFEST_KEY, *stale_fields)
+        if stale_versions:
+            await redis_client.zrem(VERSIONS_KEY, *stale_versions)
+            if ARCHIVE_PATH:
+                await asyncio.to_thread(_archive_delete_versions, sorted(stale_versions))
+        await redis_client.set(_swept_key(current_version), "1")
+        logging.info(f"🧹 Jawaban teori versi lama dibersihkan: {deleted} key dari {len(stale_versions)} versi prompt")
+        return deleted
+    finally:
+        await redis_client.delete(SWEEP_LOCK_KEY)
+
+_sweep_task: Optional[asyncio.Task] = None
+
+def start_version_sweep(current_version: str):
+    """Jadwalkan sweep_stale_versions di background (dipanggil saat startup)."""
+    global _sweep_task
+
+    async def _run():
+        try:
+            await sweep_stale_versions(current_version)
+        except Exception as e:
+            logging.error(f"❌ Gagal membersihkan jawaban teori versi lama: {str(e)}")
+
+    if redis_client and (_sweep_task is None or _sweep_task.done()):
+        _sweep_task = asyncio.create_task(_run())
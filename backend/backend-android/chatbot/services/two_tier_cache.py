@@ -0,0 +1,206 @@
+"""
+Cache dua tingkat untuk payload chip: LRU in-process di depan Redis.
+
+- Hit lokal tidak membutuhkan round trip ke Redis.
+- Single-flight: untuk satu key hanya satu coroutine yang mengisi ulang,
+  coroutine lain menunggu hasil yang sama.
+- Refresh dini probabilistik (XFetch): menjelang TTL Redis habis, sebagian
+  kecil request memicu refresh di background sehingga key tidak pernah
+  kedaluwarsa serentak untuk semua request.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from os import getenv
+from typing import Awaitable, Callable, Optional
+from chatbot.services.redis_client import redis_raw_client
+import asyncio
+import logging
+import math
+import random
+import time
+
+Loader = Callable[[], Awaitable[Optional[bytes]]]
+
+@dataclass
+class _Entry:
+    value: bytes
+    local_expires_at: float
+    expires_at: float
+
+class _NamespaceStats:
+    __slots__ = ("local_hits", "redis_hits", "misses", "refills", "early_refreshes", "errors", "load_time_avg")
+
+    def __init__(self):
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.early_refreshes = 0
+        self.errors = 0
+        self.load_time_avg = 0.0
+
+    def record_load_time(self, seconds: float):
+        if self.load_time_avg == 0.0:
+            self.load_time_avg = seconds
+        else:
+            self.load_time_avg = 0.8 * self.load_time_avg + 0.2 * seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "refills": self.refills,
+            "early_refreshes": self.early_refreshes,
+            "errors": self.errors,
+            "load_time_avg_ms": round(self.load_time_avg * 1000, 2),
+        }
+
+class TwoTierCache:
+    def __init__(self, redis, max_entries: int = 1024, local_ttl: float = 60, beta: float = 1.0):
+        self._redis = redis
+        self._max_entries = max_entries
+        self._local_ttl = local_ttl
+        self._beta = beta
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._inflight: dict = {}
+        self._stats: dict = {}
+
+    @staticmethod
+    def _namespace(key: str) -> str:
+        return key.split(":", 1)[0]
+
+    def _ns_stats(self, key: str) -> _NamespaceStats:
+        namespace = self._namespace(key)
+        stats = self._stats.get(namespace)
+        if stats is None:
+            stats = self._stats[namespace] = _NamespaceStats()
+        return stats
+
+    def _get_local(self, key: str, now: float) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.local_expires_at <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put_local(self, key: str, value: bytes, ttl: float, now: float):
+        self._entries[key] = _Entry(
+            value=value,
+            local_expires_at=now + min(self._local_ttl, ttl),
+            expires_at=now + ttl,
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def _should_refresh_early(self, key: str, entry: _Entry, now: float) -> bool:
+        delta = self._ns_stats(key).load_time_avg
+        if delta <= 0:
+            return False
+        return now - delta * self._beta * math.log(random.random() or 1e-12) >= entry.expires_at
+
+    async def _load_and_store(self, key: str, loader: Loader, ttl: int) -> Optional[bytes]:
+        stats = self._ns_stats(key)
+        started = time.monotonic()
+        value = await loader()
+        stats.record_load_time(time.monotonic() - started)
+        if value is None:
+            return None
+        stats.refills += 1
+        if self._redis:
+            await self._redis.set(key, value, ex=ttl)
+        self._put_local(key, value, ttl, time.monotonic())
+        return value
+
+    async def _fetch(self, key: str, loader: Loader, ttl: int) -> Optional[bytes]:
+        stats = self._ns_stats(key)
+        if self._redis:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                pipe.get(key)
+                pipe.pttl(key)
+                cached, pttl = await pipe.execute()
+            if cached is not None:
+                stats.redis_hits += 1
+                remaining = pttl / 1000 if pttl and pttl > 0 else ttl
+                self._put_local(key, cached, remaining, time.monotonic())
+                return cached
+        stats.misses += 1
+        return await self._load_and_store(key, loader, ttl)
+
+    def _single_flight(self, key: str, coro_factory) -> "asyncio.Future":
+        future = self._inflight.get(key)
+        if future is not None:
+            return future
+
+        async def run():
+            try:
+                return await coro_factory()
+            finally:
+                self._inflight.pop(key, None)
+
+        future = asyncio.ensure_future(run())
+        self._inflight[key] = future
+        return future
+
+    def _refresh_in_background(self, key: str, loader: Loader, ttl: int):
+        if key in self._inflight:
+            return
+        self._ns_stats(key).early_refreshes += 1
+
+        async def refresh():
+            try:
+                return await self._load_and_store(key, loader, ttl)
+            except Exception as e:
+                self._ns_stats(key).errors += 1
+                logging.error(f"❌ Gagal refresh dini cache '{key}': {str(e)}")
+
+        self._single_flight(key, refresh)
+
+    async def get_or_load(self, key: str, loader: Loader, ttl: int) -> Optional[bytes]:
+        """
+        Ambil payload dari LRU lokal, lalu Redis, lalu `loader`.
+        `loader` mengembalikan bytes untuk di-cache atau None jika tidak ada data
+        (hasil None tidak di-cache).
+        """
+        now = time.monotonic()
+        entry = self._get_local(key, now)
+        if entry is not None:
+            self._ns_stats(key).local_hits += 1
+        else:
+            try:
+                value = await asyncio.shield(self._single_flight(key, lambda: self._fetch(key, loader, ttl)))
+            except Exception:
+                self._ns_stats(key).errors += 1
+                raise
+            now = time.monotonic()
+            entry = self._get_local(key, now)
+            if entry is None:
+                return value
+        if self._should_refresh_early(key, entry, now):
+            self._refresh_in_background(key, loader, ttl)
+        return entry.value
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "local_entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "namespaces": {name: stats.as_dict() for name, stats in self._stats.items()},
+        }
+
+chip_cache = TwoTierCache(
+    redis_raw_client,
+    max_entries=int(getenv("CHIP_CACHE_MAX_ENTRIES", "1024")),
+    local_ttl=float(getenv("CHIP_CACHE_LOCAL_TTL", "60")),
+    beta=float(getenv("CHIP_CACHE_BETA", "1.0")),
+)
@@ -1,13 +1,96 @@
+"""
+Cache access token Dialogflow untuk `/get-dialogflow-token`.
+
+File service account dibaca sekali. Token disimpan di memori sampai mendekati
+kedaluwarsa:
+- sisa masa berlaku > DIALOGFLOW_TOKEN_REFRESH_MARGIN: token cache langsung dikembalikan
+- sisa masa berlaku <= margin tetapi masih > DIALOGFLOW_TOKEN_MIN_TTL: token cache
+  dikembalikan dan refresh dijalankan di background
+- selain itu (belum ada token / hampir habis): pemanggil menunggu refresh
+
+Refresh OAuth ke Google berjalan di thread (tidak memblokir event loop) dan
+bersifat single-flight: semua pemanggil yang datang bersamaan menunggu task
+refresh yang sama.
+"""
+
 from google.oauth2 import service_account
+from datetime import datetime, timezone
+from os import getenv
+from typing import Optional, Tuple
 import google.auth.transport.requests
+import asyncio
+import logging
+
+SERVICE_ACCOUNT_FILE = getenv("DIALOGFLOW_CREDENTIALS_PATH", "/etc/secrets/credentials.json")
+SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+DIALOGFLOW_TOKEN_REFRESH_MARGIN = int(getenv("DIALOGFLOW_TOKEN_REFRESH_MARGIN", "300"))
+DIALOGFLOW_TOKEN_MIN_TTL = int(getenv("DIALOGFLOW_TOKEN_MIN_TTL", "60"))
+
+class DialogflowTokenCache:
+    def __init__(self, service_account_file: str = SERVICE_ACCOUNT_FILE):
+        self._service_account_file = service_account_file
+        self._credentials = None
+        self._token: Optional[str] = None
+        self._expiry: Optional[datetime] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._refreshes = 0
+
+    def _load_credentials(self):
+        if self._credentials is None:
+            self._credentials = service_account.Credentials.from_service_account_file(
+                self._service_account_file, scopes=SCOPES)
+        return self._credentials
+
+    def _refresh_blocking(self) -> Tuple[str, datetime]:
+        credentials = self._load_credentials()
+        credentials.refresh(google.auth.transport.requests.Request())
+        return credentials.token, credentials.expiry
+
+    async def _refresh(self):
+        token, expiry = await asyncio.to_thread(self._refresh_blocking)
+        # Token dan expiry ditukar bersamaan agar pembaca tidak melihat pasangan campuran
+        self._token, self._expiry = token, expiry
+        self._refreshes += 1
+        logging.info(f"🔑 Token Dialogflow diperbarui, berlaku {self._remaining():.0f} detik")
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+            self._refresh_task.add_done_callback(self._log_refresh_error)
+        return self._refresh_task
+
+    @staticmethod
+    def _log_refresh_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logging.error(f"❌ Gagal memperbarui token Dialogflow: {str(task.exception())}")
+
+    def _remaining(self) -> float:
+        if not self._token or not self._expiry:
+            return 0.0
+        # expiry dari google-auth berupa datetime UTC tanpa timezone; versi baru bisa aware
+        expiry = self._expiry if self._expiry.tzinfo else self._expiry.replace(tzinfo=timezone.utc)
+        return (expiry - datetime.now(timezone.utc)).total_seconds()
+
+    async def get_token(self) -> Tuple[str, int]:
+        """(access_token, expires_in dalam detik)."""
+        remaining = self._remaining()
+        if remaining <= DIALOGFLOW_TOKEN_MIN_TTL:
+            # shield: pemanggil yang dibatalkan tidak ikut membatalkan refresh milik pemanggil lain
+            await asyncio.shield(self._start_refresh())
+            remaining = self._remaining()
+        elif remaining <= DIALOGFLOW_TOKEN_REFRESH_MARGIN:
+            self._start_refresh()
+        return self._token, int(remaining)
 
-def get_dialogflow_token():
+    def stats(self) -> dict:
+        return {
+            "cached": bool(self._token),
+            "expires_in": int(self._remaining()),
+            "refreshes": self._refreshes,
+            "refreshing": bool(self._refresh_task and not self._refresh_task.done()),
+        }
 
-    SERVICE_ACCOUNT_FILE = "/etc/secrets/credentials.json"
-    SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+dialogflow_token_cache = DialogflowTokenCache()
 
-    credentials = service_account.Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-    auth_req = google.auth.transport.requests.Request()
-    credentials.refresh(auth_req)
-    return credentials.token
\ No newline at end of file
+async def get_dialogflow_token() -> Tuple[str, int]:
+    return await dialogflow_token_cache.get_token()
@@ -0,0 +1,79 @@
+"""
+Penamaan intent shard untuk training phrase yang melebihi batas per intent.
+
+Dialogflow membatasi jumlah training phrase per intent, jadi daftar yang besar
+(mis. judul sub_bab) dibagi ke beberapa intent: shard pertama memakai nama
+intent aslinya, shard berikutnya "<nama> #2", "<nama> #3", dst. Webhook
+memetakan nama shard kembali ke intent asal sebelum memilih handler.
+
+Phrase ditempatkan ke shard berdasarkan hash teksnya, bukan urutan dokumen:
+setiap phrase masuk salah satu dari VIRTUAL_BUCKETS bucket tetap, dan bucket
+dipetakan ke shard dengan jump consistent hash. Dokumen baru atau yang dihapus
+tidak menggeser isi shard lain, dan saat jumlah shard bertambah hanya sekitar
+1/n bucket yang pindah.
+"""
+
+import hashlib
+import math
+import re
+
+_SHARD_PATTERN = re.compile(r"^(?P<base>.+) #(?P<index>\d+)$")
+
+VIRTUAL_BUCKETS = 4096
+
+def shard_intent_name(base_name: str, index: int) -> str:
+    """Nama intent untuk shard ke-index (mulai dari 0)."""
+    return base_name if index == 0 else f"{base_name} #{index + 1}"
+
+def base_intent_name(display_name: str) -> str:
+    match = _SHARD_PATTERN.match(display_name)
+    return match.group("base") if match else display_name
+
+def shard_index(display_name: str, base_name: str) -> int:
+    """Index shard dari display_name milik base_name, -1 jika bukan shard-nya."""
+    if display_name == base_name:
+        return 0
+    match = _SHARD_PATTERN.match(display_name)
+    if not match or match.group("base") != base_name:
+        return -1
+    return int(match.group("index")) - 1
+
+def phrase_bucket(phrase: str) -> int:
+    """Bucket tetap (0..VIRTUAL_BUCKETS-1) untuk phrase; stabil lintas run dan proses."""
+    digest = hashlib.sha256(phrase.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % VIRTUAL_BUCKETS
+
+def bucket_shard(bucket: int, shard_count: int) -> int:
+    """Jump consistent hash: index shard (0..shard_count-1) untuk bucket."""
+    key = (bucket * 0x9E3779B97F4A7C15 + 1) & 0xFFFFFFFFFFFFFFFF
+    result, jump = -1, 0
+    while jump < shard_count:
+        result = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((result + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return result
+
+def assign_shards(phrases, max_per_shard: int, fill: float = 1.0) -> list:
+    """
+    Bagi phrases (iterable, dibaca sekali) ke shard berisi maksimal max_per_shard phrase.
+    Jumlah shard dihitung agar rata-rata terisi `fill` dari batas; jika sebaran bucket
+    tetap membuat satu shard meluap, jumlah shard ditambah.
+    """
+    buckets = [[] for _ in range(VIRTUAL_BUCKETS)]
+    total = 0
+    for phrase in phrases:
+        buckets[phrase_bucket(phrase)].append(phrase)
+        total += 1
+    shard_count = max(1, math.ceil(total / (max_per_shard * fill)))
+    while True:
+        owners = [bucket_shard(bucket, shard_count) for bucket in range(VIRTUAL_BUCKETS)]
+        sizes = [0] * shard_count
+        for bucket, owner in enumerate(owners):
+            sizes[owner] += len(buckets[bucket])
+        if max(sizes) <= max_per_shard or shard_count >= VIRTUAL_BUCKETS:
+            break
+        shard_count += 1
+    shards = [[] for _ in range(shard_count)]
+    for bucket, owner in enumerate(owners):
+        shards[owner].extend(buckets[bucket])
+    return shards
@@ -0,0 +1,167 @@
+"""
+Pre-generation jawaban teori untuk setiap sub_bab × jenjang.
+
+Menelusuri koleksi `sub_bab`, membangun prompt yang sama dengan
+`get_theory_from_subbab`, lalu memanggil Gemini dengan konkurensi dan rate
+limit terbatas. Hasil disimpan permanen lewat `theory_store` dengan key yang
+mengandung hash versi prompt.
+
+Pasangan yang perlu di-generate dimasukkan ke antrian berukuran terbatas dan
+diproses oleh `concurrency` worker, jadi memori tidak bertambah dengan ukuran
+katalog.
+
+Aman dijalankan berulang: pasangan yang jawabannya sudah ada untuk judul dan
+versi prompt saat ini dilewati, jadi hanya sub_bab baru, yang judulnya berubah,
+atau semua sub_bab setelah template prompt diubah yang di-generate ulang.
+
+Jalankan dari folder backend-android:
+    python -m chatbot.utils.pregenerate_theory --concurrency 4 --rps 2
+"""
+from chatbot.services.firestore_service import async_db
+from chatbot.services.gemini_service_async import chat_with_gemini_api, GeminiError, startup_gemini_client, shutdown_gemini_client
+from chatbot.services.gemini_scheduler import PRIORITY_LOW
+from chatbot.services.inflight_registry import claim_generation, release_generation
+from chatbot.services import theory_store
+from chatbot.handlers.theory_with_gemini import SCHOOL_LEVELS, PROMPT_VERSION, build_theory_prompt, generate_cache_key
+import argparse
+import asyncio
+import logging
+import sys
+
+class RateLimiter:
+    """Membatasi jumlah panggilan yang dimulai per detik."""
+
+    def __init__(self, rate_per_sec: float):
+        self.interval = 1.0 / rate_per_sec if rate_per_sec > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_at = max(loop.time(), self._next_at) + self.interval
+
+async def iter_subbabs():
+    """Yield (id, title) untuk setiap sub_bab; hanya field title yang diambil."""
+    async for doc in async_db.collection("sub_bab").select(["title"]).stream():
+        title = (doc.to_dict() or {}).get("title")
+        if title:
+            yield doc.id, title
+
+async def _generate_one(subbab_id: str, title: str, level: str, cache_key: str, stats: dict,
+                        limiter: RateLimiter, prune: bool):
+    if not await claim_generation(cache_key):
+        logging.info(f"🔁 [{level}] '{title}' sedang di-generate proses lain, dilewati")
+        stats["skipped"] += 1
+        return
+    try:
+        await limiter.wait()
+        try:
+            jawaban = await chat_with_gemini_api(build_theory_prompt(level, title), priority=PRIORITY_LOW)
+        except GeminiError as e:
+            logging.warning(f"❌ [{level}] '{title}' gagal: {str(e)}")
+            stats["failed"] += 1
+            return
+        await theory_store.save_answer(cache_key, jawaban, source="pregenerate")
+        old_key = await theory_store.get_manifest_key(subbab_id, level)
+        await theory_store.set_manifest_key(subbab_id, level, cache_key)
+        if prune and old_key and old_key != cache_key:
+            await theory_store.delete_answer(old_key)
+            stats["pruned"] += 1
+        stats["generated"] += 1
+        logging.info(f"✅ [{level}] '{title}' selesai ({len(jawaban)} karakter)")
+    finally:
+        await release_generation(cache_key)
+
+async def _worker(queue: asyncio.Queue, stats: dict, limiter: RateLimiter, prune: bool):
+    while True:
+        job = await queue.get()
+        try:
+            if job is None:
+                return
+            try:
+                await _generate_one(*job, stats, limiter, prune)
+            except Exception as e:
+                # Satu pasangan yang error (mis. Redis) tidak boleh menghentikan worker lain
+                logging.error(f"❌ [{job[2]}] '{job[1]}' error: {str(e)}")
+                stats["failed"] += 1
+        finally:
+            queue.task_done()
+
+async def _enqueue_pending(queue: asyncio.Queue, levels, stats: dict, dry_run: bool, limit: int):
+    queued = 0
+    async for subbab_id, title in iter_subbabs():
+        for level in levels:
+            stats["total"] += 1
+            cache_key = generate_cache_key(level, title)
+            if await theory_store.has_answer(cache_key):
+                stats["skipped"] += 1
+                await theory_store.set_manifest_key(subbab_id, level, cache_key)
+                continue
+            stats["pending"] += 1
+            if dry_run:
+                logging.info(f"📝 [{level}] '{title}' perlu di-generate")
+                continue
+            if limit and queued >= limit:
+                continue
+            await queue.put((subbab_id, title, level, cache_key))
+            queued += 1
+
+async def pregenerate(levels=None, concurrency: int = 4, rps: float = 2.0,
+                      prune: bool = False, dry_run: bool = False, limit: int = 0) -> dict:
+    levels = levels or SCHOOL_LEVELS
+    stats = {"total": 0, "skipped": 0, "generated": 0, "failed": 0, "pruned": 0, "pending": 0}
+    limiter = RateLimiter(rps)
+    concurrency = max(1, concurrency)
+    # Antrian terbatas: pembacaan katalog menunggu worker, bukan menumpuk task di memori
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    workers = [] if dry_run else [
+        asyncio.create_task(_worker(queue, stats, limiter, prune)) for _ in range(concurrency)
+    ]
+
+    try:
+        await _enqueue_pending(queue, levels, stats, dry_run, limit)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+    return stats
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Pre-generate jawaban teori Gemini untuk semua sub_bab.")
+    parser.add_argument("--levels", nargs="+", choices=SCHOOL_LEVELS, default=SCHOOL_LEVELS,
+                        help="Jenjang yang di-generate (default: semua)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maksimal panggilan Gemini bersamaan")
+    parser.add_argument("--rps", type=float, default=2.0, help="Maksimal panggilan Gemini dimulai per detik (0 = tanpa batas)")
+    parser.add_argument("--limit", type=int, default=0, help="Batasi jumlah generasi pada run ini (0 = tanpa batas)")
+    parser.add_argument("--prune", action="store_true", help="Hapus jawaban lama saat judul sub_bab atau prompt berubah")
+    parser.add_argument("--dry-run", action="store_true", help="Hanya tampilkan pasangan yang perlu di-generate")
+    return parser.parse_args(argv)
+
+async def main(argv=None):
+    args = _parse_args(argv if argv is not None else sys.argv[1:])
+    if not async_db or not theory_store.redis_client:
+        logging.error("❌ Firestore atau Redis tidak tersedia, pre-generation dibatalkan")
+        return 1
+    await startup_gemini_client()
+    try:
+        logging.info(f"🚀 Pre-generation teori dimulai (versi prompt {PROMPT_VERSION})")
+        stats = await pregenerate(
+            levels=args.levels, concurrency=args.concurrency, rps=args.rps,
+            prune=args.prune, dry_run=args.dry_run, limit=args.limit,
+        )
+    finally:
+        await shutdown_gemini_client()
+    logging.info(f"📊 Ringkasan: {stats}")
+    return 0 if stats["failed"] == 0 else 2
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,66 @@
+"""
+Normalisasi pertanyaan custom agar pertanyaan yang sama dari siswa berbeda
+menghasilkan cache key yang sama.
+
+Langkah: Unicode NFKC + case folding, pecah menjadi token kata, bilangan, dan
+operator, samakan singkatan chat yang umum (gmn, yg, knp, ...), lalu buang
+partikel kesopanan dan kata pengisi (tolong, dong, sih, ya, ...). Tanda baca
+biasa (?, !, titik di akhir kalimat) dibuang.
+
+Yang dipertahankan karena mengubah maksud pertanyaan:
+- urutan kata: "4 dibagi 2" dan "2 dibagi 4" tetap berbeda
+- operator matematika (+ - * / × ÷ = < > % ^, dan : di antara angka): "2+3",
+  "2-3", dan "2/3" berbeda
+- pemisah desimal/ribuan di dalam bilangan: "1,5" dan "1 5" berbeda
+- kata hubung arah dan logika (di, ke, dari, dan, atau, dengan, ...):
+  "pindah dari A ke B" dan "pindah ke A dari B" berbeda
+- kata tanya (apa, bagaimana, mengapa, ...)
+- kata benda, kata ganti, dan kata topik: "apa itu ai" dan "apa itu guru",
+  atau "kamu siapa" dan "siapa aku", berbeda
+"""
+import re
+import unicodedata
+
+# Naikkan jika aturan normalisasi berubah, agar cache key lama tidak dipakai lagi
+NORMALIZATION_VERSION = 3
+
+# Bilangan (dengan pemisah desimal/ribuan), kata, operator, atau ":" di antara angka
+_TOKEN = re.compile(r"\d+(?:[.,]\d+)*|\w+|[+\-*/×÷=<>%^]|(?<=\d):(?=\s*\d)|(?<=\d\s):(?=\s*\d)")
+_SPACES = re.compile(r"\s+")
+
+# Singkatan/ejaan chat yang sering dipakai siswa
+SLANG = {
+    "gmn": "bagaimana", "gimana": "bagaimana", "bgmn": "bagaimana",
+    "knp": "kenapa", "napa": "kenapa",
+    "apaan": "apa", "ap": "apa",
+    "yg": "yang", "dgn": "dengan", "dg": "dengan",
+    "utk": "untuk", "tdk": "tidak", "gak": "tidak", "ga": "tidak", "nggak": "tidak", "enggak": "tidak",
+    "jlskan": "jelaskan", "jelasin": "jelaskan",
+    "sm": "sama", "krn": "karena", "karna": "karena",
+    "dmn": "dimana",
+}
+
+# Hanya partikel kesopanan, pengisi, dan sapaan. Kata benda, kata ganti, dan kata
+# topik (ai, guru, soal, arti, kamu, saya, ...) ikut menentukan maksud pertanyaan,
+# jadi tidak dibuang: "apa itu ai" dan "apa itu guru" harus tetap berbeda
+STOPWORDS = {
+    "tolong", "mohon", "please", "dong", "donk", "sih", "ya", "yah", "yaa", "nih", "deh",
+    "lah", "tuh", "kok", "kah", "hmm", "eh", "oh", "hai", "halo", "hi",
+}
+
+_EXACT_SYMBOL = re.compile(r"\d+(?:[.,]\d+)*|[+\-*/×÷=<>%^:]")
+# Kata hubung arah/logika dan negasi: beda satu kata ini saja sudah beda pertanyaan
+EXACT_WORDS = {"di", "ke", "dari", "dan", "atau", "tidak", "bukan", "dengan", "sama"}
+
+def exact_tokens(normalized: str) -> tuple:
+    """Token (berurutan) yang harus sama persis agar dua pertanyaan boleh dianggap mirip."""
+    return tuple(token for token in normalized.split()
+                 if token in EXACT_WORDS or _EXACT_SYMBOL.fullmatch(token))
+
+def normalize_question(question: str) -> str:
+    """Kembalikan bentuk kanonik pertanyaan; tidak pernah string kosong untuk input berisi."""
+    text = unicodedata.normalize("NFKC", question).casefold()
+    tokens = [SLANG.get(token, token) for token in _TOKEN.findall(text)]
+    kept = [token for token in tokens if token not in STOPWORDS]
+    # Pertanyaan yang seluruhnya stop word (mis. "tolong jelaskan") tetap dibedakan
+    return " ".join(kept or tokens) or _SPACES.sub(" ", question.strip().casefold())
@@ -0,0 +1,53 @@
+from fastapi import Response
+import json
+import orjson
+
+# Penanda session di payload cache. Diganti dengan session path milik request
+# langsung pada level bytes, tanpa parse ulang JSON.
+SESSION_PLACEHOLDER = "{{session}}"
+_SESSION_PLACEHOLDER_BYTES = SESSION_PLACEHOLDER.encode()
+
+def _context_short_name(name: str) -> str:
+    return name.rsplit("/contexts/", 1)[-1]
+
+def strip_session(response: dict) -> dict:
+    """
+    Buang session path dari outputContexts agar response bisa di-cache bersama.
+    Nama context disimpan dalam bentuk pendek, mis. "pilihjenjang-followup".
+    """
+    if "outputContexts" not in response:
+        return response
+    payload = dict(response)
+    payload["outputContexts"] = [
+        {**context, "name": _context_short_name(context.get("name", ""))}
+        for context in response["outputContexts"]
+    ]
+    return payload
+
+def attach_session(payload: dict, session: str) -> dict:
+    """Pasang kembali session path milik request saat ini ke outputContexts."""
+    if "outputContexts" not in payload:
+        return payload
+    payload["outputContexts"] = [
+        {**context, "name": f"{session}/contexts/{_context_short_name(context.get('name', ''))}"}
+        for context in payload["outputContexts"]
+    ]
+    return payload
+
+def dump_cacheable(response: dict) -> bytes:
+    """Serialisasi response ke JSON bytes siap kirim dengan placeholder session."""
+    return orjson.dumps(attach_session(strip_session(response), SESSION_PLACEHOLDER))
+
+def render_cached(cached: bytes, session: str) -> Response:
+    """
+    Bangun Response dari payload cache tanpa json.loads maupun encode ulang.
+    Payload format lama (tanpa placeholder) tetap didukung lewat jalur dict.
+    """
+    if _SESSION_PLACEHOLDER_BYTES not in cached:
+        payload = attach_session(json.loads(cached), session)
+        return Response(content=orjson.dumps(payload), media_type="application/json")
+    session_bytes = orjson.dumps(session)[1:-1]
+    return Response(
+        content=cached.replace(_SESSION_PLACEHOLDER_BYTES, session_bytes),
+        media_type="application/json"
+    )
@@ -1,8 +1,36 @@
+"""
+Sinkronisasi entity dan training phrase Dialogflow dari Firestore.
+
+Setiap target (entity SubjectName/LessonName, training phrase per intent)
+punya fingerprint SHA-256 dari daftar nilainya. Fingerprint terakhir yang
+berhasil di-sync disimpan di hash Redis `dialogflow:sync:fingerprints`; jika
+sama, target dilewati tanpa memanggil Dialogflow sama sekali. Jika berubah,
+hanya selisihnya yang dikirim: entity lewat batch_create/batch_update/
+batch_delete_entities, training phrase lewat update_intent dengan update_mask
+(phrase yang sudah ada dipertahankan apa adanya).
+
+Koleksi dibaca per halaman dengan cursor (`start_after`) dan hanya field yang
+dibutuhkan (`select`). Training phrase dibagi ke intent shard berisi maksimal
+DIALOGFLOW_MAX_PHRASES_PER_INTENT phrase (lihat `intent_shards`). Shard tiap
+phrase ditentukan dari hash teksnya dalam satu kali baca koleksi, jadi dokumen
+baru hanya mengubah satu shard dan shard lain tetap dilewati lewat
+fingerprint-nya masing-masing. Shard hanya menampung referensi ke string yang
+sudah disimpan set deduplikasi.
+
+Jalankan dari folder backend-android:
+    python -m chatbot.utils.sync_dialogflow [--force]
+"""
 from google.cloud import dialogflow
 from google.cloud import firestore
 from google.oauth2 import service_account
+from google.protobuf import field_mask_pb2
+from chatbot.utils.intent_shards import shard_intent_name, shard_index, assign_shards
+from concurrent.futures import ThreadPoolExecutor
 from os import getenv
+import argparse
+import hashlib
 import logging
+import redis
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,7 +47,20 @@ ENTITY_LESSON = "LessonName"
 INTENT_DISPLAY1 = "Pilih Topik Pelajaran"
 INTENT_DISPLAY2 = "Pilih Subbab"
 INTENT_DISPLAY3 = "Pilih Teori Subbab"
-MAX_PHRASES = 1000
+# Batas training phrase per intent di Dialogflow ES adalah 2000
+MAX_PHRASES_PER_INTENT = int(getenv("DIALOGFLOW_MAX_PHRASES_PER_INTENT", "2000"))
+# Target isi shard sebagai fraksi batas di atas; sisanya cadangan untuk sebaran hash yang tidak rata
+SHARD_FILL = float(getenv("DIALOGFLOW_SHARD_FILL", "0.8"))
+# Jumlah dokumen per halaman saat membaca koleksi Firestore
+SYNC_PAGE_SIZE = int(getenv("DIALOGFLOW_SYNC_PAGE_SIZE", "1000"))
+# Maksimal entity per panggilan batch_*_entities
+ENTITY_BATCH_SIZE = int(getenv("DIALOGFLOW_ENTITY_BATCH_SIZE", "500"))
+FINGERPRINT_KEY = "dialogflow:sync:fingerprints"
+
+SYNC_UNCHANGED = "unchanged"
+SYNC_UPDATED = "updated"
+SYNC_CREATED = "created"
+SYNC_FAILED = "failed"
 
 credentials = service_account.Credentials.from_service_account_file(
     CREDENTIALS_PATH)
@@ -29,117 +70,337 @@ df_entity_client = dialogflow.EntityTypesClient(credentials=credentials)
 df_intent_client = dialogflow.IntentsClient(credentials=credentials)
 df_parent = f"projects/{PROJECT_ID}/agent"
 
+# Sync berjalan di thread, jadi fingerprint disimpan lewat client Redis synchronous
+try:
+    fingerprint_redis = redis.Redis(host=getenv("REDIS_HOST"),
+                                    port=int(getenv("REDIS_PORT")),
+                                    password=getenv("REDIS_PASSWORD"),
+                                    decode_responses=True,
+                                    socket_connect_timeout=5,
+                                    socket_timeout=5)
+except Exception as e:
+    logging.error(f"❌ Gagal menginisialisasi Redis untuk fingerprint sync: {str(e)}")
+    fingerprint_redis = None
 
-def get_intent_by_display_name(display_name):
-    intents = df_intent_client.list_intents(request={"parent": df_parent})
-    return next((i for i in intents if i.display_name == display_name), None)
 
+def fingerprint(values):
+    """Fingerprint isi target; urutan dokumen di Firestore tidak berpengaruh."""
+    digest = hashlib.sha256()
+    for value in sorted(set(values)):
+        digest.update(value.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
 
-def sync_training_phrases(intent_display_name, phrases):
-    intent = get_intent_by_display_name(intent_display_name)
-    if not intent:
-        logging.error("❌ Intent '%s' tidak ditemukan!", intent_display_name)
+
+def _get_fingerprint(target):
+    if not fingerprint_redis:
+        return None
+    try:
+        return fingerprint_redis.hget(FINGERPRINT_KEY, target)
+    except Exception as e:
+        logging.error(f"❌ Gagal membaca fingerprint {target}: {str(e)}")
+        return None
+
+
+def _set_fingerprint(target, value):
+    if not fingerprint_redis:
+        return
+    try:
+        fingerprint_redis.hset(FINGERPRINT_KEY, target, value)
+    except Exception as e:
+        logging.error(f"❌ Gagal menyimpan fingerprint {target}: {str(e)}")
+
+
+def _delete_fingerprint(target):
+    if not fingerprint_redis:
         return
+    try:
+        fingerprint_redis.hdel(FINGERPRINT_KEY, target)
+    except Exception as e:
+        logging.error(f"❌ Gagal menghapus fingerprint {target}: {str(e)}")
+
+
+def iter_collection_values(collection, field, page_size=None):
+    """Yield nilai unik (tanpa spasi di tepi) dari satu field, per halaman berbasis cursor."""
+    page_size = page_size or SYNC_PAGE_SIZE
+    query = (firestore_client.collection(collection)
+             .select([field])
+             .order_by("__name__")
+             .limit(page_size))
+    seen = set()
+    last_doc = None
+    while True:
+        page = query.start_after(last_doc) if last_doc else query
+        count = 0
+        for doc in page.stream():
+            count += 1
+            last_doc = doc
+            value = (doc.to_dict() or {}).get(field)
+            if not isinstance(value, str) or not value.strip():
+                continue
+            value = value.strip()
+            if value not in seen:
+                seen.add(value)
+                yield value
+        if count < page_size:
+            return
+
 
-    training_phrases = [
-        dialogflow.Intent.TrainingPhrase(
-            parts=[dialogflow.Intent.TrainingPhrase.Part(text=phrase)])
-        for phrase in phrases
+def read_collection_values(collection, field):
+    return list(iter_collection_values(collection, field))
+
+
+def _batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def sync_entity(display_name, values, force=False):
+    target = f"entity:{display_name}"
+    current = fingerprint(values)
+    if not force and _get_fingerprint(target) == current:
+        logging.info("⏭️ Entity %s tidak berubah, sync dilewati", display_name)
+        return SYNC_UNCHANGED
+
+    entity_types = df_entity_client.list_entity_types(parent=df_parent,
+                                                      language_code=AGENT_LANGUAGE)
+    matched_entity = next(
+        (et for et in entity_types if et.display_name == display_name), None)
+
+    desired = {value: [value] for value in values}
+    if not matched_entity:
+        entity_type = dialogflow.EntityType(
+            display_name=display_name,
+            kind=dialogflow.EntityType.Kind.KIND_MAP,
+            entities=[
+                dialogflow.EntityType.Entity(value=value, synonyms=synonyms)
+                for value, synonyms in desired.items()
+            ])
+        df_entity_client.create_entity_type(parent=df_parent,
+                                            entity_type=entity_type,
+                                            language_code=AGENT_LANGUAGE)
+        _set_fingerprint(target, current)
+        logging.info("✨ Entity %s dibuat (%d nilai)", display_name, len(desired))
+        return SYNC_CREATED
+
+    existing = {entity.value: list(entity.synonyms) for entity in matched_entity.entities}
+    to_create = [
+        dialogflow.EntityType.Entity(value=value, synonyms=synonyms)
+        for value, synonyms in desired.items() if value not in existing
     ]
+    to_update = [
+        dialogflow.EntityType.Entity(value=value, synonyms=synonyms)
+        for value, synonyms in desired.items()
+        if value in existing and existing[value] != synonyms
+    ]
+    to_delete = [value for value in existing if value not in desired]
+
+    # Operasi batch bersifat long-running; result() memastikan selesai sebelum fingerprint disimpan
+    for batch in _batched(to_delete, ENTITY_BATCH_SIZE):
+        df_entity_client.batch_delete_entities(parent=matched_entity.name,
+                                               entity_values=batch,
+                                               language_code=AGENT_LANGUAGE).result()
+    for batch in _batched(to_create, ENTITY_BATCH_SIZE):
+        df_entity_client.batch_create_entities(parent=matched_entity.name,
+                                               entities=batch,
+                                               language_code=AGENT_LANGUAGE).result()
+    for batch in _batched(to_update, ENTITY_BATCH_SIZE):
+        df_entity_client.batch_update_entities(parent=matched_entity.name,
+                                               entities=batch,
+                                               language_code=AGENT_LANGUAGE).result()
+
+    _set_fingerprint(target, current)
+    logging.info("🔄 Entity %s: +%d ~%d -%d", display_name, len(to_create),
+                 len(to_update), len(to_delete))
+    return SYNC_UPDATED
+
+
+def _list_intents_full():
+    """Semua intent beserta training phrase-nya dalam satu list_intents."""
+    intents = df_intent_client.list_intents(request={
+        "parent": df_parent,
+        "language_code": AGENT_LANGUAGE,
+        "intent_view": dialogflow.IntentView.INTENT_VIEW_FULL,
+    })
+    return {intent.display_name: intent for intent in intents}
 
+
+class _IntentCache:
+    """list_intents baru dipanggil saat pertama kali ada target yang berubah."""
+
+    def __init__(self, intents=None):
+        self._intents = intents
+
+    def get(self):
+        if self._intents is None:
+            self._intents = _list_intents_full()
+        return self._intents
+
+
+def _phrase_text(training_phrase):
+    return "".join(part.text for part in training_phrase.parts).strip()
+
+
+def _new_phrase(text):
+    return dialogflow.Intent.TrainingPhrase(
+        parts=[dialogflow.Intent.TrainingPhrase.Part(text=text)])
+
+
+def _create_shard_intent(template, display_name, phrases):
+    """Intent shard baru dengan respons, parameter, dan context yang sama dengan intent asal."""
+    intent = dialogflow.Intent(display_name=display_name,
+                               training_phrases=[_new_phrase(p) for p in phrases],
+                               messages=template.messages,
+                               parameters=template.parameters,
+                               input_context_names=template.input_context_names,
+                               output_contexts=template.output_contexts,
+                               action=template.action,
+                               priority=template.priority,
+                               webhook_state=dialogflow.Intent.WebhookState.WEBHOOK_STATE_ENABLED)
+    return df_intent_client.create_intent(parent=df_parent, intent=intent,
+                                          language_code=AGENT_LANGUAGE)
+
+
+def sync_training_phrases(intent_display_name, phrases, force=False, intents=None,
+                          template_name=None):
+    """Sinkronkan satu intent; jika belum ada dan template_name diisi, intent dibuat dari template."""
+    target = f"intent:{intent_display_name}"
+    current = fingerprint(phrases)
+    if not force and _get_fingerprint(target) == current:
+        logging.info("⏭️ Training phrase intent '%s' tidak berubah, sync dilewati",
+                     intent_display_name)
+        return SYNC_UNCHANGED
+
+    intents = intents or _IntentCache()
+    intent = intents.get().get(intent_display_name)
+    if not intent:
+        template = intents.get().get(template_name) if template_name else None
+        if not template:
+            logging.error("❌ Intent '%s' tidak ditemukan!", intent_display_name)
+            return SYNC_FAILED
+        intents.get()[intent_display_name] = _create_shard_intent(template, intent_display_name, phrases)
+        _set_fingerprint(target, current)
+        logging.info("✨ Intent shard '%s' dibuat (%d phrase)", intent_display_name, len(phrases))
+        return SYNC_CREATED
+
+    existing = {}
+    for training_phrase in intent.training_phrases:
+        existing.setdefault(_phrase_text(training_phrase), training_phrase)
+
+    webhook_enabled = intent.webhook_state == dialogflow.Intent.WebhookState.WEBHOOK_STATE_ENABLED
+    added = [phrase for phrase in phrases if phrase not in existing]
+    removed = len(set(existing) - set(phrases))
+    if not added and not removed and webhook_enabled:
+        _set_fingerprint(target, current)
+        logging.info("✅ Training phrase intent '%s' sudah sesuai", intent_display_name)
+        return SYNC_UNCHANGED
+
+    # Phrase lama dipakai ulang agar nama dan anotasinya tidak berubah
+    training_phrases = [existing.get(phrase) or _new_phrase(phrase) for phrase in phrases]
     updated_intent = dialogflow.Intent(name=intent.name,
-                                       display_name=intent.display_name,
                                        training_phrases=training_phrases,
-                                       messages=intent.messages,
-                                       parameters=intent.parameters,
                                        webhook_state=dialogflow.Intent.WebhookState.WEBHOOK_STATE_ENABLED)
 
-    df_intent_client.update_intent(intent=updated_intent,
-                                   language_code=AGENT_LANGUAGE)
-    logging.info("✅ Sinkronisasi training phrase ke intent '%s' selesai",
-                 intent_display_name)
+    df_intent_client.update_intent(
+        intent=updated_intent,
+        language_code=AGENT_LANGUAGE,
+        update_mask=field_mask_pb2.FieldMask(paths=["training_phrases", "webhook_state"]))
+    _set_fingerprint(target, current)
+    logging.info("✅ Training phrase intent '%s': +%d -%d", intent_display_name,
+                 len(added), removed)
+    return SYNC_UPDATED
 
 
-def sync_subjects_to_entity():
-    subjects = firestore_client.collection("subjects").stream()
-    entities = [
-        dialogflow.EntityType.Entity(value=name, synonyms=[name])
-        for doc in subjects if (name := doc.to_dict().get("name"))
-    ]
+def sync_sharded_training_phrases(base_name, phrases, force=False, intents=None):
+    """
+    Sinkronkan phrases (iterable, boleh generator) ke intent base_name dan shard-nya.
+    Shard yang tidak lagi dibutuhkan karena katalog menyusut dihapus.
+    """
+    intents = intents or _IntentCache()
+    results = {}
+    shards = assign_shards(phrases, MAX_PHRASES_PER_INTENT, SHARD_FILL)
+    for index, chunk in enumerate(shards):
+        name = shard_intent_name(base_name, index)
+        template_name = base_name if index else None
+        results[name] = sync_training_phrases(name, chunk, force, intents, template_name=template_name)
+    shard_count = len(shards)
 
-    entity_types = df_entity_client.list_entity_types(parent=df_parent)
-    matched_entity = next(
-        (et for et in entity_types if et.display_name == ENTITY_SUBJECT), None)
-
-    entity_type = dialogflow.EntityType(
-        display_name=ENTITY_SUBJECT,
-        kind=dialogflow.EntityType.Kind.KIND_MAP,
-        entities=entities)
-
-    if matched_entity:
-        entity_type.name = matched_entity.name
-        df_entity_client.update_entity_type(entity_type=entity_type)
-        logging.info("🔄 Entity SubjectName diperbarui")
-    else:
-        df_entity_client.create_entity_type(parent=df_parent,
-                                            entity_type=entity_type)
-        logging.info("✨ Entity SubjectName dibuat")
+    shards_target = f"intent:{base_name}:shards"
+    stored = _get_fingerprint(shards_target)
+    if force or stored is None or int(stored) > shard_count:
+        for display_name, intent in list(intents.get().items()):
+            if shard_index(display_name, base_name) >= shard_count:
+                df_intent_client.delete_intent(name=intent.name)
+                intents.get().pop(display_name)
+                _delete_fingerprint(f"intent:{display_name}")
+                results[display_name] = "deleted"
+                logging.info("🗑️ Intent shard '%s' dihapus", display_name)
+    _set_fingerprint(shards_target, str(shard_count))
+    return results
 
 
-def sync_lessons_to_entity():
-    lessons = firestore_client.collection("lessons").stream()
-    entities = [
-        dialogflow.EntityType.Entity(value=title, synonyms=[title])
-        for doc in lessons if (title := doc.to_dict().get("title"))
-    ]
+def sync_subjects_to_entity(force=False, subjects=None):
+    if subjects is None:
+        subjects = read_collection_values("subjects", "name")
+    return sync_entity(ENTITY_SUBJECT, subjects, force)
 
-    entity_types = df_entity_client.list_entity_types(parent=df_parent)
-    matched_entity = next(
-        (et for et in entity_types if et.display_name == ENTITY_LESSON), None)
-
-    entity_type = dialogflow.EntityType(
-        display_name=ENTITY_LESSON,
-        kind=dialogflow.EntityType.Kind.KIND_MAP,
-        entities=entities)
-
-    if matched_entity:
-        entity_type.name = matched_entity.name
-        df_entity_client.update_entity_type(entity_type=entity_type)
-        logging.info("🔄 Entity LessonName diperbarui")
-    else:
-        df_entity_client.create_entity_type(parent=df_parent,
-                                            entity_type=entity_type)
-        logging.info("✨ Entity LessonName dibuat")
 
+def sync_lessons_to_entity(force=False, lessons=None):
+    if lessons is None:
+        lessons = read_collection_values("lessons", "title")
+    return sync_entity(ENTITY_LESSON, lessons, force)
 
-def sync_all_training_phrases():
-    subject_docs = firestore_client.collection("subjects").limit(
-        MAX_PHRASES).stream()
-    subject_phrases = [
-        doc.to_dict().get("name") for doc in subject_docs
-        if doc.to_dict().get("name")
-    ]
-    sync_training_phrases(INTENT_DISPLAY1, subject_phrases)
 
-    lesson_docs = firestore_client.collection("lessons").limit(
-        MAX_PHRASES).stream()
-    lesson_phrases = [
-        doc.to_dict().get("title") for doc in lesson_docs
-        if doc.to_dict().get("title")
+def sync_all_training_phrases(force=False, subjects=None, lessons=None):
+    """subjects/lessons boleh diisi daftar yang sudah dibaca; sub_bab selalu dibaca bertahap."""
+    targets = [
+        (INTENT_DISPLAY1, subjects if subjects is not None else iter_collection_values("subjects", "name")),
+        (INTENT_DISPLAY2, lessons if lessons is not None else iter_collection_values("lessons", "title")),
+        (INTENT_DISPLAY3, iter_collection_values("sub_bab", "title")),
     ]
-    sync_training_phrases(INTENT_DISPLAY2, lesson_phrases)
+    # Satu list_intents dipakai bersama semua intent, dan hanya jika ada yang berubah
+    intents = _IntentCache()
+    results = {}
+    for name, phrases in targets:
+        results.update(sync_sharded_training_phrases(name, phrases, force, intents))
+    return results
 
-    subbab_docs = firestore_client.collection("sub_bab").limit(
-        MAX_PHRASES).stream()
-    subbab_phrases = [
-        doc.to_dict().get("title") for doc in subbab_docs
-        if doc.to_dict().get("title")
-    ]
-    sync_training_phrases(INTENT_DISPLAY3, subbab_phrases)
+
+def sync_all(force=False):
+    """Baca subjects & lessons sekali, lalu jalankan tiga sync secara paralel."""
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        subjects_future = pool.submit(read_collection_values, "subjects", "name")
+        lessons_future = pool.submit(read_collection_values, "lessons", "title")
+        subjects = subjects_future.result()
+        lessons = lessons_future.result()
+
+        futures = {
+            ENTITY_SUBJECT: pool.submit(sync_subjects_to_entity, force, subjects),
+            ENTITY_LESSON: pool.submit(sync_lessons_to_entity, force, lessons),
+            "training_phrases": pool.submit(sync_all_training_phrases, force,
+                                            subjects, lessons),
+        }
+
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            logging.error(f"❌ Sync {name} gagal: {str(e)}")
+            results[name] = SYNC_FAILED
+    return results
 
 
 if __name__ == "__main__":
-    sync_subjects_to_entity()
-    sync_lessons_to_entity()
-    sync_all_training_phrases()
-    print("✅ Sinkronisasi entity & training phrase selesai!")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sinkronisasi entity & training phrase Dialogflow.")
+    parser.add_argument("--force", action="store_true",
+                        help="Abaikan fingerprint dan bandingkan ulang dengan Dialogflow")
+    args = parser.parse_args()
+    print(sync_all(force=args.force))
+    print("✅ Sinkronisasi entity & training phrase selesai!")
@@ -0,0 +1,66 @@
+"""
+Konteks satu request webhook Dialogflow, di-parse sekali di `main.webhook`.
+
+Semua handler menerima `WebhookContext` sehingga tidak perlu memanggil
+`req.dict()` atau memindai daftar context berulang kali. Context Dialogflow
+disimpan dalam dict dengan key nama pendeknya (bagian setelah `/contexts/`),
+jadi pencarian context dan parameternya O(1).
+"""
+
+from dataclasses import dataclass, field
+from fastapi import BackgroundTasks
+from typing import Any, Dict, Optional
+
+@dataclass(frozen=True)
+class DialogflowContext:
+    short_name: str
+    name: str
+    lifespan_count: int
+    parameters: Dict[str, Any]
+
+@dataclass
+class WebhookContext:
+    session: str
+    intent: str
+    query_text: str
+    contexts: Dict[str, DialogflowContext] = field(default_factory=dict)
+    background_task: Optional[BackgroundTasks] = None
+
+    @classmethod
+    def from_request(cls, query_result: dict, session: str,
+                     background_task: Optional[BackgroundTasks] = None) -> "WebhookContext":
+        contexts: Dict[str, DialogflowContext] = {}
+        # outputContexts lebih dulu: jika nama sama muncul di inputContexts, versi output yang dipakai
+        for raw in query_result.get("outputContexts", []) + query_result.get("inputContexts", []):
+            name = raw.get("name", "")
+            short_name = name.rsplit("/contexts/", 1)[-1]
+            if short_name and short_name not in contexts:
+                contexts[short_name] = DialogflowContext(
+                    short_name=short_name,
+                    name=name,
+                    lifespan_count=raw.get("lifespanCount", 0),
+                    parameters=raw.get("parameters") or {},
+                )
+        return cls(
+            session=session,
+            intent=query_result.get("intent", {}).get("displayName", ""),
+            query_text=query_result.get("queryText", "").strip(),
+            contexts=contexts,
+            background_task=background_task,
+        )
+
+    def has_context(self, short_name: str) -> bool:
+        return short_name in self.contexts
+
+    def param(self, context: str, key: str) -> Optional[str]:
+        """Parameter context sebagai string (tanpa spasi di tepi), None jika kosong/tidak ada."""
+        ctx = self.contexts.get(context)
+        if ctx is None:
+            return None
+        value = ctx.parameters.get(key)
+        if value is None or value == "":
+            return None
+        return value.strip() if isinstance(value, str) else str(value)
+
+    def context_name(self, short_name: str) -> str:
+        return f"{self.session}/contexts/{short_name}"
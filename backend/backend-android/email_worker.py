@@ -0,0 +1,120 @@
+"""
+Worker pengirim email: membaca job dari outbox Redis Stream dan mengirimnya lewat SMTP.
+
+Jalankan terpisah dari web server:
+    python email_worker.py
+
+Konfigurasi lewat environment:
+    EMAIL_WORKER_CONCURRENCY    jumlah email yang dikirim bersamaan (default 2)
+    EMAIL_WORKER_NAME           nama consumer (default hostname-pid)
+    EMAIL_JOB_MAX_DELIVERIES    batas percobaan sebelum job masuk dead-letter
+    EMAIL_JOB_CLAIM_IDLE_MS     jeda sebelum email yang gagal dicoba ulang
+"""
+from os import getenv
+import asyncio
+import json
+import logging
+import socket
+import os
+import sys
+import time
+
+from chatbot.services.stream_worker import StreamWorker, PermanentJobError, run_until_signalled
+from send_email.outbox import outbox_queue, STATUS_SENDING, STATUS_RETRYING, STATUS_SENT, STATUS_DEAD, update_status, get_statuses
+from send_email.background_task import EMAIL_SENDERS
+from send_email.send_email import BULK_MESSAGE_BUILDERS, send_bulk_emails
+from send_email.smtp_pool import close_all_pools
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+
+CONCURRENCY = int(getenv("EMAIL_WORKER_CONCURRENCY", "2"))
+CONSUMER_NAME = getenv("EMAIL_WORKER_NAME", f"{socket.gethostname()}-{os.getpid()}")
+
+class EmailWorker(StreamWorker):
+    label = "email"
+
+    def __init__(self, concurrency: int = CONCURRENCY, consumer_name: str = CONSUMER_NAME, client=None):
+        super().__init__(outbox_queue, concurrency, consumer_name, client=client)
+
+    async def handle(self, job_id: str, fields: dict, attempt: int) -> bool:
+        if "batch" in fields:
+            return await self.handle_batch(fields, attempt)
+        kind = fields.get("kind")
+        message_id = fields.get("message_id", "")
+        sender = EMAIL_SENDERS.get(kind)
+        if not sender:
+            raise PermanentJobError(f"jenis email tidak dikenal: {kind}")
+        await update_status(message_id, STATUS_SENDING, client=self.client, attempts=attempt)
+        try:
+            # Fungsi pengirim synchronous (smtplib), jalankan di thread. Pengirim tidak pernah
+            # sleep: percobaan ulang diatur stream (klaim ulang setelah EMAIL_JOB_CLAIM_IDLE_MS)
+            ok = await asyncio.to_thread(sender, **json.loads(fields.get("args", "{}")))
+            error = None if ok else "SMTP gagal mengirim"
+        except ValueError as e:
+            # Alamat/argumen tidak valid tidak akan berhasil walau dicoba ulang
+            raise PermanentJobError(str(e))
+        except Exception as e:
+            ok, error = False, str(e)
+        if ok:
+            await update_status(message_id, STATUS_SENT, client=self.client, sent_at=time.time())
+            logging.info(f"✅ Email {message_id} ({kind}) terkirim")
+        else:
+            await update_status(message_id, STATUS_RETRYING, client=self.client, last_error=error)
+            logging.warning(f"⚠️ Email {message_id} ({kind}) gagal dikirim: {error}")
+        return ok
+
+    async def handle_batch(self, fields: dict, attempt: int) -> bool:
+        """Email massal: semua penerima yang belum terkirim dikirim lewat satu sesi SMTP."""
+        kind = fields.get("kind")
+        if kind not in BULK_MESSAGE_BUILDERS:
+            raise PermanentJobError(f"jenis email massal tidak dikenal: {kind}")
+        batch = json.loads(fields["batch"])
+        # Percobaan ulang: penerima yang sudah terkirim di percobaan sebelumnya dilewati
+        statuses = await get_statuses([item["message_id"] for item in batch], client=self.client)
+        pending = [item for item, status in zip(batch, statuses) if status != STATUS_SENT]
+        if not pending:
+            return True
+        for item in pending:
+            await update_status(item["message_id"], STATUS_SENDING, client=self.client, attempts=attempt)
+        users = [
+            {"name": item["args"]["user_name"], "email": item["args"]["user_email"], "role": item["args"]["user_role"]}
+            for item in pending
+        ]
+        try:
+            results = await asyncio.to_thread(send_bulk_emails, kind, users)
+        except ValueError as e:
+            raise PermanentJobError(str(e))
+        except Exception as e:
+            results = [{"status": "failed", "error": str(e)} for _ in pending]
+        failed = 0
+        for item, result in zip(pending, results):
+            if result["status"] == "failed":
+                failed += 1
+                await update_status(item["message_id"], STATUS_RETRYING, client=self.client,
+                                    last_error=result.get("error", "SMTP gagal mengirim"))
+            else:
+                await update_status(item["message_id"], STATUS_SENT, client=self.client, sent_at=time.time())
+        log = logging.warning if failed else logging.info
+        log(f"📬 Email massal {kind}: {len(pending) - failed}/{len(pending)} terkirim")
+        return not failed
+
+    async def on_dead_letter(self, job_id: str, fields: dict, reason: str):
+        if "batch" in fields:
+            batch = json.loads(fields["batch"])
+            statuses = await get_statuses([item["message_id"] for item in batch], client=self.client)
+            for item, status in zip(batch, statuses):
+                if status != STATUS_SENT:
+                    await update_status(item["message_id"], STATUS_DEAD, client=self.client, last_error=reason)
+            return
+        if fields.get("message_id"):
+            await update_status(fields["message_id"], STATUS_DEAD, client=self.client, last_error=reason)
+
+    async def shutdown(self):
+        close_all_pools()
+
+if __name__ == "__main__":
+    asyncio.run(run_until_signalled(EmailWorker()))
@@ -0,0 +1,75 @@
+"""
+Worker generasi Gemini: membaca job dari Redis Stream dan menyimpan jawaban ke Redis.
+
+Jalankan terpisah dari web server:
+    python gemini_worker.py
+
+Konfigurasi lewat environment:
+    GEMINI_WORKER_CONCURRENCY   jumlah job yang diproses bersamaan (default 4)
+    GEMINI_WORKER_NAME          nama consumer (default hostname-pid)
+    GEMINI_JOB_MAX_DELIVERIES   batas percobaan sebelum job masuk dead-letter
+    GEMINI_JOB_CLAIM_IDLE_MS    job pending lebih lama dari ini diklaim ulang
+"""
+from os import getenv
+import asyncio
+import logging
+import socket
+import os
+import sys
+
+from chatbot.services.stream_worker import StreamWorker, PermanentJobError, run_until_signalled
+from chatbot.services.gemini_queue import job_queue, JOB_THEORY, JOB_CUSTOM
+from chatbot.services.gemini_service_async import startup_gemini_client, shutdown_gemini_client
+from chatbot.services.gemini_progress import finish_progress
+from chatbot.services.inflight_registry import refresh_generation, release_generation
+from chatbot.handlers import theory_with_gemini, custom_question
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+
+CONCURRENCY = int(getenv("GEMINI_WORKER_CONCURRENCY", "4"))
+CONSUMER_NAME = getenv("GEMINI_WORKER_NAME", f"{socket.gethostname()}-{os.getpid()}")
+
+JOB_HANDLERS = {
+    JOB_THEORY: theory_with_gemini.generate_and_cache_gemini_answer,
+    JOB_CUSTOM: custom_question.generate_and_cache_gemini_answer,
+}
+
+class GeminiWorker(StreamWorker):
+    label = "Gemini"
+    # Klaim inflight diperpanjang selama job masih antre atau menunggu dicoba ulang
+    tracks_open_jobs = True
+
+    def __init__(self, concurrency: int = CONCURRENCY, consumer_name: str = CONSUMER_NAME, client=None):
+        super().__init__(job_queue, concurrency, consumer_name, client=client)
+
+    async def handle(self, job_id: str, fields: dict, attempt: int) -> bool:
+        kind = fields.get("kind")
+        handler = JOB_HANDLERS.get(kind)
+        if not handler:
+            raise PermanentJobError(f"jenis job tidak dikenal: {kind}")
+        # Hanya percobaan terakhir yang boleh mengabarkan gagal dan melepas klaim
+        final = attempt >= self.queue.max_deliveries
+        return await handler(fields.get("prompt", ""), fields.get("cache_key", ""), final=final)
+
+    async def on_dead_letter(self, job_id: str, fields: dict, reason: str):
+        # Mis. worker mati di percobaan terakhir: penunggu tetap harus dikabari
+        if fields.get("cache_key"):
+            await finish_progress(fields["cache_key"], False)
+            await release_generation(fields["cache_key"])
+
+    async def on_open_job(self, fields: dict):
+        if fields.get("cache_key"):
+            await refresh_generation(fields["cache_key"])
+
+    async def startup(self):
+        await startup_gemini_client()
+
+    async def shutdown(self):
+        await shutdown_gemini_client()
+
+if __name__ == "__main__":
+    asyncio.run(run_until_signalled(GeminiWorker()))
@@ -1,18 +1,30 @@
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+from fastapi import FastAPI, BackgroundTasks, Header, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from os import getenv
+from typing import List, Optional
+import json
 import logging
 import sys
-from chatbot.handlers.theory_with_gemini import get_theory_from_subbab
-from chatbot.handlers.subject import handle_subjects_by_level
-from chatbot.handlers.lessons import handle_lessons_by_subject_name_level
-from chatbot.handlers.subbab import handle_subbab_by_lessonid
-from chatbot.handlers.general import handle_welcome
-from chatbot.handlers.custom_question import handle_custom_question
+from chatbot.handlers.router import dispatch
+from chatbot.utils.webhook_context import WebhookContext
 from chatbot.services.redis_client import redis_client
+from chatbot.services import curriculum_catalog
+from chatbot.services import theory_store
+from chatbot.handlers.theory_with_gemini import PROMPT_VERSION
+from chatbot.services.two_tier_cache import chip_cache
+from chatbot.services.gemini_progress import STATUS_COMPLETE, STATUS_PARTIAL, EVENT_COMPLETE
+from chatbot.services.progress_hub import progress_hub, wait_for_result, iter_progress
+from chatbot.services.gemini_scheduler import gemini_scheduler
+from chatbot.services.gemini_breaker import gemini_breaker
+from chatbot.services.inline_answer import get_outcome_stats
+from chatbot.services.gemini_service_async import startup_gemini_client, shutdown_gemini_client
 from chatbot.utils.dialogflow_token import get_dialogflow_token
-from send_email.send_email import send_email_to_admin, send_email_approve_to_user, send_email_unapprove_to_user
-from send_email.background_task import _enqueue_email
-from chatbot.utils.sync_dialogflow import sync_subjects_to_entity, sync_lessons_to_entity, sync_all_training_phrases
+from send_email.background_task import schedule_email, schedule_bulk_emails
+from send_email.send_email import validate_bulk_emails
+from send_email.outbox import KIND_ADMIN, KIND_APPROVE, KIND_UNAPPROVE, get_email_status
+from send_email.smtp_pool import close_all_pools
+from chatbot.services.sync_runner import start_background_sync, stop_background_sync, get_sync_status
 
 # Konfigurasi logging yang lebih robust
 logging.basicConfig(
@@ -33,24 +45,32 @@ app = FastAPI()
 async def startup_event():
     """
     Event handler yang dijalankan saat aplikasi FastAPI start.
-    Menjalankan sync_dialogflow untuk sinkronisasi entity dan training phrases.
+    Sinkronisasi entity dan training phrases Dialogflow dijadwalkan di background
+    (hanya satu worker yang menjalankannya), jadi startup tidak menunggu Dialogflow.
     """
-    import asyncio
     try:
         logging.info("🚀 Aplikasi sedang starting up...")
-        logging.info("🔄 Memulai sinkronisasi Dialogflow...")
-        
-        # Jalankan sync_dialogflow di thread pool karena fungsi-fungsi sync adalah synchronous
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, sync_subjects_to_entity)
-        await loop.run_in_executor(None, sync_lessons_to_entity)
-        await loop.run_in_executor(None, sync_all_training_phrases)
-        
-        logging.info("✅ Sinkronisasi Dialogflow selesai!")
+        curriculum_catalog.start_catalog()
+        await startup_gemini_client()
+        start_background_sync()
+        # Jawaban teori dari versi prompt lama dibersihkan sekali per versi
+        theory_store.start_version_sweep(PROMPT_VERSION)
         logging.info("✅ Aplikasi siap menerima request")
     except Exception as e:
-        logging.error(f"❌ Error saat startup sync_dialogflow: {str(e)}")
-        logging.warning("⚠️ Aplikasi tetap berjalan meskipun sync_dialogflow gagal")
+        logging.error(f"❌ Error saat startup: {str(e)}")
+        logging.warning("⚠️ Aplikasi tetap berjalan meskipun startup tidak lengkap")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Event handler yang dijalankan saat aplikasi FastAPI berhenti.
+    """
+    curriculum_catalog.stop_catalog()
+    await stop_background_sync()
+    await shutdown_gemini_client()
+    close_all_pools()
+    if progress_hub:
+        await progress_hub.close()
 
 class DialogflowRequest(BaseModel):
     queryResult: dict
@@ -79,168 +99,244 @@ async def webhook(req: DialogflowRequest, background_task: BackgroundTasks):
             logging.error("❌ queryResult kosong")
             raise HTTPException(status_code=400, detail="Invalid request: queryResult is required")
         
-        intent = req.queryResult.get("intent", {}).get("displayName", "")
-        query_text = req.queryResult.get("queryText", "").strip()
-        output_contexts = req.queryResult.get("outputContexts", [])
-        input_contexts = req.queryResult.get("inputContexts", [])
-        
-        logging.info(f"🎯 Intent yang diterima: '{intent}'")
-        logging.info(f"💬 Query text: '{query_text}'")
-        
-        # Cek apakah ada context waiting_custom_answer di inputContexts ATAU outputContexts
-        # Context yang dibuat di response sebelumnya akan muncul sebagai inputContexts di request berikutnya
-        all_contexts = input_contexts + output_contexts
-        has_waiting_context = any(
-            "waiting_custom_answer" in context.get("name", "")
-            for context in all_contexts
-        )
-        
-        if has_waiting_context:
-            logging.info(f"✅ Context waiting_custom_answer ditemukan (inputContexts: {len(input_contexts)}, outputContexts: {len(output_contexts)})")
-        
-        # Handle Default Fallback Intent dengan context waiting_custom_answer
-        if intent == "Default Fallback Intent" and has_waiting_context and query_text:
-            logging.info("💭 Fallback intent dengan context waiting_custom_answer - treat as Custom Pertanyaan")
-            return await handle_custom_question(req, background_task)
+        ctx = WebhookContext.from_request(req.queryResult, req.session, background_task)
         
-        # PRIORITAS: Jika ada context waiting_custom_answer aktif, semua input diarahkan ke custom question
-        # Kecuali intent khusus yang harus diabaikan (Welcome, Mulai, Menu Utama)
-        # Catatan: "Tanya Lagi ke AI" tetap diizinkan untuk memperpanjang context
-        if has_waiting_context and query_text and intent not in ["Welcome", "Mulai", "Menu Utama"]:
-            logging.info(f"💬 Context waiting_custom_answer aktif - mengarahkan intent '{intent}' ke Custom Pertanyaan")
-            return await handle_custom_question(req, background_task)
+        logging.info(f"🎯 Intent yang diterima: '{ctx.intent}'")
+        logging.info(f"💬 Query text: '{ctx.query_text}'")
         
-        if not intent:
-            logging.warning("⚠️ Intent kosong")
-            return {"fulfillmentText": "Maaf, intent tidak dikenali."}
-            
-        if intent in ["Welcome", "Mulai", "Menu Utama"]:
-            logging.info("🏠 Menangani intent Welcome/Mulai/Menu Utama - Reset semua context")
-            return await handle_welcome(req.session)
-        elif intent == "Pilih Jenjang SD":
-            logging.info("📚 Menangani intent Pilih Jenjang SD")
-            return await handle_subjects_by_level("sd", req)
-        elif intent == "Pilih Jenjang SMP":
-            logging.info("📚 Menangani intent Pilih Jenjang SMP")
-            return await handle_subjects_by_level("smp", req)
-        elif intent == "Pilih Jenjang SMA":
-            logging.info("📚 Menangani intent Pilih Jenjang SMA")
-            return await handle_subjects_by_level("sma", req)
-        elif intent == "Pilih Topik Pelajaran":
-            logging.info("📖 Menangani intent Pilih Topik Pelajaran")
-            return await handle_lessons_by_subject_name_level(req)
-        elif intent == "Pilih Subbab":
-            logging.info("📝 Menangani intent Pilih Subbab")
-            return await handle_subbab_by_lessonid(req)
-        elif intent == "Pilih Teori Subbab":
-            logging.info("🧠 Menangani intent Pilih Teori Subbab")
-            return await get_theory_from_subbab(req, background_task)
-        elif intent == "Tanya Lagi ke AI":
-            logging.info("🤖 Menangani intent Tanya Lagi ke AI")
-            return await handle_custom_question(req, background_task)
-        elif intent == "Custom Pertanyaan":
-            logging.info("💬 Menangani intent Custom Pertanyaan")
-            return await handle_custom_question(req, background_task)
-        
-        logging.warning(f"⚠️ Intent tidak dikenali: '{intent}'")
-        return {"fulfillmentText": "Maaf, intent tidak dikenali."}
+        return await dispatch(ctx)
     except Exception as e:
         logging.error(f"❌ Error in webhook: {str(e)}")
         return {"fulfillmentText": "Terjadi kesalahan internal. Silakan coba lagi."}
 
+# Batas waktu tunggu long-poll /check-gemini-result dan durasi maksimal stream SSE (detik)
+GEMINI_LONGPOLL_MAX = float(getenv("GEMINI_LONGPOLL_MAX", "25"))
+GEMINI_SSE_TIMEOUT = float(getenv("GEMINI_SSE_TIMEOUT", "120"))
+
+def _gemini_ready_response(text: str) -> dict:
+    chips = [
+        {"text": "💬 Tanya Lagi ke AI"},
+        {"text": "🏠 Menu Utama"}
+    ]
+    return {
+        "status": "ready",
+        "fulfillmentMessages": [
+            {"text": {"text": [f"🤖 Gemini Bot:\n{text}"]}},
+            {"text": {"text": ["🤖 Chatbot:\nIngin bertanya lagi atau kembali ke menu?:"]}},
+            {"payload": {"richContent": [[{"type": "chips", "options": chips}]]}}
+        ]
+    }
+
 @app.get("/check-gemini-result", tags=["Chatbot"])
-async def check_gemini_result(cache_key: str):
+async def check_gemini_result(cache_key: str, wait: float = 0):
+    """
+    Cek hasil Gemini. Dengan `wait` > 0 (detik, maksimal GEMINI_LONGPOLL_MAX),
+    request ditahan sampai jawaban lengkap atau waktu habis (long-poll).
+    """
     logging.info(f"🔍 Checking Gemini result for cache_key: {cache_key}")
-    cached = await redis_client.get(cache_key)
-    if cached:
+    status, text = await wait_for_result(cache_key, min(max(wait, 0), GEMINI_LONGPOLL_MAX))
+    if status == STATUS_COMPLETE:
         logging.info(f"✅ Cache found for key: {cache_key}")
-        logging.info(f"📝 Cached answer length: {len(cached)} characters")
-        chips = [
-            {"text": "💬 Tanya Lagi ke AI"},
-            {"text": "🏠 Menu Utama"}
-        ]
-        response = {
-            "status": "ready",
+        logging.info(f"📝 Cached answer length: {len(text)} characters")
+        response = _gemini_ready_response(text)
+        logging.info(f"📤 Returning response with {len(response['fulfillmentMessages'])} messages")
+        return response
+    if status == STATUS_PARTIAL:
+        # Client tetap polling sampai status "ready"; teks sementara bisa langsung ditampilkan
+        logging.info(f"✍️ Partial answer for key: {cache_key} ({len(text)} characters)")
+        return {
+            "status": "partial",
             "fulfillmentMessages": [
-                {"text": {"text": [f"🤖 Gemini Bot:\n{cached}"]}},
-                {"text": {"text": ["🤖 Chatbot:\nIngin bertanya lagi atau kembali ke menu?:"]}},
-                {"payload": {"richContent": [[{"type": "chips", "options": chips}]]}}
+                {"text": {"text": [f"🤖 Gemini Bot:\n{text}"]}}
             ]
         }
-        logging.info(f"📤 Returning response with {len(response['fulfillmentMessages'])} messages")
-        return response
     logging.info(f"⏳ Cache not found for key: {cache_key} - returning pending status")
     return {"status": "pending"}
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/gemini-result-stream", tags=["Chatbot"])
+async def gemini_result_stream(cache_key: str):
+    """
+    Server-Sent Events untuk hasil Gemini: `partial` (teks sejauh ini), `chunk`
+    (potongan baru), `retry` (percobaan gagal dan diulang; buang teks sebelumnya),
+    lalu `ready` (respons sama seperti /check-gemini-result), `failed`, atau `timeout`.
+    """
+    if not progress_hub:
+        raise HTTPException(status_code=503, detail="Redis tidak tersedia")
+
+    async def events():
+        async for event, text in iter_progress(cache_key, GEMINI_SSE_TIMEOUT):
+            if event == "keepalive":
+                yield ": keepalive\n\n"
+            elif event == EVENT_COMPLETE:
+                yield _sse("ready", _gemini_ready_response(text))
+            else:
+                yield _sse(event, {"text": text})
+
+    logging.info(f"📡 SSE dibuka untuk cache_key: {cache_key}")
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/catalog-status", tags=["Chatbot"])
+async def catalog_status():
+    """
+    Endpoint untuk melihat status katalog kurikulum in-memory.
+    """
+    return curriculum_catalog.status()
+
+@app.get("/sync-status", tags=["Chatbot"])
+async def sync_status():
+    """
+    Endpoint untuk melihat hasil sinkronisasi Dialogflow terakhir
+    (runner, waktu mulai/selesai, durasi, dan hasil per target).
+    """
+    return await get_sync_status()
+
+@app.get("/gemini-stats", tags=["Chatbot"])
+async def gemini_stats():
+    """
+    Endpoint untuk melihat status penjadwal Gemini (slot aktif, antrean, penolakan per prioritas)
+    dan circuit breaker (state, error di jendela bergulir, timeout adaptif) di worker ini,
+    serta rasio jawaban cache hit / inline / deferred per jenis.
+    """
+    return {
+        "scheduler": await gemini_scheduler.stats(),
+        "breaker": gemini_breaker.stats(),
+        "answers": await get_outcome_stats(),
+    }
+
+@app.get("/cache-stats", tags=["Reddis"])
+async def cache_stats():
+    """
+    Endpoint untuk melihat statistik cache chip (hit/miss/refill per namespace).
+    """
+    return chip_cache.stats()
+
 @app.get("/clear-all-cache", tags=["Reddis"])
 async def clear_all_cache():
     """
     Endpoint untuk menghapus semua cache Redis.
     """
     await redis_client.flushall()
+    chip_cache.clear()
     return {"status": "✅ Semua cache Redis telah dihapus"}
 
 @app.get("/get-dialogflow-token", tags=["Chatbot"])
 async def dialogflow_token():
     """
     Endpoint untuk mengambil token Dialogflow yang digunakan untuk autentikasi API.
+    Token di-cache sampai mendekati kedaluwarsa; client cukup meminta lagi setelah `expires_in` detik.
     """
     try:
-        token = get_dialogflow_token()
-        return {"access_token": token}
+        token, expires_in = await get_dialogflow_token()
+        return {"access_token": token, "expires_in": expires_in}
     except Exception as e:
         return {"error": str(e)}
 
+def _email_response(scheduled: dict, message: str, user_data: UserRegistrationRequest) -> dict:
+    response = {
+        "status": "success",
+        "message": message,
+        "user": user_data.model_dump(),
+        "message_id": scheduled["message_id"],
+        "duplicate": scheduled["duplicate"],
+    }
+    if scheduled["message_id"]:
+        response["status_url"] = f"/email-status/{scheduled['message_id']}"
+    return response
+
 @app.post("/email-admin-verification", tags=["Send Email"])
-async def email_admin(user_data: UserRegistrationRequest, background_task: BackgroundTasks):
+async def email_admin(user_data: UserRegistrationRequest, background_task: BackgroundTasks,
+                      idempotency_key: Optional[str] = Header(None)):
     """
     Endpoint untuk mengirim notifikasi ke admin
     """
-    ok = _enqueue_email(
-        background_task,
-        send_email_to_admin,
-        user_data.name, user_data.email, user_data.role
-    )
-    if not ok:
+    scheduled = await schedule_email(background_task, KIND_ADMIN, user_data.model_dump(), idempotency_key)
+    if not scheduled:
         raise HTTPException(status_code=500, detail="Gagal menjadwalkan email ke Admin.")
-    return {
-        "status": "success",
-        "message": "Email notifikasi telah dijadwalkan untuk admin.",
-        "user": user_data.model_dump()
-    }
+    return _email_response(scheduled, "Email notifikasi telah dijadwalkan untuk admin.", user_data)
 
 @app.post("/email-approve-user", tags=["Send Email"])
-async def email_approve_user(user_data: UserRegistrationRequest, background_task: BackgroundTasks):
+async def email_approve_user(user_data: UserRegistrationRequest, background_task: BackgroundTasks,
+                             idempotency_key: Optional[str] = Header(None)):
     """
     Endpoint untuk mengirim notifikasi ke user bahwa akun mereka telah disetujui
     """
-    ok = _enqueue_email(
-        background_task,
-        send_email_approve_to_user,
-        user_data.name, user_data.email, user_data.role
-    )
-    if not ok:
+    scheduled = await schedule_email(background_task, KIND_APPROVE, user_data.model_dump(), idempotency_key)
+    if not scheduled:
         raise HTTPException(status_code=500, detail="Gagal menjadwalkan email Approval.")
-    return {
-        "status": "success",
-        "message": "Email Approval telah dijadwalkan untuk user.",
-        "user": user_data.model_dump()
-    }
+    return _email_response(scheduled, "Email Approval telah dijadwalkan untuk user.", user_data)
 
 @app.post("/email-unapprove-user", tags=["Send Email"])
-async def email_unapprove_user(user_data: UserRegistrationRequest, background_task: BackgroundTasks):
+async def email_unapprove_user(user_data: UserRegistrationRequest, background_task: BackgroundTasks,
+                               idempotency_key: Optional[str] = Header(None)):
     """
     Endpoint untuk mengirim notifikasi ke user bahwa akun mereka belum disetujui
     """
-    ok = _enqueue_email(
-        background_task,
-        send_email_unapprove_to_user,
-        user_data.name, user_data.email, user_data.role
-    )
-    if not ok:
+    scheduled = await schedule_email(background_task, KIND_UNAPPROVE, user_data.model_dump(), idempotency_key)
+    if not scheduled:
         raise HTTPException(status_code=500, detail="Gagal menjadwalkan email Unapproval.")
+    return _email_response(scheduled, "Email Unapproval telah dijadwalkan untuk user.", user_data)
+
+EMAIL_BULK_MAX_USERS = int(getenv("EMAIL_BULK_MAX_USERS", "100"))
+
+async def _send_bulk(kind: str, users: List[UserRegistrationRequest], background_task: BackgroundTasks,
+                     idempotency_key: Optional[str]) -> dict:
+    if not users:
+        raise HTTPException(status_code=422, detail="Daftar user kosong.")
+    if len(users) > EMAIL_BULK_MAX_USERS:
+        raise HTTPException(status_code=413, detail=f"Maksimal {EMAIL_BULK_MAX_USERS} user per request.")
+    user_dicts = [user.model_dump() for user in users]
+    try:
+        # Alamat tidak valid ditolak sebelum ada yang masuk outbox
+        validate_bulk_emails(kind, user_dicts)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    # Satu job outbox untuk seluruh batch (satu sesi SMTP di worker), idempotency key per penerima
+    scheduled = await schedule_bulk_emails(background_task, kind, user_dicts, idempotency_key)
+    if not scheduled:
+        raise HTTPException(status_code=500, detail="Gagal menjadwalkan email massal.")
+    results = []
+    for user, info in zip(user_dicts, scheduled):
+        result = {"email": user["email"], "name": user["name"],
+                  "message_id": info["message_id"], "duplicate": info["duplicate"]}
+        if info["message_id"]:
+            result["status_url"] = f"/email-status/{info['message_id']}"
+        results.append(result)
     return {
         "status": "success",
-        "message": "Email Unapproval telah dijadwalkan untuk user.",
-        "user": user_data.model_dump()
-    }
\ No newline at end of file
+        "queued": sum(1 for info in scheduled if not info["duplicate"]),
+        "duplicates": sum(1 for info in scheduled if info["duplicate"]),
+        "results": results,
+    }
+
+@app.post("/email-approve-users", tags=["Send Email"])
+async def email_approve_users(users: List[UserRegistrationRequest], background_task: BackgroundTasks,
+                              idempotency_key: Optional[str] = Header(None)):
+    """
+    Endpoint untuk menjadwalkan notifikasi persetujuan ke banyak user sekaligus (satu sesi SMTP di worker)
+    """
+    return await _send_bulk(KIND_APPROVE, users, background_task, idempotency_key)
+
+@app.post("/email-unapprove-users", tags=["Send Email"])
+async def email_unapprove_users(users: List[UserRegistrationRequest], background_task: BackgroundTasks,
+                                idempotency_key: Optional[str] = Header(None)):
+    """
+    Endpoint untuk menjadwalkan notifikasi penolakan ke banyak user sekaligus (satu sesi SMTP di worker)
+    """
+    return await _send_bulk(KIND_UNAPPROVE, users, background_task, idempotency_key)
+
+@app.get("/email-status/{message_id}", tags=["Send Email"])
+async def email_status(message_id: str):
+    """
+    Endpoint untuk melihat status email di outbox (queued, sending, retrying, sent, dead).
+    """
+    status = await get_email_status(message_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Email tidak ditemukan.")
+    return status
@@ -1,8 +1,98 @@
 from fastapi import BackgroundTasks
+from os import getenv
+from typing import List, Optional
+import asyncio
+import logging
+from send_email.send_email import send_email_to_admin, send_email_approve_to_user, send_email_unapprove_to_user, send_bulk_emails
+from send_email.outbox import enqueue_email, enqueue_bulk_email, KIND_ADMIN, KIND_APPROVE, KIND_UNAPPROVE
+
+# Jenis email di outbox → fungsi pengirim (dipakai juga oleh email_worker.py)
+EMAIL_SENDERS = {
+    KIND_ADMIN: send_email_to_admin,
+    KIND_APPROVE: send_email_approve_to_user,
+    KIND_UNAPPROVE: send_email_unapprove_to_user,
+}
+
+# Fallback tanpa Redis: percobaan ulang dijadwalkan di event loop, bukan sleep di thread pool
+EMAIL_FALLBACK_RETRIES = int(getenv("EMAIL_FALLBACK_RETRIES", "3"))
+EMAIL_FALLBACK_BACKOFF = float(getenv("EMAIL_FALLBACK_BACKOFF", "2"))
+
+async def _send_in_background(fn, *args):
+    """Setiap percobaan dijalankan di thread; jeda backoff memakai asyncio.sleep."""
+    for attempt in range(1, EMAIL_FALLBACK_RETRIES + 1):
+        try:
+            if await asyncio.to_thread(fn, *args):
+                return
+        except ValueError as e:
+            logging.error(f"❌ Email tidak dikirim: {str(e)}")
+            return
+        except Exception as e:
+            logging.warning(f"⚠️ Gagal kirim email (attempt {attempt}/{EMAIL_FALLBACK_RETRIES}): {str(e)}")
+        if attempt < EMAIL_FALLBACK_RETRIES:
+            await asyncio.sleep(EMAIL_FALLBACK_BACKOFF * attempt)
+    logging.error("❌ Email gagal dikirim setelah retry.")
+
+async def _send_bulk_in_background(kind: str, users: List[dict]):
+    """Seperti _send_in_background, tetapi percobaan ulang hanya untuk penerima yang gagal."""
+    pending = users
+    for attempt in range(1, EMAIL_FALLBACK_RETRIES + 1):
+        try:
+            results = await asyncio.to_thread(send_bulk_emails, kind, pending)
+            pending = [user for user, result in zip(pending, results) if result["status"] == "failed"]
+        except ValueError as e:
+            logging.error(f"❌ Email massal {kind} tidak dikirim: {str(e)}")
+            return
+        except Exception as e:
+            logging.warning(f"⚠️ Gagal kirim email massal {kind} (attempt {attempt}/{EMAIL_FALLBACK_RETRIES}): {str(e)}")
+        if not pending:
+            return
+        if attempt < EMAIL_FALLBACK_RETRIES:
+            await asyncio.sleep(EMAIL_FALLBACK_BACKOFF * attempt)
+    logging.error(f"❌ Email massal {kind}: {len(pending)} penerima gagal setelah retry.")
 
 def _enqueue_email(background_task: BackgroundTasks, fn, *args):
     try:
         background_task.add_task(fn, *args)
         return True
     except Exception as e:
-        return False
\ No newline at end of file
+        return False
+
+async def schedule_email(background_task: BackgroundTasks, kind: str, user_data: dict,
+                         request_id: Optional[str] = None) -> Optional[dict]:
+    """
+    Masukkan email ke outbox durable; jika Redis tidak tersedia, kembali ke BackgroundTasks.
+    Return info penjadwalan, atau None jika email gagal dijadwalkan.
+    """
+    args = {
+        "user_name": user_data["name"],
+        "user_email": user_data["email"],
+        "user_role": user_data["role"],
+    }
+    queued = await enqueue_email(kind, user_data["email"], args, request_id)
+    if queued:
+        message_id, duplicate = queued
+        return {"message_id": message_id, "duplicate": duplicate, "outbox": True}
+
+    if not _enqueue_email(background_task, _send_in_background, EMAIL_SENDERS[kind],
+                          args["user_name"], args["user_email"], args["user_role"]):
+        return None
+    return {"message_id": None, "duplicate": False, "outbox": False}
+
+async def schedule_bulk_emails(background_task: BackgroundTasks, kind: str, users: List[dict],
+                               request_id: Optional[str] = None) -> Optional[List[dict]]:
+    """
+    Masukkan email massal ke outbox sebagai satu job (satu sesi SMTP di worker); jika Redis
+    tidak tersedia, kembali ke BackgroundTasks. Return info penjadwalan per user, atau None.
+    """
+    recipients = [
+        (user["email"], {"user_name": user["name"], "user_email": user["email"], "user_role": user["role"]})
+        for user in users
+    ]
+    queued = await enqueue_bulk_email(kind, recipients, request_id)
+    if queued:
+        return [{"message_id": message_id, "duplicate": duplicate, "outbox": True}
+                for message_id, duplicate in queued]
+
+    if not _enqueue_email(background_task, _send_bulk_in_background, kind, users):
+        return None
+    return [{"message_id": None, "duplicate": False, "outbox": False} for _ in users]
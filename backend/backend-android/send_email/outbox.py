@@ -0,0 +1,209 @@
+"""
+Outbox email berbasis Redis Streams.
+
+Endpoint email tidak lagi mengirim lewat BackgroundTasks (hilang saat worker
+restart), tetapi menulis job ke stream `email:outbox` yang dibaca
+`email_worker.py` lewat consumer group. Job yang gagal tidak di-ACK, diklaim
+ulang setelah idle EMAIL_JOB_CLAIM_IDLE_MS, dan dipindah ke dead-letter
+setelah EMAIL_JOB_MAX_DELIVERIES percobaan.
+
+Setiap job punya idempotency key dari (jenis email, penerima, request id).
+Request id diambil dari header `Idempotency-Key`; tanpa header, setiap
+panggilan mendapat request id baru, jadi email yang sama boleh dikirim lagi
+(mis. approve → unapprove → approve). Key dipetakan ke message id yang
+statusnya bisa dicek di `GET /email-status/{message_id}`.
+
+Email massal masuk sebagai satu job berisi banyak penerima (field `batch`),
+agar worker bisa mengirim semuanya lewat satu sesi SMTP. Setiap penerima tetap
+punya idempotency key dan message id sendiri; saat job dicoba ulang, penerima
+yang statusnya sudah `sent` dilewati.
+"""
+
+from chatbot.services.redis_client import redis_client
+from chatbot.services.stream_worker import StreamQueue
+from os import getenv
+from typing import List, Optional, Tuple
+import hashlib
+import json
+import logging
+import time
+import uuid
+
+OUTBOX_STREAM = getenv("EMAIL_OUTBOX_STREAM", "email:outbox")
+DEAD_LETTER_STREAM = getenv("EMAIL_OUTBOX_DEAD_LETTER_STREAM", "email:outbox:dead")
+CONSUMER_GROUP = getenv("EMAIL_OUTBOX_GROUP", "email-workers")
+STREAM_MAXLEN = int(getenv("EMAIL_OUTBOX_STREAM_MAXLEN", "10000"))
+MAX_DELIVERIES = int(getenv("EMAIL_JOB_MAX_DELIVERIES", "5"))
+CLAIM_IDLE_MS = int(getenv("EMAIL_JOB_CLAIM_IDLE_MS", "60000"))
+IDEMPOTENCY_TTL = int(getenv("EMAIL_IDEMPOTENCY_TTL", "86400"))
+STATUS_TTL = int(getenv("EMAIL_STATUS_TTL", "604800"))
+
+outbox_queue = StreamQueue(OUTBOX_STREAM, CONSUMER_GROUP, DEAD_LETTER_STREAM, maxlen=STREAM_MAXLEN,
+                           max_deliveries=MAX_DELIVERIES, claim_idle_ms=CLAIM_IDLE_MS)
+
+KIND_ADMIN = "admin"
+KIND_APPROVE = "approve"
+KIND_UNAPPROVE = "unapprove"
+
+STATUS_QUEUED = "queued"
+STATUS_SENDING = "sending"
+STATUS_RETRYING = "retrying"
+STATUS_SENT = "sent"
+STATUS_DEAD = "dead"
+
+def idempotency_key(kind: str, recipient: str, request_id: str) -> str:
+    raw = f"{kind}|{recipient.strip().lower()}|{request_id}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _idem_key(key: str) -> str:
+    return f"email:idem:{key}"
+
+def _status_key(message_id: str) -> str:
+    return f"email:msg:{message_id}"
+
+async def enqueue_email(kind: str, recipient: str, args: dict,
+                        request_id: Optional[str] = None) -> Optional[Tuple[str, bool]]:
+    """
+    Masukkan email ke outbox. Return (message_id, duplicate) atau None jika Redis
+    tidak tersedia (pemanggil kembali memakai BackgroundTasks).
+    """
+    if not redis_client:
+        return None
+    # Tanpa Idempotency-Key tidak ada dedup antar request
+    key = idempotency_key(kind, recipient, request_id or uuid.uuid4().hex)
+    message_id = uuid.uuid4().hex
+    ttl = IDEMPOTENCY_TTL
+    try:
+        if not await redis_client.set(_idem_key(key), message_id, nx=True, ex=ttl):
+            existing = await redis_client.get(_idem_key(key))
+            if existing:
+                logging.info(f"🔁 Email {kind} untuk {recipient} sudah ada di outbox ({existing}), tidak dikirim ulang")
+                return existing, True
+            await redis_client.set(_idem_key(key), message_id, ex=ttl)
+
+        now = str(time.time())
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(_status_key(message_id), mapping={
+                "message_id": message_id,
+                "kind": kind,
+                "recipient": recipient,
+                "status": STATUS_QUEUED,
+                "attempts": 0,
+                "created_at": now,
+                "updated_at": now,
+            })
+            pipe.expire(_status_key(message_id), STATUS_TTL)
+            pipe.xadd(
+                OUTBOX_STREAM,
+                {"message_id": message_id, "kind": kind, "args": json.dumps(args), "enqueued_at": now},
+                maxlen=STREAM_MAXLEN,
+                approximate=True,
+            )
+            await pipe.execute()
+        logging.info(f"📨 Email {kind} untuk {recipient} masuk outbox: {message_id}")
+        return message_id, False
+    except Exception as e:
+        logging.error(f"❌ Gagal memasukkan email ke outbox: {str(e)}")
+        try:
+            await redis_client.delete(_idem_key(key))
+        except Exception:
+            pass
+        return None
+
+async def enqueue_bulk_email(kind: str, recipients: List[Tuple[str, dict]],
+                             request_id: Optional[str] = None) -> Optional[List[Tuple[str, bool]]]:
+    """
+    Masukkan email massal ke outbox sebagai satu job. recipients berisi (alamat, args).
+    Return (message_id, duplicate) per penerima sesuai urutan, atau None jika Redis tidak tersedia.
+    """
+    if not redis_client:
+        return None
+    ttl = IDEMPOTENCY_TTL
+    # Tanpa Idempotency-Key: satu request id baru untuk seluruh batch, jadi hanya
+    # alamat yang muncul dua kali di request ini yang dianggap duplikat
+    request_id = request_id or uuid.uuid4().hex
+    keys = [_idem_key(idempotency_key(kind, recipient, request_id)) for recipient, _ in recipients]
+    message_ids = [uuid.uuid4().hex for _ in recipients]
+    claimed = []
+    try:
+        results = []
+        # Penerima diklaim satu per satu: alamat yang muncul dua kali di request ikut terdeteksi duplikat
+        for key, message_id, (recipient, _) in zip(keys, message_ids, recipients):
+            if await redis_client.set(key, message_id, nx=True, ex=ttl):
+                claimed.append(key)
+                results.append((message_id, False))
+                continue
+            existing = await redis_client.get(key)
+            if existing:
+                logging.info(f"🔁 Email {kind} untuk {recipient} sudah ada di outbox ({existing}), tidak dikirim ulang")
+                results.append((existing, True))
+                continue
+            await redis_client.set(key, message_id, ex=ttl)
+            claimed.append(key)
+            results.append((message_id, False))
+
+        batch = [
+            {"message_id": message_id, "recipient": recipient, "args": args}
+            for (message_id, duplicate), (recipient, args) in zip(results, recipients) if not duplicate
+        ]
+        if not batch:
+            return results
+
+        now = str(time.time())
+        async with redis_client.pipeline(transaction=True) as pipe:
+            for item in batch:
+                pipe.hset(_status_key(item["message_id"]), mapping={
+                    "message_id": item["message_id"],
+                    "kind": kind,
+                    "recipient": item["recipient"],
+                    "status": STATUS_QUEUED,
+                    "attempts": 0,
+                    "created_at": now,
+                    "updated_at": now,
+                })
+                pipe.expire(_status_key(item["message_id"]), STATUS_TTL)
+            pipe.xadd(
+                OUTBOX_STREAM,
+                {"kind": kind, "batch": json.dumps(batch), "enqueued_at": now},
+                maxlen=STREAM_MAXLEN,
+                approximate=True,
+            )
+            await pipe.execute()
+        logging.info(f"📨 Email massal {kind} untuk {len(batch)} penerima masuk outbox")
+        return results
+    except Exception as e:
+        logging.error(f"❌ Gagal memasukkan email massal ke outbox: {str(e)}")
+        if claimed:
+            try:
+                await redis_client.delete(*claimed)
+            except Exception:
+                pass
+        return None
+
+async def get_statuses(message_ids: List[str], client=None) -> List[Optional[str]]:
+    client = client or redis_client
+    async with client.pipeline(transaction=False) as pipe:
+        for message_id in message_ids:
+            pipe.hget(_status_key(message_id), "status")
+        return await pipe.execute()
+
+async def update_status(message_id: str, status: str, client=None, **fields):
+    client = client or redis_client
+    try:
+        await client.hset(_status_key(message_id), mapping={
+            "status": status, "updated_at": str(time.time()), **{k: str(v) for k, v in fields.items()},
+        })
+    except Exception as e:
+        logging.error(f"❌ Gagal memperbarui status email {message_id}: {str(e)}")
+
+async def get_email_status(message_id: str) -> Optional[dict]:
+    if not redis_client:
+        return None
+    status = await redis_client.hgetall(_status_key(message_id))
+    if not status:
+        return None
+    status["attempts"] = int(status.get("attempts", 0))
+    for field in ("created_at", "updated_at", "sent_at"):
+        if field in status:
+            status[field] = float(status[field])
+    return status
@@ -1,18 +1,21 @@
 import re
-import time
-import ssl
+import logging
 import smtplib
+from collections import deque
 from pathlib import Path
-from typing import Optional
+from functools import lru_cache
+from os import getenv
+from typing import Callable, Dict, List, Optional
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
 from email.utils import formatdate, make_msgid
 
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template, select_autoescape
 from datetime import datetime
 
 from send_email.config import get_email_config, validate_email_config
+from send_email.smtp_pool import SESSION_OK_ERRORS, get_pool
 
 EMAIL_REGEX = r"^[^@]+@[^@]+\.[^@]+$"
 
@@ -30,11 +33,31 @@ def _load_logo_bytes(path: Path) -> bytes:
     return path.read_bytes()
 
 def _get_jinja_env() -> Environment:
+    # EMAIL_TEMPLATE_CACHE_DIR (optional): bytecode template disimpan agar proses baru tidak compile ulang
+    cache_dir = getenv("EMAIL_TEMPLATE_CACHE_DIR")
     return Environment(
         loader=FileSystemLoader(TEMPLATES_DIR),
         autoescape=select_autoescape(["html", "xml"]),
+        bytecode_cache=FileSystemBytecodeCache(cache_dir) if cache_dir else None,
+        auto_reload=False,
     )
 
+# Environment dan template dibuat sekali saat import, bukan per email
+JINJA_ENV = _get_jinja_env()
+TEMPLATE_NAMES = ("registration_notification.html", "approve_notification.html", "unapprove_notification.html")
+TEMPLATES = {name: JINJA_ENV.get_template(name) for name in TEMPLATE_NAMES}
+
+def _get_template(name: str) -> Template:
+    return TEMPLATES.get(name) or JINJA_ENV.get_template(name)
+
+@lru_cache(maxsize=1)
+def _logo_part() -> MIMEImage:
+    """Part MIME logo (sudah base64) dibuat sekali lalu dipakai bersama; jangan diubah setelah dibuat."""
+    img = MIMEImage(_load_logo_bytes(LOGO_PATH), _subtype="png")
+    img.add_header("Content-ID", "<logo>")
+    img.add_header("Content-Disposition", "inline", filename="logo-learnable.png")
+    return img
+
 def _get_config_or_fail():
     """Ambil config sekali dan validasi minimal."""
     if not validate_email_config():
@@ -58,7 +81,7 @@ def _compose_message_with_logo(
     html_template: str,
     html_ctx: dict,
     plain_fallback: str,
-    logo_bytes: bytes,
+    logo_bytes: Optional[bytes] = None,
 ) -> MIMEMultipart:
     """Buat email multipart/related (HTML + plain) dgn logo inline (CID)."""
     msg_root = MIMEMultipart("related")
@@ -71,18 +94,20 @@ def _compose_message_with_logo(
     alt = MIMEMultipart("alternative")
     alt.attach(MIMEText(plain_fallback, "plain", "utf-8"))
 
-    env = _get_jinja_env()
-    tpl = env.get_template(html_template)
+    tpl = _get_template(html_template)
     html_ctx = {**html_ctx, "logo_cid": "cid:logo"}
     html_body = tpl.render(**html_ctx)
     alt.attach(MIMEText(html_body, "html", "utf-8"))
 
     msg_root.attach(alt)
 
-    img = MIMEImage(logo_bytes, _subtype="png")
-    img.add_header("Content-ID", "<logo>")
-    img.add_header("Content-Disposition", "inline", filename="logo-learnable.png")
-    msg_root.attach(img)
+    if logo_bytes is None:
+        msg_root.attach(_logo_part())
+    else:
+        img = MIMEImage(logo_bytes, _subtype="png")
+        img.add_header("Content-ID", "<logo>")
+        img.add_header("Content-Disposition", "inline", filename="logo-learnable.png")
+        msg_root.attach(img)
 
     return msg_root
 
@@ -97,32 +122,98 @@ def _send_with_retry(
     use_ssl: bool = True,
     starttls_fallback: bool = True,
     max_retries: int = 3,
-    backoff_secs: int = 2,
     timeout: int = 12,
 ) -> bool:
     """
-    Kirim email dengan SSL (port 465) atau STARTTLS (port 587) + retry.
+    Kirim email dengan SSL (port 465) atau STARTTLS (port 587).
+    Koneksi yang sudah login diambil dari pool SMTP dan dipakai ulang. Hanya sesi
+    yang ternyata sudah diputus server yang langsung diganti (maksimal max_retries
+    percobaan); error lain langsung mengembalikan False tanpa sleep, dan pemanggil
+    (outbox atau fallback BackgroundTasks) yang menjadwalkan percobaan berikutnya.
     """
+    pool = get_pool(smtp_host, smtp_port, smtp_user, smtp_pass,
+                    use_ssl=use_ssl, starttls=(not use_ssl and starttls_fallback), timeout=timeout)
+    payload = msg.as_string()
     for attempt in range(1, max_retries + 1):
         try:
-            if use_ssl:
-                server = smtplib.SMTP_SSL(smtp_host, smtp_port, context=ssl.create_default_context(), timeout=timeout)
-            else:
-                server = smtplib.SMTP(smtp_host, smtp_port, timeout=timeout)
-
-            with server:
-                if not use_ssl and starttls_fallback:
-                    server.starttls(context=ssl.create_default_context())
-                server.login(smtp_user, smtp_pass)
-                server.sendmail(msg["From"], to_addrs, msg.as_string())
+            with pool.connection() as server:
+                server.sendmail(msg["From"], to_addrs, payload)
             return True
+        except smtplib.SMTPServerDisconnected as e:
+            logging.warning(f"⚠️ Sesi SMTP terputus (attempt {attempt}/{max_retries}): {e}")
         except Exception as e:
-            print(f"⚠️ Gagal kirim (attempt {attempt}/{max_retries}): {e}")
-            if attempt < max_retries:
-                time.sleep(backoff_secs * attempt)
-            else:
-                print("❌ Email gagal dikirim setelah retry.")
-                return False
+            logging.warning(f"⚠️ Gagal kirim email ke {', '.join(to_addrs)}: {e}")
+            return False
+    logging.error("❌ Email gagal dikirim, sesi SMTP terus terputus.")
+    return False
+
+def _build_approve_message(
+    *,
+    from_name: str,
+    from_email: str,
+    user_name: str,
+    user_email: str,
+    user_role: str,
+    template_name: str = "approve_notification.html",
+    subject_prefix: str = "Selamat Datang di LearnAble",
+) -> MIMEMultipart:
+    plain = (
+        f"Halo {user_name}!\n\n"
+        "Terima kasih telah bergabung dengan LearnAble! Akun kamu sudah aktif.\n\n"
+        f"Nama Pendaftar: {user_name}\n"
+        f"Email Pendaftar: {user_email}\n"
+        f"Role Pendaftar: {user_role.title()}\n"
+        "Yuk mulai eksplorasi fitur-fitur kami!\n\n"
+        "Salam,\nSistem LearnAble\n"
+    )
+    return _compose_message_with_logo(
+        from_name=from_name,
+        from_email=from_email,
+        to_email=user_email,
+        subject=subject_prefix,
+        html_template=template_name,
+        html_ctx={
+            "user_name": user_name,
+            "user_email": user_email,
+            "user_role": user_role.title(),
+        },
+        plain_fallback=plain,
+    )
+
+def _build_unapprove_message(
+    *,
+    from_name: str,
+    from_email: str,
+    user_name: str,
+    user_email: str,
+    user_role: str,
+    template_name: str = "unapprove_notification.html",
+    subject_prefix: str = "Pendaftaran",
+) -> MIMEMultipart:
+    subject = f"{subject_prefix} sebagai {user_role.title()} tidak disetujui - LearnAble"  # <= typo diperbaiki
+    plain = (
+        f"Halo {user_name}!\n\n"
+        "Terima kasih telah mendaftar di LearnAble.\n"
+        "Sayangnya, pendaftaran kamu belum disetujui oleh admin.\n\n"
+        f"Nama Pendaftar: {user_name}\n"
+        f"Email Pendaftar: {user_email}\n"
+        f"Role Pendaftar: {user_role.title()}\n\n"
+        "Jika ada pertanyaan, silakan balas email ini.\n\n"
+        "Salam,\nSistem LearnAble\n"
+    )
+    return _compose_message_with_logo(
+        from_name=from_name,
+        from_email=from_email,
+        to_email=user_email,
+        subject=subject,
+        html_template=template_name,
+        html_ctx={
+            "user_name": user_name,
+            "user_email": user_email,
+            "user_role": user_role.title(),
+        },
+        plain_fallback=plain,
+    )
 
 def send_email_to_admin(
     user_name: str,
@@ -133,6 +224,7 @@ def send_email_to_admin(
     smtp_pass: Optional[str] = None,
     template_name: str = "registration_notification.html",
     subject_prefix: str = "Pendaftaran Baru",
+    max_retries: int = 3,
 ) -> bool:
     cfg = _get_config_or_fail()
     admin_email = admin_email or cfg["admin_email"]
@@ -167,7 +259,6 @@ def send_email_to_admin(
             "registration_time": datetime.now().strftime("%d %B %Y %H:%M:%S"),
         },
         plain_fallback=plain,
-        logo_bytes=_load_logo_bytes(LOGO_PATH),
     )
     return _send_with_retry(
         smtp_host=smtp_host,
@@ -178,6 +269,7 @@ def send_email_to_admin(
         to_addrs=[admin_email],
         use_ssl=(smtp_port == 465),
         starttls_fallback=(smtp_port == 587),
+        max_retries=max_retries,
     )
 
 def send_email_approve_to_user(
@@ -189,6 +281,7 @@ def send_email_approve_to_user(
     smtp_pass: Optional[str] = None,
     template_name: str = "approve_notification.html",
     subject_prefix: str = "Selamat Datang di LearnAble",
+    max_retries: int = 3,
 ) -> bool:
     cfg = _get_config_or_fail()
     smtp_user = smtp_user or cfg["smtp_user"]
@@ -198,29 +291,14 @@ def send_email_approve_to_user(
     from_name = cfg.get("from_name", "LearnAble")
 
     _validate_email(user_email, "Email pendaftar")
-
-    plain = (
-        f"Halo {user_name}!\n\n"
-        "Terima kasih telah bergabung dengan LearnAble! Akun kamu sudah aktif.\n\n"
-        f"Nama Pendaftar: {user_name}\n"
-        f"Email Pendaftar: {user_email}\n"
-        f"Role Pendaftar: {user_role.title()}\n"
-        "Yuk mulai eksplorasi fitur-fitur kami!\n\n"
-        "Salam,\nSistem LearnAble\n"
-    )
-    msg = _compose_message_with_logo(
+    msg = _build_approve_message(
         from_name=from_name,
         from_email=smtp_user,
-        to_email=user_email,
-        subject=subject_prefix,
-        html_template=template_name,
-        html_ctx={
-            "user_name": user_name,
-            "user_email": user_email,
-            "user_role": user_role.title(),
-        },
-        plain_fallback=plain,
-        logo_bytes=_load_logo_bytes(LOGO_PATH),
+        user_name=user_name,
+        user_email=user_email,
+        user_role=user_role,
+        template_name=template_name,
+        subject_prefix=subject_prefix,
     )
     if admin_email:
         _validate_email(admin_email, "Email admin")
@@ -235,6 +313,7 @@ def send_email_approve_to_user(
         to_addrs=[user_email], 
         use_ssl=(smtp_port == 465),
         starttls_fallback=(smtp_port == 587),
+        max_retries=max_retries,
     )
 
 def send_email_unapprove_to_user(
@@ -246,6 +325,7 @@ def send_email_unapprove_to_user(
     smtp_pass: Optional[str] = None,
     template_name: str = "unapprove_notification.html",
     subject_prefix: str = "Pendaftaran",
+    max_retries: int = 3,
 ) -> bool:
     cfg = _get_config_or_fail()
     smtp_user = smtp_user or cfg["smtp_user"]
@@ -255,31 +335,14 @@ def send_email_unapprove_to_user(
     from_name = cfg.get("from_name", "LearnAble")
 
     _validate_email(user_email, "Email pendaftar")
-
-    subject = f"{subject_prefix} sebagai {user_role.title()} tidak disetujui - LearnAble"  # <= typo diperbaiki
-    plain = (
-        f"Halo {user_name}!\n\n"
-        "Terima kasih telah mendaftar di LearnAble.\n"
-        "Sayangnya, pendaftaran kamu belum disetujui oleh admin.\n\n"
-        f"Nama Pendaftar: {user_name}\n"
-        f"Email Pendaftar: {user_email}\n"
-        f"Role Pendaftar: {user_role.title()}\n\n"
-        "Jika ada pertanyaan, silakan balas email ini.\n\n"
-        "Salam,\nSistem LearnAble\n"
-    )
-    msg = _compose_message_with_logo(
+    msg = _build_unapprove_message(
         from_name=from_name,
         from_email=smtp_user,
-        to_email=user_email,
-        subject=subject,
-        html_template=template_name,
-        html_ctx={
-            "user_name": user_name,
-            "user_email": user_email,
-            "user_role": user_role.title(),
-        },
-        plain_fallback=plain,
-        logo_bytes=_load_logo_bytes(LOGO_PATH),
+        user_name=user_name,
+        user_email=user_email,
+        user_role=user_role,
+        template_name=template_name,
+        subject_prefix=subject_prefix,
     )
     if admin_email:
         _validate_email(admin_email, "Email admin")
@@ -294,4 +357,98 @@ def send_email_unapprove_to_user(
         to_addrs=[user_email], 
         use_ssl=(smtp_port == 465),
         starttls_fallback=(smtp_port == 587),
-    )
\ No newline at end of file
+        max_retries=max_retries,
+    )
+
+# Jenis email massal → pembuat pesan per penerima
+BULK_MESSAGE_BUILDERS: Dict[str, Callable[..., MIMEMultipart]] = {
+    "approve": _build_approve_message,
+    "unapprove": _build_unapprove_message,
+}
+
+def validate_bulk_emails(kind: str, users: List[dict], admin_email: Optional[str] = None) -> None:
+    """ValueError jika jenis email atau salah satu alamat tidak valid."""
+    if kind not in BULK_MESSAGE_BUILDERS:
+        raise ValueError(f"Jenis email massal tidak dikenal: {kind}")
+    for user in users:
+        _validate_email(user.get("email"), "Email pendaftar")
+    if admin_email:
+        _validate_email(admin_email, "Email admin")
+
+def send_bulk_emails(
+    kind: str,
+    users: List[dict],
+    admin_email: Optional[str] = None,
+    max_retries: int = 3,
+    timeout: int = 12,
+) -> List[dict]:
+    """
+    Kirim email approve/unapprove ke banyak user lewat satu sesi SMTP.
+
+    Semua alamat divalidasi dulu (ValueError sebelum ada email terkirim), semua pesan
+    dirender dengan template bersama, lalu `sendmail` dipanggil berurutan pada satu
+    koneksi dari pool. Penerima yang ditolak server tidak memutus sesi; jika sesi
+    terputus, sisa pesan dilanjutkan di koneksi baru; error sesi lain menandai sisa pesan
+    `failed` tanpa sleep agar pemanggil yang menjadwalkan ulang. Return hasil per penerima
+    sesuai urutan input: status `sent`, `failed`, atau `duplicate`.
+    """
+    validate_bulk_emails(kind, users, admin_email)
+    build = BULK_MESSAGE_BUILDERS[kind]
+
+    cfg = _get_config_or_fail()
+    smtp_user = cfg["smtp_user"]
+    smtp_port = int(cfg["smtp_port"])
+    from_name = cfg.get("from_name", "LearnAble")
+    pool = get_pool(cfg["smtp_server"], smtp_port, smtp_user, cfg["smtp_pass"],
+                    use_ssl=(smtp_port == 465), starttls=(smtp_port == 587), timeout=timeout)
+
+    results: List[dict] = []
+    pending = deque()
+    seen = set()
+    for user in users:
+        result = {"email": user["email"], "name": user["name"]}
+        results.append(result)
+        address = user["email"].strip().lower()
+        if address in seen:
+            result["status"] = "duplicate"
+            continue
+        seen.add(address)
+        msg = build(
+            from_name=from_name,
+            from_email=smtp_user,
+            user_name=user["name"],
+            user_email=user["email"],
+            user_role=user["role"],
+        )
+        if admin_email:
+            msg["Reply-To"] = admin_email
+        pending.append((result, msg["From"], msg.as_string()))
+
+    attempt = 0
+    while pending:
+        try:
+            with pool.connection() as server:
+                while pending:
+                    result, from_addr, payload = pending[0]
+                    try:
+                        server.sendmail(from_addr, [result["email"]], payload)
+                        result["status"] = "sent"
+                    except SESSION_OK_ERRORS as e:
+                        # Ditolak server untuk penerima ini; sesi sudah di-RSET dan tetap dipakai
+                        result["status"] = "failed"
+                        result["error"] = str(e)
+                    pending.popleft()
+                    attempt = 0
+        except Exception as e:
+            attempt += 1
+            logging.warning(f"⚠️ Sesi SMTP email massal gagal (attempt {attempt}/{max_retries}): {e}")
+            # Hanya sesi terputus yang langsung diganti; sisanya dicoba ulang oleh pemanggil
+            if attempt >= max_retries or not isinstance(e, smtplib.SMTPServerDisconnected):
+                for result, _, _ in pending:
+                    result["status"] = "failed"
+                    result["error"] = str(e)
+                break
+
+    sent = sum(1 for r in results if r["status"] == "sent")
+    logging.info(f"📬 Email massal {kind}: {sent}/{len(results)} terkirim")
+    return results
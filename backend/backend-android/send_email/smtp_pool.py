@@ -0,0 +1,166 @@
+"""
+Pool koneksi SMTP yang sudah login, dipakai ulang antar email.
+
+Membuka SMTP_SSL baru per email berarti TCP + TLS + AUTH ke Gmail setiap kali.
+Pool ini menyimpan koneksi yang sudah login per (host, port, user):
+- koneksi idle lebih lama dari SMTP_POOL_IDLE_TIMEOUT detik ditutup (Gmail
+  memutus sesi idle sendiri)
+- koneksi yang idle lebih dari SMTP_POOL_NOOP_AFTER detik dicek dengan NOOP
+  sebelum dipakai; jika gagal, diganti koneksi baru secara transparan
+- maksimal SMTP_POOL_SIZE koneksi aktif per pool; pemanggil lain menunggu
+
+Fungsi pengirim berjalan di thread pool (BackgroundTasks), jadi pool ini
+thread-safe dan synchronous.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from os import getenv
+from typing import Deque, Dict, Tuple
+import logging
+import smtplib
+import ssl
+import threading
+import time
+
+SMTP_POOL_SIZE = int(getenv("SMTP_POOL_SIZE", "3"))
+SMTP_POOL_IDLE_TIMEOUT = float(getenv("SMTP_POOL_IDLE_TIMEOUT", "60"))
+SMTP_POOL_NOOP_AFTER = float(getenv("SMTP_POOL_NOOP_AFTER", "5"))
+SMTP_POOL_WAIT_TIMEOUT = float(getenv("SMTP_POOL_WAIT_TIMEOUT", "30"))
+
+# Error yang dilempar sendmail setelah RSET; sesi SMTP-nya masih sehat.
+# Publik agar pengirim bisa membedakan penerima yang ditolak dari sesi yang rusak.
+SESSION_OK_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+class SMTPPool:
+    def __init__(self, host: str, port: int, user: str, password: str,
+                 use_ssl: bool = True, starttls: bool = False, timeout: int = 12,
+                 max_size: int = SMTP_POOL_SIZE):
+        self.host, self.port = host, port
+        self.user, self.password = user, password
+        self.use_ssl, self.starttls = use_ssl, starttls
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle: Deque[Tuple[smtplib.SMTP, float]] = deque()
+        self._stats = {"connects": 0, "reuses": 0, "noop_failures": 0, "expired": 0, "discarded": 0}
+
+    def _connect(self) -> smtplib.SMTP:
+        context = ssl.create_default_context()
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(self.host, self.port, context=context, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if not self.use_ssl and self.starttls:
+                server.starttls(context=context)
+            server.login(self.user, self.password)
+        except Exception:
+            _close_quietly(server)
+            raise
+        with self._lock:
+            self._stats["connects"] += 1
+        return server
+
+    def _checkout(self) -> smtplib.SMTP:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                server, last_used = self._idle.pop()
+            idle_for = time.monotonic() - last_used
+            if idle_for > SMTP_POOL_IDLE_TIMEOUT:
+                self._count("expired")
+                _close_quietly(server)
+                continue
+            if idle_for > SMTP_POOL_NOOP_AFTER:
+                try:
+                    code, _ = server.noop()
+                except Exception:
+                    code = None
+                if code != 250:
+                    self._count("noop_failures")
+                    _close_quietly(server)
+                    continue
+            self._count("reuses")
+            return server
+        return self._connect()
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    @contextmanager
+    def connection(self):
+        """Pinjam koneksi yang sudah login; koneksi yang error tidak dikembalikan ke pool."""
+        if not self._slots.acquire(timeout=SMTP_POOL_WAIT_TIMEOUT):
+            raise TimeoutError("Pool SMTP penuh, tidak ada koneksi yang tersedia")
+        server = None
+        try:
+            server = self._checkout()
+            yield server
+        except SESSION_OK_ERRORS:
+            self._release(server)
+            server = None
+            raise
+        except Exception:
+            if server is not None:
+                self._count("discarded")
+                _close_quietly(server)
+                server = None
+            raise
+        finally:
+            if server is not None:
+                self._release(server)
+            self._slots.release()
+
+    def _release(self, server: smtplib.SMTP):
+        with self._lock:
+            self._idle.append((server, time.monotonic()))
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for server, _ in idle:
+            _close_quietly(server, quit=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "idle": len(self._idle)}
+
+def _close_quietly(server: smtplib.SMTP, quit: bool = False):
+    try:
+        if quit:
+            server.quit()
+        else:
+            server.close()
+    except Exception:
+        pass
+
+_pools: Dict[Tuple[str, int, str], SMTPPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(host: str, port: int, user: str, password: str,
+             use_ssl: bool = True, starttls: bool = False, timeout: int = 12) -> SMTPPool:
+    key = (host, port, user)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.password != password:
+            if pool is not None:
+                pool.close()
+            pool = SMTPPool(host, port, user, password, use_ssl=use_ssl,
+                            starttls=starttls, timeout=timeout)
+            _pools[key] = pool
+        return pool
+
+def close_all_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+    logging.info("📪 Semua koneksi SMTP di pool ditutup")
+
+def pool_stats() -> dict:
+    with _pools_lock:
+        return {f"{user}@{host}:{port}": pool.stats() for (host, port, user), pool in _pools.items()}
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Modul aplikasi diimpor dari folder backend-android, sama seperti saat server dijalankan
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
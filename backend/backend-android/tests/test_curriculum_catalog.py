@@ -0,0 +1,76 @@
+import types
+
+import pytest
+
+from chatbot.services import curriculum_catalog as catalog
+
+
+class FakeWatch:
+    def __init__(self, callback):
+        self.callback = callback
+        self.is_active = True
+
+    def unsubscribe(self):
+        self.is_active = False
+
+
+class FakeDb:
+    def __init__(self):
+        self.watches = {}
+
+    def collection(self, name):
+        def on_snapshot(callback):
+            self.watches[name] = FakeWatch(callback)
+            return self.watches[name]
+        return types.SimpleNamespace(on_snapshot=on_snapshot)
+
+
+def doc(doc_id, **data):
+    return types.SimpleNamespace(id=doc_id, to_dict=lambda: data)
+
+
+def deliver(fake_db, collection, docs):
+    changes = [types.SimpleNamespace(type=types.SimpleNamespace(name="ADDED"), document=d) for d in docs]
+    fake_db.watches[collection].callback(docs, changes, None)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeDb()
+    monkeypatch.setattr(catalog, "db", fake)
+    monkeypatch.setattr(catalog, "CATALOG_WATCH_CHECK_INTERVAL", 3600)
+    assert catalog.start_catalog()
+    deliver(fake, "subjects", [doc("s1", name="Matematika", schoolLevel="sd", idSubject="m")])
+    deliver(fake, "lessons", [doc("l1", title="Pecahan", idSubject="m")])
+    deliver(fake, "sub_bab", [doc("b1", title="Pecahan Biasa", lessonId="l1")])
+    yield fake
+    catalog.stop_catalog()
+
+
+def test_closed_watch_falls_back_until_resubscribed(fake_db):
+    assert catalog.is_ready()
+    old = fake_db.watches["sub_bab"]
+    old.is_active = False
+
+    catalog.check_watches()
+    assert not catalog.is_ready()
+    assert fake_db.watches["sub_bab"] is not old
+
+    # Snapshot pertama listener baru menggantikan isi lama seluruhnya
+    deliver(fake_db, "sub_bab", [doc("b2", title="Pecahan Campuran", lessonId="l1")])
+    assert catalog.is_ready()
+    assert catalog.find_subbab("Pecahan Biasa") is None
+    assert catalog.find_subbab("Pecahan Campuran").id == "b2"
+
+
+def test_failed_callback_marks_collection_stale(fake_db):
+    broken = types.SimpleNamespace(id="x", to_dict=lambda: 1 / 0)
+    change = types.SimpleNamespace(type=types.SimpleNamespace(name="MODIFIED"), document=broken)
+    fake_db.watches["lessons"].callback([broken], [change], None)
+    assert not catalog.is_ready()
+    assert catalog.status()["reconnecting"] == ["lessons"]
+
+    catalog.check_watches()
+    deliver(fake_db, "lessons", [doc("l1", title="Pecahan", idSubject="m")])
+    assert catalog.is_ready()
+    assert catalog.status()["reconnecting"] == []
@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("google.oauth2")
+
+from chatbot.utils.dialogflow_token import DialogflowTokenCache
+
+
+def cache_with_expiry(expiry):
+    cache = DialogflowTokenCache("unused.json")
+    cache._token, cache._expiry = "token", expiry
+    return cache
+
+
+def test_remaining_accepts_naive_utc_expiry_from_google_auth():
+    expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=600)
+    assert 595 < cache_with_expiry(expiry)._remaining() <= 600
+
+
+def test_remaining_accepts_aware_expiry():
+    expiry = datetime.now(timezone.utc) + timedelta(seconds=600)
+    assert 595 < cache_with_expiry(expiry)._remaining() <= 600
+
+
+def test_remaining_is_zero_without_token():
+    assert DialogflowTokenCache("unused.json")._remaining() == 0.0
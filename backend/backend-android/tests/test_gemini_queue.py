@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from chatbot.services import gemini_queue
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis.aioredis")
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(gemini_queue, "redis_client", client)
+    monkeypatch.setattr(gemini_queue, "_worker_check", {"alive": False, "checked_at": float("-inf")})
+    return client
+
+
+def test_no_consumer_group_means_no_live_worker(fake_redis):
+    assert asyncio.run(gemini_queue.job_queue.live_consumers(30000, client=fake_redis)) == 0
+
+
+def test_live_consumers_counts_only_recently_seen_workers(fake_redis):
+    async def scenario():
+        await gemini_queue.job_queue.ensure_group(fake_redis)
+        await fake_redis.xreadgroup(gemini_queue.CONSUMER_GROUP, "worker-1",
+                                    {gemini_queue.JOB_STREAM: ">"}, count=1)
+        return (await gemini_queue.job_queue.live_consumers(30000, client=fake_redis),
+                await gemini_queue.job_queue.live_consumers(0, client=fake_redis))
+
+    assert asyncio.run(scenario()) == (1, 0)
+
+
+def test_enqueue_without_live_worker_falls_back(fake_redis):
+    async def scenario():
+        await gemini_queue.job_queue.ensure_group(fake_redis)
+        ok = await gemini_queue.enqueue_generation(gemini_queue.JOB_THEORY, "prompt", "theory:key")
+        return ok, await fake_redis.xlen(gemini_queue.JOB_STREAM)
+
+    assert asyncio.run(scenario()) == (False, 0)
+
+
+def test_enqueue_with_live_worker_adds_job(fake_redis):
+    async def scenario():
+        await gemini_queue.job_queue.ensure_group(fake_redis)
+        await fake_redis.xreadgroup(gemini_queue.CONSUMER_GROUP, "worker-1",
+                                    {gemini_queue.JOB_STREAM: ">"}, count=1)
+        ok = await gemini_queue.enqueue_generation(gemini_queue.JOB_THEORY, "prompt", "theory:key")
+        return ok, await fake_redis.xlen(gemini_queue.JOB_STREAM)
+
+    assert asyncio.run(scenario()) == (True, 1)
+
+
+def test_worker_check_is_cached(monkeypatch):
+    calls = []
+
+    async def live_consumers(max_idle_ms, client=None):
+        calls.append(max_idle_ms)
+        return 1
+
+    monkeypatch.setattr(gemini_queue.job_queue, "live_consumers", live_consumers)
+    monkeypatch.setattr(gemini_queue, "_worker_check", {"alive": False, "checked_at": float("-inf")})
+
+    async def scenario():
+        return [await gemini_queue.has_live_worker() for _ in range(3)]
+
+    assert asyncio.run(scenario()) == [True, True, True]
+    assert calls == [gemini_queue.WORKER_MAX_IDLE_MS]
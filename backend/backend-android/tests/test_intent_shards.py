@@ -0,0 +1,56 @@
+import pytest
+
+from chatbot.utils.intent_shards import (
+    assign_shards, bucket_shard, phrase_bucket, shard_intent_name, shard_index, base_intent_name,
+)
+
+PHRASES = [f"Sub-bab {i}: Operasi Hitung Pecahan" for i in range(9000)]
+
+
+def placement(shards):
+    return {phrase: index for index, shard in enumerate(shards) for phrase in shard}
+
+
+def test_shard_names_round_trip():
+    assert shard_intent_name("Pilih Subbab", 0) == "Pilih Subbab"
+    assert shard_intent_name("Pilih Subbab", 2) == "Pilih Subbab #3"
+    assert shard_index("Pilih Subbab #3", "Pilih Subbab") == 2
+    assert shard_index("Pilih Topik #2", "Pilih Subbab") == -1
+    assert base_intent_name("Pilih Subbab #3") == "Pilih Subbab"
+
+
+def test_every_phrase_assigned_once_within_limit():
+    shards = assign_shards(iter(PHRASES), 2000, 0.8)
+    assert sorted(p for shard in shards for p in shard) == sorted(PHRASES)
+    assert all(len(shard) <= 2000 for shard in shards)
+
+
+def test_empty_input_gives_one_empty_shard():
+    assert assign_shards(iter([]), 2000, 0.8) == [[]]
+
+
+def test_placement_does_not_depend_on_order():
+    forward = placement(assign_shards(PHRASES, 2000, 0.8))
+    backward = placement(assign_shards(reversed(PHRASES), 2000, 0.8))
+    assert forward == backward
+
+
+def test_adding_a_phrase_changes_only_its_shard():
+    before = placement(assign_shards(PHRASES, 2000, 0.8))
+    after = placement(assign_shards(["Sub-bab baru: Bilangan Bulat"] + PHRASES, 2000, 0.8))
+    assert {p: s for p, s in after.items() if p in before} == before
+
+
+def test_growing_shard_count_moves_few_buckets():
+    moved = sum(1 for b in range(4096) if bucket_shard(b, 5) != bucket_shard(b, 6))
+    # Jump consistent hash: sekitar 1/6 bucket pindah, bukan hampir semuanya
+    assert moved < 4096 * 0.25
+
+
+@pytest.mark.parametrize("count", [1, 2, 7, 30])
+def test_bucket_shard_in_range(count):
+    assert all(0 <= bucket_shard(b, count) < count for b in range(4096))
+
+
+def test_phrase_bucket_is_stable():
+    assert phrase_bucket("Pecahan Biasa") == phrase_bucket("Pecahan Biasa")
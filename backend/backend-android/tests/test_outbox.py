@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from send_email import outbox
+from send_email.outbox import idempotency_key, KIND_APPROVE, KIND_UNAPPROVE
+
+
+def test_idempotency_key_ignores_case_and_whitespace_of_recipient():
+    assert idempotency_key(KIND_APPROVE, " Guru@Example.com ", "req-1") == \
+        idempotency_key(KIND_APPROVE, "guru@example.com", "req-1")
+
+
+@pytest.mark.parametrize("other", [
+    (KIND_UNAPPROVE, "guru@example.com", "req-1"),
+    (KIND_APPROVE, "ortu@example.com", "req-1"),
+    (KIND_APPROVE, "guru@example.com", "req-2"),
+])
+def test_idempotency_key_depends_on_kind_recipient_and_request(other):
+    assert idempotency_key(KIND_APPROVE, "guru@example.com", "req-1") != idempotency_key(*other)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis.aioredis")
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(outbox, "redis_client", client)
+    return client
+
+
+def test_enqueue_without_request_id_never_dedupes(fake_redis):
+    async def scenario():
+        args = {"user_name": "Guru", "user_email": "guru@example.com", "user_role": "guru"}
+        first = await outbox.enqueue_email(KIND_APPROVE, "guru@example.com", args)
+        await outbox.enqueue_email(KIND_UNAPPROVE, "guru@example.com", args)
+        again = await outbox.enqueue_email(KIND_APPROVE, "guru@example.com", args)
+        return first, again, await fake_redis.xlen(outbox.OUTBOX_STREAM)
+
+    first, again, queued = asyncio.run(scenario())
+    assert first[1] is False and again[1] is False
+    assert first[0] != again[0]
+    assert queued == 3
+
+
+def test_enqueue_with_request_id_returns_existing_message(fake_redis):
+    async def scenario():
+        args = {"user_name": "Guru", "user_email": "guru@example.com", "user_role": "guru"}
+        first = await outbox.enqueue_email(KIND_APPROVE, "guru@example.com", args, "req-1")
+        retry = await outbox.enqueue_email(KIND_APPROVE, "guru@example.com", args, "req-1")
+        return first, retry, await fake_redis.xlen(outbox.OUTBOX_STREAM)
+
+    first, retry, queued = asyncio.run(scenario())
+    assert retry == (first[0], True)
+    assert queued == 1
+
+
+def test_bulk_without_request_id_dedupes_only_within_the_request(fake_redis):
+    async def scenario():
+        args = {"user_name": "Guru", "user_email": "guru@example.com", "user_role": "guru"}
+        recipients = [("guru@example.com", args), ("GURU@example.com", args)]
+        first = await outbox.enqueue_bulk_email(KIND_APPROVE, recipients)
+        second = await outbox.enqueue_bulk_email(KIND_APPROVE, recipients)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert [duplicate for _, duplicate in first] == [False, True]
+    assert first[1][0] == first[0][0]
+    assert [duplicate for _, duplicate in second] == [False, True]
+    assert second[0][0] != first[0][0]
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from chatbot.utils import pregenerate_theory as pg
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    state = {"answers": set(), "manifest": {}, "running": 0, "max_running": 0, "tasks": 0}
+
+    async def iter_subbabs():
+        for i in range(200):
+            state["tasks"] = max(state["tasks"], len(asyncio.all_tasks()))
+            yield f"b{i}", f"Sub-bab {i}"
+
+    async def has_answer(key):
+        return key in state["answers"]
+
+    async def save_answer(key, answer, source=None):
+        state["answers"].add(key)
+
+    async def get_manifest_key(subbab_id, level):
+        return state["manifest"].get((subbab_id, level))
+
+    async def set_manifest_key(subbab_id, level, key):
+        state["manifest"][(subbab_id, level)] = key
+
+    async def chat(prompt, priority=None):
+        state["running"] += 1
+        state["max_running"] = max(state["max_running"], state["running"])
+        await asyncio.sleep(0)
+        state["running"] -= 1
+        if "Sub-bab 13'" in prompt:
+            raise RuntimeError("redis putus")
+        return "jawaban"
+
+    async def claim(key):
+        return True
+
+    async def release(key):
+        pass
+
+    monkeypatch.setattr(pg, "iter_subbabs", iter_subbabs)
+    monkeypatch.setattr(pg.theory_store, "has_answer", has_answer)
+    monkeypatch.setattr(pg.theory_store, "save_answer", save_answer)
+    monkeypatch.setattr(pg.theory_store, "get_manifest_key", get_manifest_key)
+    monkeypatch.setattr(pg.theory_store, "set_manifest_key", set_manifest_key)
+    monkeypatch.setattr(pg, "chat_with_gemini_api", chat)
+    monkeypatch.setattr(pg, "claim_generation", claim)
+    monkeypatch.setattr(pg, "release_generation", release)
+    return state
+
+
+def test_pregenerate_uses_bounded_worker_pool(catalog):
+    stats = asyncio.run(pg.pregenerate(concurrency=3, rps=0))
+    assert stats["total"] == stats["pending"] == 600
+    # Sub-bab 13 gagal di ketiga jenjang, sisanya tetap diproses
+    assert stats["failed"] == 3
+    assert stats["generated"] == 597
+    assert catalog["max_running"] <= 3
+    # Main task + 3 worker, tidak satu task per pasangan
+    assert catalog["tasks"] <= 4
+
+
+def test_pregenerate_respects_limit_and_skips_existing(catalog):
+    stats = asyncio.run(pg.pregenerate(levels=["sd"], concurrency=2, rps=0, limit=5))
+    assert stats["generated"] == 5
+    stats = asyncio.run(pg.pregenerate(levels=["sd"], concurrency=2, rps=0))
+    assert stats["skipped"] == 5 and stats["generated"] == 194 and stats["failed"] == 1
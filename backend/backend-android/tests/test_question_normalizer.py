@@ -0,0 +1,42 @@
+import pytest
+
+from chatbot.handlers.custom_question import generate_cache_key
+from chatbot.utils.question_normalizer import normalize_question, exact_tokens
+
+
+def key(question):
+    return generate_cache_key(normalize_question(question))
+
+
+@pytest.mark.parametrize("first, second", [
+    ("apa itu ai?", "apa itu guru?"),
+    ("apa itu ai?", "apa itu tahu"),
+    ("apa itu guru?", "apa itu tahu"),
+    ("kamu siapa", "siapa aku"),
+    ("apa arti pecahan", "apa definisi pecahan"),
+    ("contoh soal pecahan", "contoh pecahan"),
+    ("berapa 2 + 3", "berapa 2 - 3"),
+    ("berapa 2 + 3", "berapa 2 / 3"),
+    ("1,5 dikali 2", "1 5 dikali 2"),
+    ("4 dibagi 2", "2 dibagi 4"),
+    ("pindah dari a ke b", "pindah ke a dari b"),
+])
+def test_different_questions_get_different_keys(first, second):
+    assert key(first) != key(second)
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Apa itu pecahan?", "tolong, apa itu pecahan dong?"),
+    ("gmn cara menghitung luas", "bagaimana cara menghitung luas sih"),
+    ("APA ITU PECAHAN", "apa itu pecahan"),
+])
+def test_same_question_shares_key(first, second):
+    assert key(first) == key(second)
+
+
+def test_only_fillers_is_not_empty():
+    assert normalize_question("tolong dong") == "tolong dong"
+
+
+def test_exact_tokens_keep_numbers_operators_and_connectives():
+    assert exact_tokens(normalize_question("pindah dari 2 ke 3 + 1")) == ("dari", "2", "ke", "3", "+", "1")
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+pytest.importorskip("orjson")
+
+from chatbot.utils.response_cache import SESSION_PLACEHOLDER, dump_cacheable, render_cached, strip_session
+
+SESSION = "projects/learnable/agent/sessions/abc-123"
+OTHER_SESSION = "projects/learnable/agent/sessions/xyz-789"
+
+
+def chip_response(session):
+    return {
+        "fulfillmentMessages": [{"payload": {"richContent": [[{"type": "chips", "options": [{"text": "SD"}]}]]}}],
+        "outputContexts": [{"name": f"{session}/contexts/pilihjenjang-followup", "lifespanCount": 2}],
+    }
+
+
+def test_dump_cacheable_is_session_free():
+    cached = dump_cacheable(chip_response(SESSION))
+    assert SESSION.encode() not in cached
+    assert SESSION_PLACEHOLDER.encode() in cached
+
+
+def test_render_cached_attaches_requesting_session():
+    cached = dump_cacheable(chip_response(SESSION))
+    body = json.loads(render_cached(cached, OTHER_SESSION).body)
+    assert body == chip_response(OTHER_SESSION)
+
+
+def test_render_cached_escapes_session_for_json():
+    cached = dump_cacheable(chip_response(SESSION))
+    session = 'projects/p/agent/sessions/"quoted"'
+    body = json.loads(render_cached(cached, session).body)
+    assert body["outputContexts"][0]["name"] == f"{session}/contexts/pilihjenjang-followup"
+
+
+def test_render_cached_supports_legacy_payload_without_placeholder():
+    legacy = json.dumps(strip_session(chip_response(SESSION))).encode()
+    response = render_cached(legacy, OTHER_SESSION)
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == chip_response(OTHER_SESSION)
+
+
+def test_response_without_contexts_round_trips():
+    response = {"fulfillmentText": "Halo"}
+    assert json.loads(render_cached(dump_cacheable(response), SESSION).body) == response
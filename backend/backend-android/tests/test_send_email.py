@@ -0,0 +1,78 @@
+import asyncio
+import smtplib
+from contextlib import contextmanager
+from email.mime.multipart import MIMEMultipart
+
+import pytest
+
+from send_email import background_task
+from send_email import send_email as mailer
+
+
+class FakePool:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.sent = 0
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    def sendmail(self, from_addr, to_addrs, payload):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent += 1
+
+
+def send(monkeypatch, errors):
+    pool = FakePool(errors)
+    monkeypatch.setattr(mailer, "get_pool", lambda *args, **kwargs: pool)
+    msg = MIMEMultipart()
+    msg["From"] = "noreply@example.com"
+    ok = mailer._send_with_retry(smtp_host="smtp", smtp_port=465, smtp_user="u", smtp_pass="p",
+                                 msg=msg, to_addrs=["guru@example.com"])
+    return ok, pool
+
+
+def test_disconnected_session_is_replaced_immediately(monkeypatch):
+    ok, pool = send(monkeypatch, [smtplib.SMTPServerDisconnected("stale")])
+    assert ok and pool.sent == 1
+
+
+def test_other_errors_return_false_without_retrying(monkeypatch):
+    ok, pool = send(monkeypatch, [smtplib.SMTPDataError(451, b"try later")])
+    assert not ok and pool.sent == 0 and pool.errors == []
+
+
+def test_background_fallback_retries_on_event_loop(monkeypatch):
+    attempts, sleeps = [], []
+
+    def sender(name, email, role):
+        attempts.append(email)
+        return len(attempts) == 3
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(background_task.asyncio, "sleep", fake_sleep)
+    asyncio.run(background_task._send_in_background(sender, "Guru", "guru@example.com", "guru"))
+    assert len(attempts) == 3
+    assert sleeps == [background_task.EMAIL_FALLBACK_BACKOFF, background_task.EMAIL_FALLBACK_BACKOFF * 2]
+
+
+def test_bulk_fallback_retries_only_failed_recipients(monkeypatch):
+    calls = []
+
+    def fake_bulk(kind, users):
+        calls.append([user["email"] for user in users])
+        return [{"status": "failed" if user["email"] == "ortu@example.com" and len(calls) == 1 else "sent"}
+                for user in users]
+
+    async def fake_sleep(delay):
+        pass
+
+    monkeypatch.setattr(background_task, "send_bulk_emails", fake_bulk)
+    monkeypatch.setattr(background_task.asyncio, "sleep", fake_sleep)
+    users = [{"email": "guru@example.com"}, {"email": "ortu@example.com"}]
+    asyncio.run(background_task._send_bulk_in_background("approve", users))
+    assert calls == [["guru@example.com", "ortu@example.com"], ["ortu@example.com"]]
@@ -0,0 +1,44 @@
+import importlib
+import sys
+import types
+
+import pytest
+
+
+@pytest.fixture
+def sync_runner(monkeypatch):
+    # sync_dialogflow membuat client Google saat diimpor; cukup ganti dengan stub
+    stub = types.ModuleType("chatbot.utils.sync_dialogflow")
+    stub.SYNC_FAILED = "failed"
+    stub.sync_all = lambda force=False: {}
+    monkeypatch.setitem(sys.modules, "chatbot.utils.sync_dialogflow", stub)
+    monkeypatch.delitem(sys.modules, "chatbot.services.sync_runner", raising=False)
+    module = importlib.import_module("chatbot.services.sync_runner")
+    yield module
+    sys.modules.pop("chatbot.services.sync_runner", None)
+
+
+def test_failed_targets_finds_nested_failures(sync_runner):
+    results = {
+        "SubjectName": "unchanged",
+        "LessonName": "failed",
+        "training_phrases": {"Pilih Subbab": "updated", "Pilih Teori Subbab #2": "failed"},
+    }
+    assert sync_runner.failed_targets(results) == ["LessonName", "training_phrases/Pilih Teori Subbab #2"]
+
+
+def test_failed_targets_whole_group_failed(sync_runner):
+    assert sync_runner.failed_targets({"training_phrases": "failed"}) == ["training_phrases"]
+
+
+def test_failed_targets_empty_when_all_ok(sync_runner):
+    assert sync_runner.failed_targets({"SubjectName": "created", "training_phrases": {"x": "deleted"}}) == []
+
+
+def test_run_with_failed_target_is_partial_and_not_skipped(sync_runner, monkeypatch):
+    import asyncio
+
+    monkeypatch.setattr(sync_runner, "redis_client", None)
+    monkeypatch.setattr(sync_runner, "sync_all", lambda force=False: {"LessonName": "failed"})
+    asyncio.run(sync_runner.run_sync())
+    assert sync_runner._local_status["status"] == sync_runner.STATUS_PARTIAL